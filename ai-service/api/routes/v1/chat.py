@@ -1,5 +1,8 @@
 from fastapi import APIRouter
-from handler.chat import ChatHandler, ChatResponse, ModelListResponse
+from handler.chat import (
+    ChatBatchResponse, ChatHandler, ChatJobStatus, ChatResponse,
+    ModelListResponse
+)
 
 
 class ChatRoute:
@@ -24,6 +27,43 @@ class ChatRoute:
             ),
         )
 
+        self.router.add_api_route(
+            path="/batch",
+            endpoint=self.handler.chat_batch,
+            methods=["POST"],
+            response_model=ChatBatchResponse,
+            summary="Batch chat completion",
+            description=(
+                "Runs up to N chat requests concurrently (bounded fan-out). "
+                "Per-item errors are reported in the item result and do not "
+                "fail the batch. With stream=true results are sent as NDJSON "
+                "in completion order."
+            ),
+        )
+
+        self.router.add_api_route(
+            path="/jobs",
+            endpoint=self.handler.submit_job,
+            methods=["POST"],
+            response_model=ChatJobStatus,
+            status_code=202,
+            summary="Submit asynchronous chat job",
+            description=(
+                "Queues a chat completion and returns its job id immediately. "
+                "Poll GET /jobs/{job_id} (long-poll with ?wait=) or pass a "
+                "callback_url to be notified."
+            ),
+        )
+
+        self.router.add_api_route(
+            path="/jobs/{job_id}",
+            endpoint=self.handler.get_job,
+            methods=["GET"],
+            response_model=ChatJobStatus,
+            summary="Get asynchronous chat job",
+            description="Returns the job state and, once finished, its result.",
+        )
+
         self.router.add_api_route(
             path="/models",
             endpoint=self.handler.get_models,
@@ -43,3 +83,16 @@ class ChatRoute:
                 "stream chat completion responses from the configured LLM provider."
             ),
         )
+
+        self.router.add_api_route(
+            path="/stream/{stream_id}",
+            endpoint=self.handler.resume_stream,
+            methods=["GET"],
+            summary="Resume a chat stream",
+            description=(
+                "Reconnect to a stream started with resumable=true. Frames "
+                "after the Last-Event-ID header (or the after query "
+                "parameter) are replayed, then the live generation is "
+                "followed until its final done event."
+            ),
+        )
@@ -35,3 +35,17 @@ class InternalRoute:
             methods=["POST"],
             summary="RAG Query with streaming response",
         )
+
+        self.router.add_api_route(
+            path="/stats",
+            endpoint=self.handler.stats,
+            methods=["GET"],
+            summary="Runtime statistics (connection pool, caches)",
+        )
+
+        self.router.add_api_route(
+            path="/router",
+            endpoint=self.handler.router_state,
+            methods=["GET"],
+            summary="Model router state (EWMA latency/TTFT, errors, load)",
+        )
@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+from handler.metrics import MetricsHandler
+
+
+class MetricsRoute:
+    router: APIRouter
+    handler: MetricsHandler
+
+    def __init__(self, handler: MetricsHandler):
+        self.router = APIRouter()
+        self.handler = handler
+
+        self.router.add_api_route(
+            path="/metrics",
+            endpoint=self.handler.metrics,
+            methods=["GET"],
+            include_in_schema=False,
+            summary="Prometheus metrics",
+        )
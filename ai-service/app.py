@@ -3,16 +3,28 @@ from typing import Callable
 
 from dotenv import load_dotenv
 import uvicorn
-from fastapi import FastAPI, Response
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.middleware.gzip import GZipMiddleware
 from loguru import logger
 
 from api.routes.v1.hello_world import HelloWorldRoute
 from api.routes.v1.chat import ChatRoute
+from api.routes.v1.metrics import MetricsRoute
 from handler.hello_world import HelloWorldHandler
 from handler.chat import ChatHandler
+from handler.metrics import MetricsHandler
+from middleware.compression import CompressionMiddleware
+from middleware.deadline import DeadlineMiddleware
+from middleware.metrics import MetricsMiddleware
 from utils.uts_scheduler import scheduler
+from services.llm_client import llm_client
+from services.model_registry import model_registry
+from services.summarizer import conversation_summarizer
+from services.job_queue import chat_job_queue
+from services.resumable_stream import resumable_streams
+from services.usage_recorder import usage_recorder
+from utils.loop_lag import loop_lag_monitor
 from core.settings import settings
 
 
@@ -39,11 +51,19 @@ class App:
         background scheduler when the FastAPI application starts.
         """
         async def start_app() -> None:
+            model_registry.load()
+            await llm_client.start()
+            conversation_summarizer.start()
+            usage_recorder.start()
+            # Admission control sheds load on its lag samples
+            if settings.metrics_enabled or settings.admission_enabled:
+                loop_lag_monitor.start()
 
             hello_world_handle = HelloWorldHandler()
             chat_handler = ChatHandler()
             hello_world_router = HelloWorldRoute(hello_world_handle)
             chat_router = ChatRoute(chat_handler)
+            chat_job_queue.start(chat_handler.run_job)
 
             # Internal routes (RAG, Doc Processing)
             from handler.internal import InternalHandler
@@ -68,6 +88,9 @@ class App:
                 prefix=prefix + "/internal",
                 tags=["Internal"]
             )
+            if settings.metrics_enabled:
+                metrics_router = MetricsRoute(MetricsHandler())
+                self.application.include_router(metrics_router.router)
             scheduler.start()
 
         return start_app
@@ -80,7 +103,14 @@ class App:
         """
         @logger.catch
         async def stop_app() -> None:
-            pass
+            await chat_job_queue.stop()
+            await resumable_streams.stop()
+            await conversation_summarizer.stop()
+            # After the producers above: flush the last usage records
+            await usage_recorder.stop()
+            if settings.metrics_enabled or settings.admission_enabled:
+                await loop_lag_monitor.stop()
+            await llm_client.aclose()
 
         return stop_app
 
@@ -91,11 +121,26 @@ class App:
         Sets up the FastAPI application, configures middleware, and registers
         startup and shutdown event handlers.
         """
-        self.application = FastAPI(**settings.fastapi_kwargs)
+        # orjson for every JSON response (ChatResponse, ModelListResponse, ...)
+        self.application = FastAPI(
+            default_response_class=ORJSONResponse, **settings.fastapi_kwargs
+        )
+
+        # Innermost: heartbeats and timeout frames go through compression
+        self.application.add_middleware(
+            DeadlineMiddleware,
+            default_budget=settings.deadline_default_budget,
+            route_budgets=settings.deadline_budgets,
+            idle_timeout=settings.stream_idle_timeout,
+            heartbeat_interval=settings.stream_heartbeat_interval,
+        )
 
+        # Streaming-aware: never holds back SSE frames
         self.application.add_middleware(
-            GZipMiddleware,
-            minimum_size=1000,  # Compress responses larger than 1KB
+            CompressionMiddleware,
+            minimum_size=settings.compression_minimum_size,
+            offload_size=settings.compression_offload_size,
+            stream_mode=settings.compression_stream_mode,
         )
 
         self.application.add_middleware(
@@ -106,24 +151,9 @@ class App:
             allow_headers=["*"],
         )
 
-        # Add timeout middleware to handle long-running requests
-        @self.application.middleware("http")
-        async def timeout_middleware(request, call_next):
-            import asyncio
-            try:
-                # Set a longer timeout for large responses (10 minutes)
-                response = await asyncio.wait_for(
-                    call_next(request),
-                    timeout=600.0
-                )
-                return response
-            except asyncio.TimeoutError:
-                logger.error(f"Request timeout: {request.url}")
-                return Response(
-                    content='{"detail": "Request timeout"}',
-                    status_code=504,
-                    media_type="application/json"
-                )
+        if settings.metrics_enabled:
+            # Added last = outermost, so latency includes the other middleware
+            self.application.add_middleware(MetricsMiddleware)
 
         self.application.add_event_handler("startup", self.on_init_app())
         self.application.add_event_handler("shutdown", self.on_terminate_app())
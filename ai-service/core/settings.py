@@ -3,6 +3,9 @@ from typing import Any, Dict, List, Optional
 from pydantic import Field, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+# Budget a job long-poll gets on top of its wait (seconds)
+JOB_WAIT_MARGIN = 15.0
+
 
 class AppEnvTypes(str, Enum):
     """Application environment types."""
@@ -46,6 +49,10 @@ class AppSettings(BaseAppSettings):
     pool_recycle: int = Field(
         default=600, ge=1, description="Database pool recycle time (seconds)"
     )
+    database_url: Optional[str] = Field(
+        default=None,
+        description="Postgres URL for usage accounting (unset = disabled)"
+    )
 
     # Redis Settings
     redis_host: str = Field(default="localhost", description="Redis host")
@@ -63,6 +70,436 @@ class AppSettings(BaseAppSettings):
         description="LiteLLM Proxy master key"
     )
 
+    # LiteLLM Proxy HTTP connection pool
+    llm_pool_max_connections: int = Field(
+        default=100, ge=1,
+        description="Max concurrent connections to the LiteLLM Proxy"
+    )
+    llm_pool_max_keepalive: int = Field(
+        default=20, ge=0,
+        description="Max idle keep-alive connections kept in the pool"
+    )
+    llm_pool_keepalive_expiry: float = Field(
+        default=30.0, gt=0,
+        description="Seconds an idle pooled connection is kept open"
+    )
+    llm_connect_timeout: float = Field(
+        default=5.0, gt=0,
+        description="Connect timeout to the LiteLLM Proxy (seconds)"
+    )
+    llm_request_timeout: float = Field(
+        default=600.0, gt=0,
+        description="Read/write timeout for LiteLLM Proxy calls (seconds)"
+    )
+    llm_http2: bool = Field(
+        default=True,
+        description="Use HTTP/2 to the proxy when the 'h2' package is installed"
+    )
+
+    # Exact-match completion cache (L1 in-process LRU, L2 Redis)
+    chat_cache_enabled: bool = Field(
+        default=True,
+        description="Cache deterministic (temperature=0) or opted-in chats"
+    )
+    chat_cache_max_entries: int = Field(
+        default=1024, ge=1, description="Max entries in the local cache"
+    )
+    chat_cache_max_bytes: int = Field(
+        default=32 * 1024 * 1024, ge=1,
+        description="Max total bytes of cached responses held locally"
+    )
+    chat_cache_ttl: int = Field(
+        default=3600, ge=1, description="Redis cache TTL (seconds)"
+    )
+
+    # Semantic response cache (embedding similarity per workspace)
+    semantic_cache_enabled: bool = Field(
+        default=False,
+        description="Serve cached replies for near-duplicate questions"
+    )
+    semantic_cache_threshold: float = Field(
+        default=0.95, gt=0.0, le=1.0,
+        description="Minimum cosine similarity for a semantic cache hit"
+    )
+    semantic_cache_ttl: int = Field(
+        default=3600, ge=1, description="Semantic cache entry TTL (seconds)"
+    )
+    # Memory bound: max_entries * max_workspaces * dim * 4 bytes
+    # (1024 * 64 * 1536 * 4 = 384 MiB; partitions only grow as they fill)
+    semantic_cache_max_entries: int = Field(
+        default=1024, ge=1,
+        description="Max cached embeddings per workspace"
+    )
+    semantic_cache_max_workspaces: int = Field(
+        default=64, ge=1,
+        description="Max workspaces kept in memory by the semantic cache"
+    )
+    embedding_model: str = Field(
+        default="text-embedding-3-small",
+        description="Embedding model alias configured in the LiteLLM Proxy"
+    )
+
+    # Single-flight coalescing of identical in-flight chat requests
+    single_flight_enabled: bool = Field(
+        default=True,
+        description="Share one upstream call among identical chat requests"
+    )
+    single_flight_distributed: bool = Field(
+        default=True,
+        description="Coalesce across replicas with a Redis lock + result key"
+    )
+    single_flight_lock_ttl: float = Field(
+        default=120.0, gt=0,
+        description="Redis leader lock TTL / max follower wait (seconds)"
+    )
+    single_flight_result_ttl: int = Field(
+        default=5, ge=1,
+        description="How long a leader's result stays readable for the "
+                    "followers that waited on it (seconds)"
+    )
+    single_flight_poll_interval: float = Field(
+        default=0.1, gt=0,
+        description="Follower poll interval for the leader result (seconds)"
+    )
+
+    # Model capability registry (litellm_config.yaml metadata)
+    model_registry_reload_interval: float = Field(
+        default=5.0, ge=0,
+        description="Seconds between config file change checks (0 = never)"
+    )
+
+    # Conversation token budgeting
+    default_context_window: int = Field(
+        default=128000, ge=1024,
+        description="Context window for models without config metadata"
+    )
+    context_reserve_tokens: int = Field(
+        default=256, ge=0,
+        description="Tokens kept free in the context besides max_tokens"
+    )
+
+    # Server-side conversation sessions
+    conversation_ttl: int = Field(
+        default=86400, ge=60,
+        description="Idle TTL of a stored conversation (seconds)"
+    )
+    conversation_max_messages: int = Field(
+        default=200, ge=2,
+        description="Max messages kept per stored conversation"
+    )
+
+    # Rolling conversation summaries (session mode)
+    summary_keep_recent_messages: int = Field(
+        default=6, ge=2,
+        description="Recent turns kept verbatim; older ones are summarized"
+    )
+    summary_min_batch: int = Field(
+        default=4, ge=1,
+        description="Min number of old turns before a summary job runs"
+    )
+    summary_max_pending: int = Field(
+        default=100, ge=1,
+        description="Max outstanding summarization jobs (extra are dropped)"
+    )
+    summary_workers: int = Field(
+        default=2, ge=1, description="Concurrent summarization workers"
+    )
+    summary_max_tokens: int = Field(
+        default=512, ge=64, description="Max tokens of a rolling summary"
+    )
+
+    # Batch chat endpoint
+    chat_batch_max_items: int = Field(
+        default=50, ge=1, description="Max items per /chat/batch request"
+    )
+    chat_batch_concurrency: int = Field(
+        default=8, ge=1,
+        description="Max batch items running upstream at the same time"
+    )
+
+    # Asynchronous chat jobs
+    chat_job_workers: int = Field(
+        default=4, ge=1, description="Chat job workers per replica"
+    )
+    chat_job_lease: float = Field(
+        default=60.0, gt=0,
+        description="Lease of a running job before it is requeued (seconds)"
+    )
+    chat_job_result_ttl: int = Field(
+        default=3600, ge=1, description="How long job results are kept"
+    )
+    chat_job_max_attempts: int = Field(
+        default=3, ge=1,
+        description="Attempts before an abandoned job is marked failed"
+    )
+    chat_job_poll_interval: float = Field(
+        default=0.25, gt=0, description="Long-poll check interval (seconds)"
+    )
+    chat_job_max_wait: float = Field(
+        default=60.0, gt=0,
+        description="Longest long-poll a job status request may ask for; "
+                    "its deadline budget follows (seconds)"
+    )
+    chat_job_callback_hosts: List[str] = Field(
+        default=["localhost", "127.0.0.1", "backend"],
+        description="Hosts allowed as job webhook callback targets"
+    )
+
+    # Streaming frame coalescing (chat_stream, rag_query)
+    stream_flush_max_latency_ms: float = Field(
+        default=40.0, ge=0,
+        description="Max time text may sit in the stream buffer (ms)"
+    )
+    stream_flush_max_bytes: int = Field(
+        default=512, ge=1,
+        description="Flush the stream buffer once it holds this many bytes"
+    )
+    stream_debug_logging: bool = Field(
+        default=False,
+        description="Log every upstream stream chunk (expensive)"
+    )
+
+    # Resumable SSE streams (chat_stream with resumable=true)
+    stream_resume_ttl: int = Field(
+        default=300, ge=1,
+        description="How long frames of a resumable stream are kept (seconds)"
+    )
+    stream_resume_max_frames: int = Field(
+        default=5000, ge=1,
+        description="Approximate cap on stored frames per resumable stream"
+    )
+    stream_resume_poll_interval: float = Field(
+        default=0.25, gt=0,
+        description="Poll interval when following a stream from Redis (seconds)"
+    )
+    stream_resume_idle_timeout: float = Field(
+        default=60.0, gt=0,
+        description="Stop following a stream after this long without frames"
+    )
+
+    # Hedged requests to the configured fallback model
+    hedge_enabled: bool = Field(
+        default=False,
+        description="Also ask the fallback model when the primary is slow"
+    )
+    hedge_quantile: float = Field(
+        default=0.9, gt=0.0, lt=1.0,
+        description="Hedge past this quantile of recent TTFT/latency"
+    )
+    hedge_min_samples: int = Field(
+        default=20, ge=1,
+        description="Recent samples a model needs before it is hedged"
+    )
+    hedge_min_delay: float = Field(
+        default=0.25, ge=0,
+        description="Never hedge earlier than this (seconds)"
+    )
+    hedge_budget_ratio: float = Field(
+        default=0.05, gt=0.0, le=1.0,
+        description="Max fraction of a route's requests that may be hedged"
+    )
+    hedge_budget_burst: float = Field(
+        default=5.0, ge=1.0,
+        description="Hedges a route may send in a burst"
+    )
+
+    # Client-side model router (tier -> model, power-of-two-choices)
+    router_enabled: bool = Field(
+        default=True,
+        description="Route tier requests by live latency/errors/load"
+    )
+    router_ewma_alpha: float = Field(
+        default=0.2, gt=0.0, le=1.0,
+        description="EWMA weight of the newest latency/error sample"
+    )
+    router_error_penalty: float = Field(
+        default=10.0, ge=0,
+        description="Cost multiplier per unit of error rate"
+    )
+    router_error_half_life: float = Field(
+        default=30.0, gt=0,
+        description="Half-life of a model's error rate (seconds)"
+    )
+    router_prior_latency: float = Field(
+        default=1.0, gt=0,
+        description="Assumed latency of models without samples (seconds)"
+    )
+    router_sticky_slack: float = Field(
+        default=1.5, ge=1.0,
+        description="Keep a workspace on its preferred model while its "
+                    "cost is within this factor of the cheapest one"
+    )
+
+    # Provider prompt caching (see services/prompt_layout.py)
+    prompt_cache_hints: bool = Field(
+        default=True,
+        description="Add cache-control breakpoints for models that need them"
+    )
+    prompt_cache_min_tokens: int = Field(
+        default=1024, ge=0,
+        description="Shortest stable prefix (tokens) worth a breakpoint "
+                    "unless the model's metadata sets cache_min_tokens"
+    )
+
+    # Per-model circuit breakers
+    circuit_breaker_enabled: bool = Field(
+        default=True,
+        description="Stop calling models that keep failing for a while"
+    )
+    circuit_breaker_failure_threshold: int = Field(
+        default=5, ge=1,
+        description="Consecutive failures/timeouts that open a circuit"
+    )
+    circuit_breaker_cooldown: float = Field(
+        default=30.0, gt=0,
+        description="Seconds an open circuit rejects calls before probing"
+    )
+    circuit_breaker_half_open_requests: int = Field(
+        default=1, ge=1,
+        description="Trial calls let through while a circuit is half-open"
+    )
+    circuit_breaker_shared: bool = Field(
+        default=False,
+        description="Share opened circuits across replicas through Redis"
+    )
+    circuit_breaker_sync_interval: float = Field(
+        default=1.0, gt=0,
+        description="Min seconds between Redis checks of a model's circuit"
+    )
+
+    # Admission control (concurrency limits, bounded queues, load shedding)
+    admission_enabled: bool = Field(
+        default=True,
+        description="Bound concurrent LLM calls and shed excess load"
+    )
+    admission_interactive_limit: int = Field(
+        default=64, ge=1,
+        description="Concurrent chat/stream/RAG calls"
+    )
+    admission_interactive_model_limit: int = Field(
+        default=32, ge=1,
+        description="Concurrent chat/stream/RAG calls per model"
+    )
+    admission_interactive_queue: int = Field(
+        default=256, ge=0,
+        description="Chat/stream/RAG calls allowed to wait for a slot"
+    )
+    admission_interactive_max_wait: float = Field(
+        default=5.0, gt=0,
+        description="Max seconds a chat/stream/RAG call waits for a slot"
+    )
+    admission_ingestion_limit: int = Field(
+        default=4, ge=1,
+        description="Concurrent document processing calls"
+    )
+    admission_ingestion_workspace_limit: int = Field(
+        default=2, ge=1,
+        description="Concurrent document processing calls per workspace"
+    )
+    admission_ingestion_queue: int = Field(
+        default=64, ge=0,
+        description="Document processing calls allowed to wait for a slot"
+    )
+    admission_ingestion_max_wait: float = Field(
+        default=30.0, gt=0,
+        description="Max seconds a document processing call waits for a slot"
+    )
+    admission_max_loop_lag: float = Field(
+        default=0.5, gt=0,
+        description="Shed new calls while event loop lag exceeds this (s)"
+    )
+
+    # Per-workspace / per-user rate limits (0 disables a limit)
+    rate_limit_enabled: bool = Field(
+        default=True,
+        description="Enforce request and token rate limits"
+    )
+    rate_limit_workspace_rpm: int = Field(
+        default=600, ge=0,
+        description="Requests per minute per workspace"
+    )
+    rate_limit_workspace_tpm: int = Field(
+        default=1_000_000, ge=0,
+        description="LLM tokens per minute per workspace"
+    )
+    rate_limit_user_rpm: int = Field(
+        default=60, ge=0,
+        description="Requests per minute per user"
+    )
+    rate_limit_user_tpm: int = Field(
+        default=200_000, ge=0,
+        description="LLM tokens per minute per user"
+    )
+    rate_limit_output_estimate: int = Field(
+        default=1024, ge=0,
+        description="Output tokens reserved when a call sets no max tokens"
+    )
+
+    # Token usage accounting (batched COPY into Postgres)
+    usage_buffer_size: int = Field(
+        default=10000, ge=1,
+        description="Usage records buffered before the oldest are dropped"
+    )
+    usage_batch_size: int = Field(
+        default=500, ge=1,
+        description="Usage records per COPY (also triggers an early flush)"
+    )
+    usage_flush_interval: float = Field(
+        default=5.0, gt=0,
+        description="Seconds between usage flushes"
+    )
+
+    # Response compression (see middleware/compression.py)
+    compression_minimum_size: int = Field(
+        default=1000, ge=0,
+        description="Smallest response body (bytes) that is compressed"
+    )
+    compression_offload_size: int = Field(
+        default=256 * 1024, ge=0,
+        description="Bodies from this size (bytes) are compressed in a "
+                    "worker thread"
+    )
+    compression_stream_mode: str = Field(
+        default="skip", pattern="^(skip|flush)$",
+        description="SSE/NDJSON responses: 'skip' (uncompressed) or "
+                    "'flush' (compressed, flushed after every frame)"
+    )
+
+    # Request deadlines (see middleware/deadline.py)
+    deadline_default_budget: float = Field(
+        default=600.0, gt=0,
+        description="Time a request may take end to end (seconds)"
+    )
+    deadline_route_budgets: Dict[str, float] = Field(
+        default={
+            "/api/v1/chat/models": 10.0,
+            "/api/v1/chat/stream": 1800.0,
+            "/api/v1/internal/stats": 10.0,
+            "/metrics": 10.0,
+        },
+        description="Budget per path prefix (longest match wins), seconds; "
+                    "job routes get chat_job_max_wait plus a margin"
+    )
+    stream_idle_timeout: float = Field(
+        default=120.0, ge=0,
+        description="Cut an SSE stream after this long without a frame "
+                    "from the handler (seconds, 0 = off)"
+    )
+    stream_heartbeat_interval: float = Field(
+        default=15.0, ge=0,
+        description="Keep-alive comment on SSE streams after this long "
+                    "without a frame (seconds, 0 = off)"
+    )
+
+    # Prometheus metrics
+    metrics_enabled: bool = Field(
+        default=True, description="Collect request metrics and serve /metrics"
+    )
+    loop_lag_interval: float = Field(
+        default=0.5, gt=0,
+        description="Event loop lag sampling interval (seconds)"
+    )
+
     # LiteLLM Provider-agnostic settings
     llm_provider: Optional[str] = Field(
         default=None,
@@ -247,6 +684,14 @@ class AppSettings(BaseAppSettings):
             return self.llm_api_version
         return self.openai_api_version
 
+    @property
+    def deadline_budgets(self) -> Dict[str, float]:
+        """Route budgets, job long-polls included (derived from their wait)."""
+        return {
+            **self.deadline_route_budgets,
+            "/api/v1/chat/jobs": self.chat_job_max_wait + JOB_WAIT_MARGIN,
+        }
+
     @property
     def fastapi_kwargs(self) -> Dict[str, Any]:
         """Get FastAPI initialization kwargs."""
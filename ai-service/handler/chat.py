@@ -1,11 +1,54 @@
-from typing import Any, AsyncIterator, Dict, List, Literal, Optional
+import asyncio
+import math
+import time
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional, Tuple
 
-from fastapi import HTTPException
+from fastapi import Header, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
 
 from loguru import logger
 from pydantic import BaseModel, Field, model_validator
 from core.settings import settings
+from services.llm_client import llm_client
+from services.response_cache import completion_cache
+from services.semantic_cache import context_key, semantic_cache
+from services.single_flight import chat_single_flight
+from services import llm_metrics, prompt_layout, stream_metrics, token_budget
+from services.admission import admitted, interactive_pool
+from services.circuit_breaker import CircuitOpenError, circuit_breakers
+from services.rate_limiter import rate_limiter
+from services.usage_recorder import usage_recorder
+from services.hedging import chat_hedger
+from services.model_registry import ModelCapabilities, model_registry
+from services.model_router import model_router
+from services.conversation_store import Conversation, conversation_store
+from services.summarizer import conversation_summarizer
+from services.job_queue import chat_job_queue
+from services.resumable_stream import resumable_streams
+from services.stream_writer import (
+    FlushPolicy, StreamAbandoned, StreamWriter, close_upstream, parse_chunk,
+    watch_disconnect, with_deadlines
+)
+from services.sse import (
+    DONE_EVENT, SSEResponse, content_event, error_event, thought_event,
+    with_id
+)
+from services.stream_metrics import StreamTimer, format_summary
+from utils.metrics import Counter
+
+_SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",  # Disable nginx buffering
+    "Transfer-Encoding": "chunked",  # Explicit chunked encoding
+    "X-Content-Type-Options": "nosniff",
+}
+
+MODEL_LIST_LOOKUPS = Counter(
+    "model_list_lookups_total",
+    "get_models lookups by whether the model list was rebuilt",
+    ["tier"],
+)
 
 
 class ChatMessage(BaseModel):
@@ -42,6 +85,46 @@ class ChatRequest(BaseModel):
             "'azure/gpt-5-nano', 'gemini/gemini-3-flash-preview')"
         )
     )
+    conversation_id: Optional[str] = Field(
+        default=None,
+        description=(
+            "Continue a server-side conversation: send only the new "
+            "turn(s) in messages"
+        )
+    )
+    start_conversation: bool = Field(
+        default=False,
+        description=(
+            "Start a server-side conversation; the response carries "
+            "its conversation_id"
+        )
+    )
+    workspace_id: Optional[str] = Field(
+        default=None,
+        description=(
+            "Workspace the request belongs to (cache partitioning, "
+            "rate limits)"
+        )
+    )
+    user_id: Optional[str] = Field(
+        default=None,
+        description="User the request belongs to (rate limits)"
+    )
+    use_cache: Optional[bool] = Field(
+        default=None,
+        description=(
+            "Response cache behaviour: null = cache only deterministic "
+            "requests (temperature=0), true = opt in, false = bypass"
+        )
+    )
+    resumable: bool = Field(
+        default=False,
+        description=(
+            "Stream only: generate in the background and number frames so "
+            "a dropped client can reconnect to /chat/stream/{stream_id} "
+            "with Last-Event-ID"
+        )
+    )
 
     @model_validator(mode="after")
     def validate_messages(self) -> "ChatRequest":
@@ -61,6 +144,71 @@ class ChatResponse(BaseModel):
         default=None,
         description="Model reasoning/thought process"
     )
+    conversation_id: Optional[str] = Field(
+        default=None,
+        description="Server-side conversation id (session mode only)"
+    )
+    total_tokens: Optional[int] = Field(
+        default=None,
+        description="Tokens used by the upstream call (prompt + completion)"
+    )
+
+
+class ChatBatchRequest(BaseModel):
+    """Batch of chat completion requests."""
+
+    items: List[ChatRequest] = Field(
+        min_length=1,
+        max_length=settings.chat_batch_max_items,
+        description="Chat requests to run concurrently"
+    )
+    stream: bool = Field(
+        default=False,
+        description=(
+            "Stream results as NDJSON in completion order instead of "
+            "returning them all in request order"
+        )
+    )
+
+
+class ChatBatchItemResult(BaseModel):
+    """Outcome of one item of a batch."""
+
+    index: int
+    status_code: int
+    response: Optional[ChatResponse] = None
+    error: Optional[str] = None
+
+
+class ChatBatchResponse(BaseModel):
+    """Batch results, in request order."""
+
+    results: List[ChatBatchItemResult]
+
+
+class ChatJobRequest(ChatRequest):
+    """Chat request to run as an asynchronous job."""
+
+    callback_url: Optional[str] = Field(
+        default=None,
+        description=(
+            "Optional webhook (internal hosts only) that receives the "
+            "finished job as JSON"
+        )
+    )
+
+
+class ChatJobStatus(BaseModel):
+    """State of an asynchronous chat job."""
+
+    job_id: str
+    status: Literal["queued", "running", "succeeded", "failed"]
+    created_at: Optional[float] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[ChatResponse] = None
+    error: Optional[str] = None
+    status_code: Optional[int] = None
 
 
 class ModelInfo(BaseModel):
@@ -69,6 +217,10 @@ class ModelInfo(BaseModel):
     full_name: str  # The real model ID (azure/gpt-5-nano, etc.)
     provider: str
     supports_thinking: bool = False
+    tiers: List[str] = Field(
+        default_factory=list,
+        description="Model tiers (default/smart/fast) this model serves"
+    )
 
 
 class ModelListResponse(BaseModel):
@@ -80,37 +232,22 @@ class ChatHandler:
     """Handle chat completion requests."""
 
     _default_system_prompt = "You are a helpful assistant."
-    _max_history_messages = 6  # Keep last N messages (reduced for safety)
-    _max_message_length = 1500  # Max chars per message (reduced)
 
     def __init__(self) -> None:
         """Initialize ChatHandler with LiteLLM configuration."""
-        import litellm
-
-        # Configure LiteLLM to send requests to our Proxy (LiteLLM Proxy)
-        # Using centralized settings
+        # Requests go to our LiteLLM Proxy through the shared, pooled
+        # client owned by the app lifecycle (see services.llm_client)
         self.api_base = settings.litellm_proxy_url
         self.api_key = settings.litellm_master_key
 
-        # Globally set litellm params to avoid per-call overhead
-        litellm.api_base = self.api_base
-        litellm.api_key = self.api_key
-
-        # Hybrid Caching settings
-        self._cached_models = None
-        self._last_model_refresh = 0
-        self._cache_ttl = 60  # L1 TTL: 60 seconds
+        # Model list, rebuilt when the capability registry reloads
+        self._cached_models: Optional[ModelListResponse] = None
+        self._models_version = -1
 
-        # Redis Connection (L2 Cache)
-        import redis
-        self.redis_client = redis.Redis(
-            host=settings.redis_host,
-            port=settings.redis_port,
-            decode_responses=True,
-            socket_timeout=2.0
+        # Bounds concurrent upstream calls fanned out by batch requests
+        self._batch_semaphore = asyncio.Semaphore(
+            settings.chat_batch_concurrency
         )
-        self.REDIS_CACHE_KEY = "ai-service:model-list"
-        self.REDIS_TTL = 300  # L2 TTL: 300 seconds
 
         logger.info(
             f"ChatHandler initialized using LiteLLM Proxy at: {self.api_base}"
@@ -119,92 +256,164 @@ class ChatHandler:
     @staticmethod
     def _truncate_conversation_history(
         messages: List[ChatMessage],
-        max_messages: int = None,
-        max_message_length: int = None
-    ) -> List[ChatMessage]:
+        model: str,
+        max_tokens: Optional[int],
+        token_counts: Optional[List[int]] = None,
+    ) -> tuple[List[ChatMessage], int]:
         """
-        Truncate conversation history to prevent token limit issues.
+        Truncate conversation history to the model's token budget.
 
         Strategy:
-        1. Keep all system messages
-        2. Keep the most recent N messages (user + assistant pairs)
-        3. Truncate individual messages if too long
+        1. Keep all system messages and the last user message
+        2. Keep the most recent messages that fit
+           ``context_window - max_tokens - reserve`` (see token_budget),
+           counting the default system prompt if it will be added
+        3. Cut the last user message if it alone does not fit
 
         Args:
             messages: List of chat messages
-            max_messages: Maximum number of non-system messages to keep
-            max_message_length: Maximum characters per message
+            model: Requested model alias
+            max_tokens: Tokens reserved for the completion
+            token_counts: Known per-message token counts (sessions)
 
         Returns:
-            Truncated list of messages
+            Tuple of (truncated list of messages, prompt token count)
         """
-        if max_messages is None:
-            max_messages = ChatHandler._max_history_messages
-        if max_message_length is None:
-            max_message_length = ChatHandler._max_message_length
-
-        if len(messages) <= max_messages:
-            # No truncation needed, but still truncate long messages
-            truncated = []
-            for msg in messages:
-                content = msg.content
-                if len(content) > max_message_length:
-                    content = content[:max_message_length] + "..."
-                truncated.append(
-                    ChatMessage(role=msg.role, content=content)
-                )
-            return truncated
+        fixed_tokens = 0
+        if prompt_layout.adds_default_system(
+            [{"role": m.role, "content": m.content} for m in messages]
+        ):
+            fixed_tokens = token_budget.message_tokens(
+                ChatHandler._default_system_prompt, model
+            )
+        result, prompt_tokens = token_budget.fit_messages(
+            messages, model, max_tokens, token_counts, fixed_tokens
+        )
 
-        # Separate system messages from conversation
-        system_messages = [msg for msg in messages if msg.role == "system"]
-        conversation_messages = [
-            msg for msg in messages if msg.role != "system"
-        ]
+        if result is not messages:
+            logger.debug(
+                f"Truncated conversation: {len(messages)} -> {len(result)} "
+                f"messages, prompt_tokens={prompt_tokens}, "
+                f"budget={token_budget.prompt_budget(model, max_tokens)}"
+            )
+
+        return result, prompt_tokens
+
+    def _fit_payload(
+        self,
+        payload: ChatRequest,
+        token_counts: Optional[List[int]] = None,
+    ) -> tuple[ChatRequest, int]:
+        """Resolve max tokens and fit history into the model's context.
+
+        Returns the (possibly truncated) payload and its prompt token count.
+        """
+        model = payload.model or "azure/gpt-5-nano"
+        self._resolve_max_tokens(model_registry.get(model), payload)
 
-        # Keep most recent N conversation messages
-        recent_messages = conversation_messages[-max_messages:]
-
-        # Truncate long messages
-        truncated = []
-        for msg in recent_messages:
-            content = msg.content
-            if len(content) > max_message_length:
-                content = content[:max_message_length] + "..."
-            truncated.append(
-                ChatMessage(role=msg.role, content=content)
+        truncated_messages, prompt_tokens = (
+            self._truncate_conversation_history(
+                payload.messages, model, payload.max_completion_tokens,
+                token_counts
             )
+        )
+        if truncated_messages is not payload.messages:
+            logger.info(
+                f"Truncated conversation history: "
+                f"{len(payload.messages)} -> {len(truncated_messages)} "
+                f"messages"
+            )
+            # Copy keeps every other field (model, cache flags, ...)
+            payload = payload.model_copy(
+                update={"messages": truncated_messages}
+            )
+        return payload, prompt_tokens
 
-        # Prepend system messages
-        result = system_messages + truncated
+    @staticmethod
+    async def _resume_conversation(
+        payload: ChatRequest,
+    ) -> tuple[ChatRequest, Optional[Conversation], Optional[List[int]]]:
+        """Expand a session request into the full stored history.
+
+        The new turn is appended to the conversation (token counts are
+        computed once, here); it is persisted only after a reply. Returns
+        the payload, the conversation and per-message token counts.
+        """
+        if payload.conversation_id is None and not payload.start_conversation:
+            return payload, None, None
 
-        logger.debug(
-            f"Truncated conversation: {len(messages)} -> {len(result)} "
-            f"messages (kept {len(system_messages)} system, "
-            f"{len(recent_messages)} recent)"
+        model = payload.model or "azure/gpt-5-nano"
+        if payload.conversation_id is not None:
+            try:
+                conversation = await conversation_store.get(
+                    payload.conversation_id
+                )
+            except Exception as re:
+                logger.error(f"Conversation store unavailable: {re}")
+                raise HTTPException(
+                    status_code=503,
+                    detail="Conversation store unavailable"
+                ) from re
+            if conversation is None:
+                raise HTTPException(
+                    status_code=404,
+                    detail="Conversation not found or expired"
+                )
+            conversation.retokenize(model)
+            conversation.workspace_id = (
+                conversation.workspace_id or payload.workspace_id
+            )
+            conversation.user_id = conversation.user_id or payload.user_id
+        else:
+            conversation = conversation_store.create(
+                model, payload.workspace_id, payload.user_id
+            )
+
+        for msg in payload.messages:
+            conversation.append(msg.role, msg.content)
+
+        entries = conversation.history()
+        history = [
+            ChatMessage.model_construct(role=role, content=content)
+            for role, content, _ in entries
+        ]
+        return (
+            payload.model_copy(update={"messages": history}),
+            conversation,
+            [tokens for _, _, tokens in entries],
         )
 
-        return result
+    @staticmethod
+    async def _record_reply(
+        conversation: Optional[Conversation], reply: str
+    ) -> None:
+        """Append the turn and the assistant reply to the stored history."""
+        if conversation is None:
+            return
+        if reply:
+            conversation.append("assistant", reply)
+        try:
+            stored = await conversation_store.append_turns(conversation)
+        except Exception as re:
+            logger.error(
+                f"Failed to save conversation {conversation.id}: {re}"
+            )
+            return
+        # Fold old turns into the rolling summary in the background
+        conversation_summarizer.maybe_schedule(stored)
 
     @staticmethod
     def _to_openai_messages(
         messages: List[ChatMessage]
-    ) -> List[Dict[str, str]]:
-        """Convert ChatMessage list to OpenAI-compatible message format."""
-        has_system = any(msg.role == "system" for msg in messages)
-        converted: List[Dict[str, str]] = []
-
-        if not has_system:
-            converted.append({
-                "role": "system",
-                "content": ChatHandler._default_system_prompt
-            })
-
-        for msg in messages:
-            converted.append({
-                "role": msg.role,
-                "content": msg.content
-            })
-        return converted
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """OpenAI-format messages, stable prefix first (prompt caching).
+
+        Returns the messages and the length of the stable prefix.
+        """
+        return prompt_layout.layout_chat(
+            [{"role": msg.role, "content": msg.content} for msg in messages],
+            ChatHandler._default_system_prompt,
+        )
 
     @staticmethod
     def _extract_response_metadata(response: Any) -> Dict[str, Any]:
@@ -234,266 +443,397 @@ class ChatHandler:
         }
 
     async def get_models(self) -> ModelListResponse:
-        """
-        Get list of available models with provider info using Hybrid Caching.
-        L1: Local Memory -> L2: Redis -> L3: YAML Config
-        """
-        import yaml
-        import os
-        import time
-        import json
-
-        current_time = time.time()
+        """List the configured models from the capability registry.
 
-        # --- Level 1: Local Memory Cache ---
-        if self._cached_models and (
-            current_time - self._last_model_refresh < self._cache_ttl
+        The response is rebuilt only when the registry reloaded.
+        """
+        models = model_registry.models()
+        if (
+            self._cached_models is not None
+            and self._models_version == model_registry.version
         ):
-            logger.debug("L1 Cache Hit: Returning local memory cache")
+            MODEL_LIST_LOOKUPS.labels("cached").inc()
             return self._cached_models
 
-        # --- Level 2: Redis Cache ---
-        try:
-            cached_data = self.redis_client.get(self.REDIS_CACHE_KEY)
-            if cached_data:
-                logger.debug("L2 Cache Hit: Returning Redis cache")
-                models_data = json.loads(cached_data)
-                response = ModelListResponse(
-                    models=[ModelInfo(**m) for m in models_data]
-                )
-
-                # Update L1 Cache
-                self._cached_models = response
-                self._last_model_refresh = current_time
-                return response
-        except Exception as re:
-            logger.warning(
-                f"Redis L2 cache access failed: {re}. Falling back to L3."
+        MODEL_LIST_LOOKUPS.labels("registry").inc()
+        model_infos = [
+            ModelInfo(
+                name=caps.name,
+                full_name=caps.full_name,
+                provider=caps.provider,
+                supports_thinking=caps.supports_thinking,
+                tiers=caps.tiers,
             )
-
-        # --- Level 3: YAML Config (File I/O) ---
-        logger.info("L1/L2 Cache Miss: Refreshing model list from YAML config")
-        config_path = os.getenv("LITELLM_CONFIG_PATH", "litellm_config.yaml")
-        model_infos = []
-        seen_names = set()
-
-        try:
-            if os.path.exists(config_path):
-                with open(config_path, "r") as f:
-                    config = yaml.safe_load(f)
-                    model_list = config.get("model_list", [])
-                    for m in model_list:
-                        name = m.get("model_name")
-                        if name and name not in seen_names:
-                            litellm_params = m.get("litellm_params", {})
-                            model_str = litellm_params.get("model", "")
-                            provider = "unknown"
-
-                            if "/" in model_str:
-                                raw_provider = model_str.split("/")[0].lower()
-                                provider_map = {
-                                    "azure": "Azure OpenAI (GPT)",
-                                    "gemini": "Google Gemini",
-                                    "openai": "OpenAI",
-                                    "anthropic": "Anthropic Claude",
-                                    "vertex_ai": "Google Vertex AI"
-                                }
-                                provider = provider_map.get(
-                                    raw_provider, raw_provider.capitalize()
-                                )
-
-                            metadata = m.get("metadata", {})
-                            supports_thinking = metadata.get(
-                                "supports_thinking", False
-                            )
-
-                            model_infos.append(ModelInfo(
-                                name=name,
-                                full_name=model_str,
-                                provider=provider,
-                                supports_thinking=supports_thinking
-                            ))
-                            seen_names.add(name)
-
-            # Fallback if config is empty
-            if not model_infos:
-                model_infos = [
-                    ModelInfo(
-                        name="azure/gpt-5-nano",
-                        full_name="azure/gpt-5-nano",
-                        provider="Azure OpenAI (GPT)",
-                        supports_thinking=False
-                    ),
-                    ModelInfo(
-                        name="gemini/gemini-3-flash-preview",
-                        full_name="gemini/gemini-3-flash-preview",
-                        provider="Google Gemini",
-                        supports_thinking=False
-                    )
-                ]
-
-            response = ModelListResponse(models=model_infos)
-
-            # --- Update L1 and L2 Caches ---
-            self._cached_models = response
-            self._last_model_refresh = current_time
-
-            try:
-                # Store in Redis with TTL
-                serialized_data = json.dumps([m.dict() for m in model_infos])
-                self.redis_client.setex(
-                    self.REDIS_CACHE_KEY, self.REDIS_TTL, serialized_data
-                )
-                logger.debug(
-                    "Successfully updated L2 cache (Redis) with "
-                    f"{len(model_infos)} models"
+            for caps in models
+        ]
+        # Fallback if config is empty
+        if not model_infos:
+            model_infos = [
+                ModelInfo(
+                    name="azure/gpt-5-nano",
+                    full_name="azure/gpt-5-nano",
+                    provider="Azure OpenAI (GPT)",
+                    supports_thinking=False
+                ),
+                ModelInfo(
+                    name="gemini/gemini-3-flash-preview",
+                    full_name="gemini/gemini-3-flash-preview",
+                    provider="Google Gemini",
+                    supports_thinking=False
                 )
-            except Exception as re:
-                logger.warning(f"Failed to update Redis L2 cache: {re}")
+            ]
 
-            logger.info(f"Model list refreshed: {len(model_infos)} models")
-            return response
+        self._cached_models = ModelListResponse(models=model_infos)
+        self._models_version = model_registry.version
+        logger.info(f"Model list refreshed: {len(model_infos)} models")
+        return self._cached_models
 
-        except Exception as e:
-            logger.error(f"Failed to load model list from YAML: {e}")
-            return ModelListResponse(
-                models=[
-                    ModelInfo(
-                        name="error",
-                        full_name="error",
-                        provider=str(e),
-                        supports_thinking=False
-                    )
-                ]
+    @staticmethod
+    def _resolve_max_tokens(
+        caps: ModelCapabilities, payload: ChatRequest
+    ) -> None:
+        """Boost max tokens for reasoning models, clamp to model limit."""
+        # Reasoning models need much more tokens as it includes thinking
+        # process. Don't override if user explicitly set a higher value.
+        min_output = caps.min_output_tokens()
+        if min_output and (payload.max_completion_tokens or 0) < min_output:
+            logger.info(
+                f"Boosting max_completion_tokens for model: {caps.name}"
             )
+            payload.max_completion_tokens = min_output
+
+        model_limit = caps.max_output_tokens
+        if model_limit and (payload.max_completion_tokens or 0) > model_limit:
+            payload.max_completion_tokens = model_limit
 
     def _adapt_payload(
         self, model: str, payload: ChatRequest
     ) -> Dict[str, Any]:
         """Adapt payload based on model capabilities."""
-        is_thinking = (
-            "reasoner" in model or "thinking" in model or
-            "o1" in model or "o3" in model
-        )
+        caps = model_registry.get(model)
+
         # 1. Manage Max Tokens
-        # Reasoning models need much more tokens as it includes thinking
-        # process
-        if is_thinking and (
-            payload.max_completion_tokens is None or
-            payload.max_completion_tokens < 16384
-        ):
-            # Don't override if user explicitly set a very high value
-            logger.info(
-                f"Boosting max_completion_tokens for model: {model}"
-            )
-            payload.max_completion_tokens = 16384
+        self._resolve_max_tokens(caps, payload)
 
         # 2. Extract OpenAI messages
-        openai_messages = self._to_openai_messages(payload.messages)
-
-        # 3. Handle O1/O3 role limitations
-        # OpenAI O1/O3 models don't support 'system' role in the usual way
-        if "o1-" in model or "o3-" in model:
-            logger.debug(f"Adapting roles for OpenAI reasoning model: {model}")
-            new_messages = []
-            for msg in openai_messages:
-                if msg["role"] == "system":
-                    # Convert system to 'developer' if supported or 'user'
-                    # with prefix. LiteLLM handles 'developer' role for
-                    # O1 usually, but some environments still prefer
-                    # converting to user.
-                    new_messages.append({
-                        "role": "user",
-                        "content": f"[SYSTEM INSTRUCTION]\n{msg['content']}"
-                    })
-                else:
-                    new_messages.append(msg)
-            openai_messages = new_messages
+        openai_messages, prefix_len = self._to_openai_messages(
+            payload.messages
+        )
+
+        # 3. Models without the system role (OpenAI o1/o3) get system
+        # instructions as prefixed user messages
+        openai_messages = caps.transform_messages(openai_messages)
+
+        # 4. Cache breakpoint after the stable prefix (if the model needs one)
+        openai_messages = prompt_layout.apply_cache_control(
+            openai_messages, model, prefix_len
+        )
 
         return {
             "model": f"openai/{model}",  # Always route via proxy
             "messages": openai_messages,
             "temperature": payload.temperature,
             "max_tokens": payload.max_completion_tokens,
-            "api_base": self.api_base,
-            "api_key": self.api_key
+            **llm_client.completion_kwargs(),
         }
 
-    def _extract_content_from_chunk(
-        self, chunk: Any
-    ) -> tuple[str, Optional[str]]:
-        """Extract content and reasoning from a LiteLLM stream chunk."""
-        content = ""
-        reasoning = None
-
-        # LiteLLM returns chunks in OpenAI format
-        if hasattr(chunk, "choices") and chunk.choices:
-            delta = getattr(chunk.choices[0], "delta", None)
-            if delta:
-                if (
-                    hasattr(delta, "reasoning_content") and
-                    delta.reasoning_content
-                ):
-                    reasoning = delta.reasoning_content
-
-                if hasattr(delta, "content") and delta.content:
-                    content = delta.content
-                elif hasattr(delta, "text") and delta.text:
-                    content = delta.text
-        elif hasattr(chunk, "reasoning_content") and chunk.reasoning_content:
-            reasoning = chunk.reasoning_content
-        elif hasattr(chunk, "content"):
-            content = chunk.content or ""
-        elif hasattr(chunk, "text"):
-            content = chunk.text or ""
-        elif isinstance(chunk, str):
-            content = chunk
-        elif isinstance(chunk, dict):
-            # Handle dict format chunks
-            if "choices" in chunk and chunk["choices"]:
-                delta = chunk["choices"][0].get("delta", {})
-                content = delta.get("content", "") or delta.get("text", "")
-                reasoning = delta.get("reasoning_content")
-            elif "content" in chunk:
-                content = chunk["content"] or ""
-        return content, reasoning
-
     async def chat(self, payload: ChatRequest) -> ChatResponse:
         """Process chat completion request."""
-        # Truncate conversation history if needed
-        original_count = len(payload.messages)
-        truncated_messages = self._truncate_conversation_history(
-            payload.messages
+        # Session mode: rebuild history from the conversation store
+        payload, conversation, token_counts = (
+            await self._resume_conversation(payload)
+        )
+
+        # Fit conversation history into the model's token budget
+        payload, input_tokens = self._fit_payload(payload, token_counts)
+
+        # Fail fast (or use the fallback) while the model's circuit is open
+        payload = await self._avoid_open_circuit(payload)
+
+        # Use adaptive logic to prepare request
+        requested_model = payload.model or "azure/gpt-5-nano"
+        completion_kwargs = self._adapt_payload(requested_model, payload)
+
+        cacheable = self._is_cacheable(payload)
+        cache_key = None
+        if cacheable and settings.chat_cache_enabled:
+            cache_key = completion_cache.make_key(completion_kwargs)
+            cached, tier = await completion_cache.get(cache_key)
+            if cached is not None:
+                logger.debug(f"Completion cache {tier} hit")
+                return await self._session_response(cached, conversation)
+
+        semantic_vector = None
+        semantic_ctx = 0
+        if cacheable and semantic_cache.enabled:
+            semantic_vector, semantic_ctx, cached = (
+                await self._semantic_lookup(completion_kwargs, payload)
+            )
+            if cached is not None:
+                return await self._session_response(cached, conversation)
+
+        async def complete() -> Dict[str, Any]:
+            async with interactive_pool.admit(requested_model):
+                result = await self._complete_hedged(
+                    completion_kwargs, payload
+                )
+            data = result.model_dump()
+            if cache_key is not None:
+                await completion_cache.set(cache_key, data)
+            if semantic_vector is not None:
+                await semantic_cache.store(
+                    payload.workspace_id or "global",
+                    semantic_ctx,
+                    semantic_vector,
+                    data,
+                )
+            return data
+
+        # Workspace/user request and token limits (cache hits are free)
+        reservation = await rate_limiter.acquire(
+            payload.workspace_id, payload.user_id,
+            rate_limiter.estimate(input_tokens, payload.max_completion_tokens),
+        )
+        data: Dict[str, Any] = {}
+        try:
+            if not (settings.single_flight_enabled and cacheable):
+                # Sampled or cache-bypassing requests get their own answer
+                data = await complete()
+            else:
+                # Identical concurrent requests share a single upstream call
+                flight_key = (
+                    cache_key or completion_cache.make_key(completion_kwargs)
+                )
+                data = await chat_single_flight.do(flight_key, complete)
+        finally:
+            # Replace the estimate with the usage the provider reported
+            await asyncio.shield(reservation.reconcile(
+                data.get("total_tokens") or input_tokens
+            ))
+        return await self._session_response(data, conversation)
+
+    async def _session_response(
+        self, data: Dict[str, Any], conversation: Optional[Conversation]
+    ) -> ChatResponse:
+        """Build the response, recording the turn in session mode."""
+        response = ChatResponse(**data)
+        if conversation is not None:
+            await self._record_reply(conversation, response.reply)
+            response.conversation_id = conversation.id
+        return response
+
+    @staticmethod
+    async def _semantic_lookup(
+        completion_kwargs: Dict[str, Any], payload: ChatRequest
+    ) -> tuple:
+        """Embed the final user message and search the semantic cache.
+
+        Returns (embedding, context key, cached response or None).
+        """
+        messages = completion_kwargs["messages"]
+        last_user = max(
+            i for i, m in enumerate(messages) if m["role"] == "user"
+        )
+        ctx = context_key(
+            completion_kwargs["model"],
+            completion_kwargs["max_tokens"],
+            messages[:last_user],
         )
+        vector = await semantic_cache.embed(messages[last_user]["content"])
+        if vector is None:
+            return None, ctx, None
+        cached = await semantic_cache.lookup(
+            payload.workspace_id or "global", ctx, vector
+        )
+        return vector, ctx, cached
 
-        if len(truncated_messages) < original_count:
+    @staticmethod
+    def _is_cacheable(payload: ChatRequest) -> bool:
+        """Cache deterministic requests, or any request that opts in."""
+        if payload.use_cache is not None:
+            return payload.use_cache
+        return payload.temperature == 0
+
+    def _fallback_payload(
+        self, payload: ChatRequest, fallback: str
+    ) -> ChatRequest:
+        """Payload for ``fallback``, fitted to its limits.
+
+        The output limit is re-resolved and the history (fitted to the
+        primary model) is fitted again to the fallback's context window.
+
+        Raises:
+            ContextOverflow: The prompt cannot fit the fallback's context
+        """
+        fallback_payload = payload.model_copy(update={"model": fallback})
+        self._resolve_max_tokens(
+            model_registry.get(fallback), fallback_payload
+        )
+        messages, _ = self._truncate_conversation_history(
+            payload.messages, fallback,
+            fallback_payload.max_completion_tokens,
+        )
+        if messages is not payload.messages:
             logger.info(
-                f"Truncated conversation history: "
-                f"{original_count} -> {len(truncated_messages)} messages"
+                f"Refitted history for fallback {fallback}: "
+                f"{len(payload.messages)} -> {len(messages)} messages"
             )
-            # Create new payload with truncated messages
-            payload = ChatRequest(
-                messages=truncated_messages,
-                temperature=payload.temperature,
-                max_completion_tokens=payload.max_completion_tokens,
+            fallback_payload.messages = messages
+        return fallback_payload
+
+    @staticmethod
+    def _circuit_open(exc: CircuitOpenError) -> HTTPException:
+        return HTTPException(
+            status_code=503,
+            detail=f"Model {exc.model} is temporarily unavailable",
+            headers={"Retry-After": str(math.ceil(exc.retry_after))},
+        )
+
+    async def _avoid_open_circuit(self, payload: ChatRequest) -> ChatRequest:
+        """Reroute to the fallback model while the model's circuit is open.
+
+        Raises 503 with Retry-After when there is no usable fallback.
+        """
+        model = payload.model or "azure/gpt-5-nano"
+        retry_after = await circuit_breakers.check(model)
+        if retry_after is None:
+            return payload
+        fallback = chat_hedger.fallback_for(model)
+        if (
+            fallback is not None and fallback != model
+            and await circuit_breakers.check(fallback) is None
+        ):
+            try:
+                fallback_payload = self._fallback_payload(payload, fallback)
+            except token_budget.ContextOverflow:
+                logger.warning(
+                    f"Circuit open for {model}, prompt does not fit "
+                    f"fallback {fallback}"
+                )
+            else:
+                logger.warning(
+                    f"Circuit open for {model}, rerouting to {fallback}"
+                )
+                return fallback_payload
+        raise self._circuit_open(CircuitOpenError(model, retry_after))
+
+    def _hedge_payload(
+        self, payload: ChatRequest, plan: Optional[Tuple[str, float]]
+    ) -> Optional[ChatRequest]:
+        """Fallback payload of a hedge plan, None if there is no hedge.
+
+        A prompt that cannot fit the fallback's context is not hedged:
+        the call could only fail and count against the fallback.
+        """
+        if plan is None:
+            return None
+        try:
+            return self._fallback_payload(payload, plan[0])
+        except token_budget.ContextOverflow:
+            logger.debug(f"Not hedging: prompt does not fit {plan[0]}")
+            return None
+
+    async def _complete_hedged(
+        self, completion_kwargs: Dict[str, Any], payload: ChatRequest
+    ) -> ChatResponse:
+        """_complete, hedged to the fallback model when the primary is slow."""
+        model = payload.model or "azure/gpt-5-nano"
+        window = llm_metrics.RECENT_LATENCY.get(model)
+        plan = chat_hedger.plan("chat", model, window)
+        fallback_payload = self._hedge_payload(payload, plan)
+        try:
+            if fallback_payload is None:
+                return await self._complete(completion_kwargs, payload)
+
+            fallback, delay = plan
+            response, _ = await chat_hedger.run(
+                "chat", model, delay,
+                lambda: self._complete(completion_kwargs, payload),
+                lambda: self._complete(
+                    self._adapt_payload(fallback, fallback_payload),
+                    fallback_payload,
+                ),
+                window,
             )
+            return response
+        except CircuitOpenError as exc:
+            # The circuit opened after _avoid_open_circuit checked it
+            raise self._circuit_open(exc) from exc
+
+    async def _open_stream(
+        self, model: str, payload: ChatRequest, timer: StreamTimer
+    ) -> Tuple[Any, AsyncIterator[Any], StreamTimer]:
+        """Start an upstream stream and wait for its first token.
+
+        Returns (upstream, chunks including the ones already read, timer).
+        """
+        import litellm
+
+        comp_kwargs = self._adapt_payload(model, payload)
+        # Final chunk carries the token usage
+        comp_kwargs.update(model_registry.get(model).stream_kwargs())
+        upstream = None
+        try:
+            upstream = await litellm.acompletion(**comp_kwargs)
+            timer.connected()
+            iterator = upstream.__aiter__()
+            head: List[Any] = []
+            while True:
+                try:
+                    chunk = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                head.append(chunk)
+                cont, reas, finish_reason = parse_chunk(chunk)
+                if cont or reas or finish_reason:
+                    break
+        except BaseException:
+            timer.discard()
+            await asyncio.shield(close_upstream(upstream))
+            raise
+
+        async def chunks() -> AsyncIterator[Any]:
+            for chunk in head:
+                yield chunk
+            async for chunk in iterator:
+                yield chunk
 
-        # Convert messages to OpenAI format
-        self._to_openai_messages(payload.messages)
+        return upstream, chunks(), timer
 
+    @staticmethod
+    async def _discard_stream(
+        opened: Tuple[Any, AsyncIterator[Any], StreamTimer]
+    ) -> None:
+        """Release a stream opened by _open_stream that lost a hedge."""
+        upstream, _, timer = opened
+        timer.discard()
+        await close_upstream(upstream)
+
+    async def _complete(
+        self, completion_kwargs: Dict[str, Any], payload: ChatRequest
+    ) -> ChatResponse:
+        """Call the LLM and build a ChatResponse from its reply."""
         response: Any = None
 
         reply = ""
         reasoning = None
 
+        model = payload.model or "azure/gpt-5-nano"
+        permit = circuit_breakers.acquire(model)
+        started = time.perf_counter()
         try:
             import litellm
 
-            # Use adaptive logic to prepare request
-            requested_model = payload.model or "azure/gpt-5-nano"
-            completion_kwargs = self._adapt_payload(requested_model, payload)
-
-            response = await litellm.acompletion(**completion_kwargs)
+            with permit, model_router.begin(model):
+                response = await litellm.acompletion(**completion_kwargs)
+            llm_metrics.observe_call(
+                model, "complete", time.perf_counter() - started
+            )
+            llm_metrics.record_usage(model, getattr(response, "usage", None))
+            usage_recorder.record(
+                "chat", model, getattr(response, "usage", None),
+                workspace_id=payload.workspace_id, user_id=payload.user_id,
+            )
             provider_name = (
                 response.model if hasattr(response, "model") else "unknown"
             )
@@ -546,6 +886,7 @@ class ChatHandler:
             # Re-raise HTTP exceptions as-is
             raise
         except Exception as exc:  # pragma: no cover - runtime protection
+            llm_metrics.record_error(model, exc)
             logger.exception(
                 f"Chat completion failed: {type(exc).__name__}: {exc}"
             )
@@ -601,176 +942,309 @@ class ChatHandler:
             # MultiProviderClient knows which provider it used
             model_name = provider_name
 
-        return ChatResponse(reply=reply, model=model_name, reasoning=reasoning)
+        return ChatResponse(
+            reply=reply,
+            model=model_name,
+            reasoning=reasoning,
+            total_tokens=usage_metadata.get("total_tokens") or None,
+        )
 
-    async def chat_stream(self, payload: ChatRequest) -> StreamingResponse:
-        """Process chat completion with Server-Sent Events streaming."""
-        # Truncate conversation history if needed
-        original_count = len(payload.messages)
-        truncated_messages = self._truncate_conversation_history(
-            payload.messages
+    async def _chat_batch_item(
+        self, index: int, item: ChatRequest
+    ) -> ChatBatchItemResult:
+        """Run one batch item; errors are captured, never raised."""
+        async with self._batch_semaphore:
+            try:
+                response = await self.chat(item)
+            except HTTPException as exc:
+                return ChatBatchItemResult(
+                    index=index,
+                    status_code=exc.status_code,
+                    error=str(exc.detail)
+                )
+            except Exception as exc:  # pragma: no cover - runtime protection
+                logger.exception(f"Batch item {index} failed: {exc}")
+                return ChatBatchItemResult(
+                    index=index, status_code=500, error=str(exc)
+                )
+        return ChatBatchItemResult(
+            index=index, status_code=200, response=response
         )
 
-        if len(truncated_messages) < original_count:
-            logger.info(
-                f"Truncated conversation history: "
-                f"{original_count} -> {len(truncated_messages)} messages"
-            )
-            # Create new payload with truncated messages
-            payload = ChatRequest(
-                messages=truncated_messages,
-                temperature=payload.temperature,
-                max_completion_tokens=payload.max_completion_tokens,
+    async def chat_batch(self, payload: ChatBatchRequest):
+        """Run several chat requests concurrently.
+
+        Results are returned in request order, or streamed as NDJSON (one
+        ChatBatchItemResult per line) as soon as each item finishes.
+        """
+        logger.info(
+            f"Starting batch: items={len(payload.items)}, "
+            f"stream={payload.stream}"
+        )
+        tasks = [
+            asyncio.create_task(self._chat_batch_item(i, item))
+            for i, item in enumerate(payload.items)
+        ]
+
+        if not payload.stream:
+            try:
+                return ChatBatchResponse(results=await asyncio.gather(*tasks))
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+        async def generate_results() -> AsyncIterator[str]:
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    result = await next_done
+                    yield result.model_dump_json() + "\n"
+            finally:
+                # Client went away: stop the remaining items
+                for task in tasks:
+                    task.cancel()
+
+        return StreamingResponse(
+            generate_results(),
+            media_type="application/x-ndjson",
+            headers={
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no",
+            },
+        )
+
+    async def run_job(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Job queue runner: execute a stored chat request."""
+        response = await self.chat(ChatRequest(**request))
+        return response.model_dump()
+
+    async def submit_job(self, payload: ChatJobRequest) -> ChatJobStatus:
+        """Queue a chat request and return its job id immediately."""
+        if payload.callback_url:
+            from urllib.parse import urlparse
+
+            parsed = urlparse(payload.callback_url)
+            if (
+                parsed.scheme not in ("http", "https") or
+                parsed.hostname not in settings.chat_job_callback_hosts
+            ):
+                raise HTTPException(
+                    status_code=400,
+                    detail="callback_url host is not allowed"
+                )
+
+        request = payload.model_dump(exclude={"callback_url"})
+        try:
+            job = await chat_job_queue.submit(request, payload.callback_url)
+        except Exception as exc:
+            logger.error(f"Failed to enqueue chat job: {exc}")
+            raise HTTPException(
+                status_code=503, detail="Job queue unavailable"
+            ) from exc
+        return ChatJobStatus(**job)
+
+    async def get_job(
+        self,
+        job_id: str,
+        wait: float = Query(
+            default=0.0,
+            ge=0.0,
+            le=settings.chat_job_max_wait,
+            description="Long-poll up to this many seconds for completion"
+        ),
+    ) -> ChatJobStatus:
+        """Return a job's state, optionally waiting for it to finish."""
+        job = await chat_job_queue.wait(job_id, wait)
+        if job is None:
+            raise HTTPException(
+                status_code=404, detail="Job not found or expired"
             )
+        return ChatJobStatus(**job)
+
+    async def chat_stream(
+        self, payload: ChatRequest, request: Request
+    ) -> SSEResponse:
+        """Process chat completion with Server-Sent Events streaming."""
+        # Session mode: rebuild history from the conversation store
+        payload, conversation, token_counts = (
+            await self._resume_conversation(payload)
+        )
 
-        # Estimate input tokens (more conservative: ~3 chars per token)
-        # Also account for message overhead (role, formatting, etc.)
-        total_chars = sum(len(msg.content) for msg in payload.messages)
-        # More conservative estimate: ~3 chars per token + overhead
-        # Each message adds ~10 tokens overhead (role, formatting)
-        message_overhead = len(payload.messages) * 10
-        estimated_input_tokens = (total_chars // 3) + message_overhead
+        # Fit conversation history into the model's token budget
+        payload, input_tokens = self._fit_payload(payload, token_counts)
+
+        # Fail fast (or use the fallback) while the model's circuit is open
+        payload = await self._avoid_open_circuit(payload)
+
+        # Workspace/user request and token limits; reconciled at the end
+        reservation = await rate_limiter.acquire(
+            payload.workspace_id, payload.user_id,
+            rate_limiter.estimate(input_tokens, payload.max_completion_tokens),
+        )
 
         logger.info(
             f"Starting stream request: messages={len(payload.messages)}, "
             f"temperature={payload.temperature}, "
             f"max_tokens={payload.max_completion_tokens}, "
-            f"estimated_input_tokens={estimated_input_tokens}"
+            f"input_tokens={input_tokens}"
         )
 
-        # Warn if input might be too large
-        if estimated_input_tokens > 2000:
+        # Warn if input fills most of the prompt budget
+        prompt_budget = token_budget.prompt_budget(
+            payload.model or "azure/gpt-5-nano",
+            payload.max_completion_tokens
+        )
+        if input_tokens > prompt_budget * 0.9:
             logger.warning(
-                f"Large input detected: ~{estimated_input_tokens} tokens. "
-                f"May leave little room for output with "
+                f"Large input detected: {input_tokens} tokens of a "
+                f"{prompt_budget} token prompt budget with "
                 f"max_completion_tokens={payload.max_completion_tokens}"
             )
 
-        # Convert messages to OpenAI format
-        self._to_openai_messages(payload.messages)
+        async def generate_frames(
+            disconnected: Optional[asyncio.Future],
+        ) -> AsyncIterator[bytes]:
+            """Generate SSE events, coalescing deltas per the flush policy.
 
-        async def generate_stream() -> AsyncIterator[str]:
-            """Generate SSE stream with optimized batching."""
-            chunk_count = 0
-            total_chars_sent = 0
+            Stops early with an abandoned stream when ``disconnected``
+            completes; resumable streams pass None and always run to the end.
+            """
             chunks_received = 0
             empty_chunks = 0
+            policy = FlushPolicy.from_settings()
+            content_writer = StreamWriter(policy)
+            thought_writer = StreamWriter(policy)
+            reply_parts: List[str] = []
+            debug = settings.stream_debug_logging
 
-            try:
-                chunk_buffer = ""
-                buffer_size = 0
-                max_buffer_size = 30  # Characters before flushing
-                sentence_endings = ['.', '!', '?', '\n']
+            requested_model = payload.model or "azure/gpt-5-nano"
+            timer = StreamTimer(requested_model)
+            usage = None
+            upstream = None
+            permit = None
+            outcome = "failed"
 
-                logger.debug("Starting to stream from LiteLLM...")
+            def next_deadline() -> Optional[float]:
+                return content_writer.deadline or thought_writer.deadline
 
+            try:
                 # Stream chunks from LiteLLM Proxy
-
                 import litellm
-                requested_model = payload.model or "azure/gpt-5-nano"
-                comp_kwargs = self._adapt_payload(requested_model, payload)
-                comp_kwargs["stream"] = True
-
-                async for chunk in await litellm.acompletion(**comp_kwargs):
-                    provider_name = "proxy-model"  # Proxy hides actual name
-                    chunks_received += 1
-
-                    # Extract content using our refined parser
-                    cont, reas = self._extract_content_from_chunk(chunk)
+                permit = circuit_breakers.acquire(requested_model)
+                window = stream_metrics.RECENT_TTFT.get(requested_model)
+                plan = chat_hedger.plan("chat_stream", requested_model, window)
+                if plan is not None and await circuit_breakers.check(plan[0]):
+                    # Do not hedge to a model whose circuit is open
+                    plan = None
+                fallback_payload = self._hedge_payload(payload, plan)
+                if fallback_payload is None:
+                    comp_kwargs = self._adapt_payload(requested_model, payload)
+                    comp_kwargs.update(
+                        model_registry.get(requested_model).stream_kwargs()
+                    )
+                    upstream = await litellm.acompletion(**comp_kwargs)
+                    timer.connected()
+                    chunks = upstream
+                else:
+                    # Hedge on time to first token
+                    fallback, delay = plan
+                    (upstream, chunks, timer), _ = await chat_hedger.run(
+                        "chat_stream", requested_model, delay,
+                        lambda: self._open_stream(
+                            requested_model, payload, timer
+                        ),
+                        lambda: self._open_stream(
+                            fallback, fallback_payload, StreamTimer(fallback)
+                        ),
+                        window,
+                        discard=self._discard_stream,
+                    )
+                    if timer.model != requested_model:
+                        # The primary was merely slow, not failing
+                        permit.release()
 
-                    if reas:
-                        yield f"data: [THOUGHT] {reas}\n\n"
-                        chunks_received += 1
+                async for chunk in with_deadlines(
+                    chunks, next_deadline, disconnected
+                ):
+                    if chunk is None:
+                        # Latency deadline passed with text still buffered
+                        frame = thought_writer.flush()
+                        if frame:
+                            yield thought_event(frame)
+                        frame = content_writer.flush()
+                        if frame:
+                            yield content_event(frame)
                         continue
 
-                    chunk_type = type(chunk).__name__
-
-                    # Check for finish reason
-                    if hasattr(chunk, "choices") and chunk.choices:
-                        choice = chunk.choices[0]
-                        if (
-                            hasattr(choice, "finish_reason") and
-                            choice.finish_reason
-                        ):
-                            finish_reason = choice.finish_reason
-                            if finish_reason == "length":
-                                max_tokens = payload.max_completion_tokens
-                                logger.warning(
-                                    f"Chunk #{chunks_received} hit limit! "
-                                    f"max_tokens={max_tokens}, "
-                                    f"input_msgs={len(payload.messages)}, "
-                                    f"est_tokens={estimated_input_tokens}, "
-                                    f"provider={provider_name}."
-                                )
-
-                        num_choices = len(chunk.choices) if hasattr(
-                            chunk, 'choices'
-                        ) else 0
+                    chunks_received += 1
+                    usage = getattr(chunk, "usage", None) or usage
+                    cont, reas, finish_reason = parse_chunk(chunk)
+                    if cont or reas:
+                        timer.token()
+                    if debug:
                         logger.debug(
-                            f"Chunk #{chunks_received} structure: "
-                            f"type={chunk_type}, count={num_choices}"
+                            f"Chunk #{chunks_received}: "
+                            f"type={type(chunk).__name__}, "
+                            f"content={cont[:50]!r}, reasoning={bool(reas)}, "
+                            f"finish_reason={finish_reason}"
                         )
-                        if hasattr(chunk, 'choices') and chunk.choices:
-                            choice = chunk.choices[0]
-                            logger.debug(
-                                f"Choice 0: "
-                                f"delta={getattr(choice, 'delta', 'N/A')}, "
-                                f"finish_reason="
-                                f"{getattr(choice, 'finish_reason', 'N/A')}"
-                            )
 
-                    if cont:
-                        chunk_buffer += cont
-                        buffer_size += len(cont)
+                    if reas:
+                        # Keep ordering: buffered content goes out first
+                        frame = content_writer.flush()
+                        if frame:
+                            yield content_event(frame)
+                        frame = thought_writer.add(reas)
+                        if frame:
+                            yield thought_event(frame)
 
-                        logger.debug(
-                            f"Chunk #{chunks_received} received: "
-                            f"type={chunk_type}, size={len(cont)}, "
-                            f"buffer_size={buffer_size}, "
-                            f"preview={repr(cont[:50])}"
-                        )
+                    if cont:
+                        frame = thought_writer.flush()
+                        if frame:
+                            yield thought_event(frame)
+                        reply_parts.append(cont)
+                        frame = content_writer.add(cont)
+                        if frame:
+                            yield content_event(frame)
+                    elif not reas:
+                        empty_chunks += 1
 
-                        # Flush buffer if threshold reached or sentence end
-                        should_flush = (
-                            buffer_size >= max_buffer_size or
-                            any(
-                                cont.endswith(ending)
-                                for ending in sentence_endings
-                            )
+                    if finish_reason == "length":
+                        logger.warning(
+                            f"Chunk #{chunks_received} hit limit! "
+                            f"max_tokens={payload.max_completion_tokens}, "
+                            f"input_msgs={len(payload.messages)}, "
+                            f"input_tokens={input_tokens}."
                         )
 
-                        if should_flush and chunk_buffer:
-                            chunk_count += 1
-                            total_chars_sent += len(chunk_buffer)
-
-                            logger.debug(
-                                f"Flushing buffer #{chunk_count}: "
-                                f"size={len(chunk_buffer)}, "
-                                f"total_sent={total_chars_sent}"
-                            )
-
-                            # Format as SSE: data: <content>\n\n
-                            yield f"data: {chunk_buffer}\n\n"
-                            chunk_buffer = ""
-                            buffer_size = 0
-                    else:
-                        empty_chunks += 1
-                        logger.debug(
-                            f"Empty chunk #{chunks_received}: type="
-                            f"{chunk_type}"
-                        )
+                # Flush any remaining buffer
+                frame = thought_writer.flush()
+                if frame:
+                    yield thought_event(frame)
+                frame = content_writer.flush()
+                if frame:
+                    yield content_event(frame)
 
                 # Check if we hit token limit early
                 early_token_limit = (
                     chunks_received <= 5
-                    and chunk_count == 0
+                    and content_writer.frames == 0
                     and empty_chunks > 0
                 )
 
                 logger.info(
                     f"Stream completed: received={chunks_received}, "
-                    f"empty={empty_chunks}, sent={chunk_count}, "
-                    f"chars={total_chars_sent}, buffer={buffer_size}"
+                    f"empty={empty_chunks}, sent={content_writer.frames}, "
+                    f"thought_frames={thought_writer.frames}, "
+                    f"chars={content_writer.chars}, "
+                    f"{format_summary(timer.finish())}"
+                )
+                permit.success()
+                # Deltas approximate completion tokens when the upstream
+                # does not report usage on the stream
+                llm_metrics.record_usage(
+                    timer.model, usage,
+                    prompt_tokens=input_tokens,
+                    completion_tokens=timer.tokens,
                 )
 
                 if early_token_limit:
@@ -779,58 +1253,154 @@ class ChatHandler:
                     logger.error(
                         f"Stream failed: Hit token limit immediately. "
                         f"Input messages={len(payload.messages)}, "
-                        f"estimated_input_tokens={estimated_input_tokens}, "
+                        f"input_tokens={input_tokens}, "
                         f"max_completion_tokens="
                         f"{payload.max_completion_tokens}. "
                         f"Model may have small context window. "
                         f"Suggested: Reduce to {suggested_max} messages "
                         f"or increase max_completion_tokens."
                     )
-
-                # Flush any remaining buffer
-                if chunk_buffer:
-                    chunk_count += 1
-                    total_chars_sent += len(chunk_buffer)
-                    logger.debug(
-                        f"Flushing final buffer: size={len(chunk_buffer)}"
-                    )
-                    yield f"data: {chunk_buffer}\n\n"
-                elif chunks_received > 0 and chunk_count == 0:
+                elif chunks_received > 0 and content_writer.frames == 0:
                     logger.warning(
                         f"No data sent despite {chunks_received} chunks. "
-                        f"All chunks may be empty or buffered."
+                        f"All chunks may be empty."
                     )
 
                 # Send completion signal
-                logger.debug("Sending [DONE] signal")
-                yield "data: [DONE]\n\n"
+                outcome = "completed"
+                yield DONE_EVENT
 
+                await self._record_reply(conversation, "".join(reply_parts))
+
+            except StreamAbandoned:
+                # Client went away: stop generating, nobody reads the rest
+                outcome = "abandoned"
+                summary = timer.finish(
+                    "abandoned", payload.max_completion_tokens
+                )
+                logger.info(
+                    f"Stream abandoned by client: received={chunks_received}, "
+                    f"sent={content_writer.frames}, {format_summary(summary)}"
+                )
+            except asyncio.CancelledError:
+                # The server cancelled the response (client disconnect seen
+                # by Starlette first, or shutdown)
+                outcome = "abandoned"
+                timer.finish("abandoned", payload.max_completion_tokens)
+                raise
             except HTTPException:
                 # Re-raise HTTP exceptions as-is
                 logger.error(
                     f"HTTPException: received={chunks_received}, "
-                    f"sent={chunk_count}"
+                    f"sent={content_writer.frames}, "
+                    f"{format_summary(timer.finish('failed'))}"
                 )
                 raise
             except Exception as exc:  # pragma: no cover - runtime protection
+                llm_metrics.record_error(timer.model, exc)
+                if permit is not None:
+                    permit.failure(exc)
                 logger.exception(
                     f"Streaming failed: type={type(exc).__name__}, "
                     f"error={exc}, received={chunks_received}, "
-                    f"sent={chunk_count}, empty={empty_chunks}"
+                    f"sent={content_writer.frames}, empty={empty_chunks}, "
+                    f"{format_summary(timer.finish('failed'))}"
                 )
-                # Send error as SSE event
-                error_msg = f"Error: {str(exc)}"
-                yield f"data: {error_msg}\n\n"
-                yield "data: [DONE]\n\n"
+                # Send the error as an event
+                yield error_event(str(exc))
+                yield DONE_EVENT
+            finally:
+                if permit is not None:
+                    # No-op once an outcome was recorded
+                    permit.release()
+                await asyncio.shield(reservation.reconcile(
+                    getattr(usage, "total_tokens", None)
+                    or input_tokens + timer.tokens
+                ))
+                if upstream is not None:
+                    usage_recorder.record(
+                        "chat_stream", timer.model, usage,
+                        workspace_id=payload.workspace_id,
+                        user_id=payload.user_id,
+                        prompt_tokens=input_tokens,
+                        completion_tokens=timer.tokens,
+                        outcome=outcome,
+                    )
+                # Shielded: must complete even inside a cancelled task
+                await asyncio.shield(close_upstream(upstream))
 
-        return StreamingResponse(
-            generate_stream(),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no",  # Disable nginx buffering
-                "Transfer-Encoding": "chunked",  # Explicit chunked encoding
-                "X-Content-Type-Options": "nosniff",
-            },
+        headers = dict(_SSE_HEADERS)
+        if conversation is not None:
+            headers["X-Conversation-Id"] = conversation.id
+
+        # Held until generation ends (429/503 before streaming when full)
+        try:
+            ticket = await interactive_pool.acquire(
+                payload.model or "azure/gpt-5-nano"
+            )
+        except BaseException:
+            await asyncio.shield(reservation.reconcile(0))
+            raise
+
+        # The ticket is owned by the frames from here on: released when
+        # they end or are closed, even if the response never starts them
+        try:
+            if payload.resumable:
+                # Generation is decoupled from this connection; the client
+                # reconnects with Last-Event-ID to resume
+                stream_id = resumable_streams.start(admitted(
+                    ticket, generate_frames(None),
+                    on_close=lambda: reservation.reconcile(0),
+                ))
+                headers["X-Stream-Id"] = stream_id
+                return SSEResponse(
+                    self._resumable_sse(stream_id, 0), headers=headers
+                )
+
+            disconnected = watch_disconnect(request)
+
+            async def on_close() -> None:
+                disconnected.cancel()
+                # No-op if generate_frames ran (it reconciles the usage)
+                await reservation.reconcile(0)
+
+            return SSEResponse(
+                admitted(ticket, generate_frames(disconnected), on_close),
+                headers=headers,
+            )
+        except BaseException:
+            ticket.release()
+            await asyncio.shield(reservation.reconcile(0))
+            raise
+
+    async def _resumable_sse(
+        self, stream_id: str, after: int
+    ) -> AsyncIterator[bytes]:
+        """SSE events with sequence ids for a resumable stream."""
+        async for seq, frame in resumable_streams.follow(stream_id, after):
+            yield with_id(seq, frame)
+
+    async def resume_stream(
+        self,
+        stream_id: str,
+        last_event_id: Optional[str] = Header(default=None),
+        after: Optional[int] = Query(
+            default=None, ge=0,
+            description="Last sequence id received (if the header is unset)"
+        ),
+    ) -> SSEResponse:
+        """Replay a resumable stream after Last-Event-ID, then follow it."""
+        if not await resumable_streams.exists(stream_id):
+            raise HTTPException(
+                status_code=404, detail="Stream not found or expired"
+            )
+        try:
+            last_seq = int(last_event_id) if last_event_id else (after or 0)
+        except ValueError:
+            raise HTTPException(
+                status_code=400, detail="Last-Event-ID must be a sequence id"
+            )
+        return SSEResponse(
+            self._resumable_sse(stream_id, last_seq),
+            headers={**_SSE_HEADERS, "X-Stream-Id": stream_id},
         )
@@ -1,9 +1,31 @@
-from fastapi import HTTPException
-from fastapi.responses import StreamingResponse
+import asyncio
+
+from fastapi import HTTPException, Request
+from loguru import logger
 from pydantic import BaseModel
+from typing import Optional
 from services.document_processor import DocumentProcessor
 from services.rag_service import RAGService
 from services.llm_service import LLMService
+from services.llm_client import llm_client
+from services.response_cache import completion_cache
+from services.semantic_cache import semantic_cache
+from services.single_flight import chat_single_flight
+from services.summarizer import conversation_summarizer
+from services.job_queue import chat_job_queue
+from services import llm_metrics, stream_metrics
+from services.resumable_stream import resumable_streams
+from services.admission import admitted, ingestion_pool, interactive_pool
+from services.circuit_breaker import circuit_breakers
+from services.rate_limiter import rate_limiter
+from services.usage_recorder import usage_recorder
+from services.hedging import chat_hedger
+from services.model_router import model_router
+from services.stream_writer import (
+    ClosingStreamingResponse, FlushPolicy, StreamAbandoned, StreamWriter,
+    close_upstream, watch_disconnect, with_deadlines
+)
+from utils.loop_lag import loop_lag_monitor
 
 class ProcessDocumentRequest(BaseModel):
     file_path: str
@@ -14,6 +36,7 @@ class ProcessDocumentRequest(BaseModel):
 class RAGQueryRequest(BaseModel):
     query: str
     workspace_id: str
+    user_id: Optional[str] = None
 
 class InternalHandler:
     def __init__(self):
@@ -22,17 +45,88 @@ class InternalHandler:
         self.rag_service = RAGService(self.llm_service)
 
     async def process_document(self, request: ProcessDocumentRequest):
-        try:
-            chunks = self.doc_processor.process_document(request.file_path, request.file_type)
-            # Here we would normally save chunks to pgvector
-            # For now, we just return the count
-            return {"status": "success", "chunks_processed": len(chunks)}
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
-
-    async def rag_query(self, request: RAGQueryRequest):
+        # Separate pool: uploads cannot take slots from interactive chat
+        async with ingestion_pool.admit(request.workspace_id):
+            try:
+                # Parsing (pypdf/docx) is CPU-bound: keep it off the event loop
+                chunks = await asyncio.to_thread(
+                    self.doc_processor.process_document, request.file_path, request.file_type
+                )
+                # Here we would normally save chunks to pgvector
+                # For now, we just return the count
+                return {"status": "success", "chunks_processed": len(chunks)}
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=str(e))
+
+    async def rag_query(self, request: RAGQueryRequest, http_request: Request):
         async def stream_generator():
-            async for chunk in self.rag_service.query_with_context(request.query, request.workspace_id):
-                yield chunk
+            # Coalesce token deltas into fewer frames (see FlushPolicy)
+            writer = StreamWriter(FlushPolicy.from_settings())
+            chunks = self.rag_service.query_with_context(
+                request.query, request.workspace_id, request.user_id,
+                reservation=reservation, model=model
+            )
+            # Stop the upstream generation as soon as the client disconnects
+            disconnected = watch_disconnect(http_request)
+            try:
+                async for chunk in with_deadlines(chunks, lambda: writer.deadline, disconnected):
+                    frame = writer.flush() if chunk is None else writer.add(chunk)
+                    if frame:
+                        yield frame
+                frame = writer.flush()
+                if frame:
+                    yield frame
+            except StreamAbandoned:
+                logger.info(f"RAG query stream abandoned by client: workspace={request.workspace_id}")
+            finally:
+                disconnected.cancel()
+                await asyncio.shield(close_upstream(chunks))
+
+        # Model choice and workspace/user limits before the response starts
+        # (raises 429); generate_blocks reconciles, cache hits release it
+        model, reservation = await self.llm_service.reserve(
+            request.query, workspace_id=request.workspace_id, user_id=request.user_id
+        )
+        try:
+            # Held until the stream ends (429/503 before streaming when full)
+            ticket = await interactive_pool.acquire("rag")
+        except BaseException:
+            await asyncio.shield(reservation.reconcile(0))
+            raise
+        try:
+            # Closes (and so releases) the stream even if it never starts
+            return ClosingStreamingResponse(
+                admitted(ticket, stream_generator(), on_close=lambda: reservation.reconcile(0)),
+                media_type="text/plain",
+            )
+        except BaseException:
+            ticket.release()
+            await asyncio.shield(reservation.reconcile(0))
+            raise
+
+    async def router_state(self):
+        """Live state of the client-side model router."""
+        return model_router.state()
 
-        return StreamingResponse(stream_generator(), media_type="text/plain")
+    async def stats(self):
+        """Runtime statistics of shared service components."""
+        return {
+            "llm_http_pool": llm_client.stats(),
+            "completion_cache": completion_cache.stats(),
+            "semantic_cache": semantic_cache.stats(),
+            "chat_single_flight": chat_single_flight.stats(),
+            "conversation_summarizer": conversation_summarizer.stats(),
+            "chat_jobs": await chat_job_queue.stats(),
+            "streams": stream_metrics.stats(),
+            "resumable_streams": resumable_streams.stats(),
+            "hedging": chat_hedger.stats(),
+            "circuit_breakers": circuit_breakers.stats(),
+            "rate_limiter": rate_limiter.stats(),
+            "usage_recorder": usage_recorder.stats(),
+            "prompt_cache": llm_metrics.prompt_cache_stats(),
+            "admission": {
+                "interactive": interactive_pool.stats(),
+                "ingestion": ingestion_pool.stats(),
+            },
+            "event_loop_lag_seconds": round(loop_lag_monitor.lag, 4),
+        }
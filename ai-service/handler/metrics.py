@@ -0,0 +1,16 @@
+from fastapi.responses import PlainTextResponse
+
+from utils.metrics import REGISTRY
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsHandler:
+    def __init__(self) -> None:
+        pass
+
+    async def metrics(self) -> PlainTextResponse:
+        """Prometheus text exposition of all registered metrics."""
+        return PlainTextResponse(
+            REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE
+        )
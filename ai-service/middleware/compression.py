@@ -0,0 +1,278 @@
+"""
+Pure-ASGI, streaming-aware response compression.
+
+The encoding is negotiated from ``Accept-Encoding`` (q-values honoured;
+on a tie zstd > br > gzip). zstd and br are used when the optional
+``zstandard`` / ``brotli`` packages are installed, gzip always works.
+
+- Complete bodies (JSON responses) of at least ``minimum_size`` bytes
+  are compressed in one shot, in a worker thread from ``offload_size``
+  bytes on so big bodies never block the event loop.
+- Streaming content types (SSE, NDJSON) are sent uncompressed by
+  default (``stream_mode="skip"``). With ``stream_mode="flush"`` they
+  are compressed with a sync flush after every frame, so each frame
+  reaches the client as soon as it is sent instead of waiting for the
+  compressor's buffer to fill (the latency GZipMiddleware added).
+- Other bodies sent in several parts (e.g. ``text/plain`` streams) are
+  compressed as a stream, also sync-flushed after every part so a
+  streamed reply is never held back in the compressor.
+
+Responses that already have a Content-Encoding pass through untouched.
+"""
+import asyncio
+import zlib
+from typing import Any, Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from utils.metrics import Counter
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+STREAMING_CONTENT_TYPES = frozenset({
+    "text/event-stream",
+    "application/x-ndjson",
+})
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+HTTP_COMPRESSED = Counter(
+    "http_compressed_responses_total",
+    "Compressed responses by encoding and mode",
+    ["encoding", "mode"],
+)
+
+
+class _GzipStream:
+    def __init__(self) -> None:
+        self._z = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._z.compress(data)
+
+    def flush(self) -> bytes:
+        return self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._z.flush(zlib.Z_FINISH)
+
+
+class _BrotliStream:
+    def __init__(self) -> None:
+        self._c = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.process(data)
+
+    def flush(self) -> bytes:
+        return self._c.flush()
+
+    def finish(self) -> bytes:
+        return self._c.finish()
+
+
+class _ZstdStream:
+    def __init__(self) -> None:
+        self._c = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.compress(data)
+
+    def flush(self) -> bytes:
+        return self._c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._c.flush()
+
+
+def _gzip(data: bytes) -> bytes:
+    return zlib.compress(data, GZIP_LEVEL, wbits=31)
+
+
+def _brotli(data: bytes) -> bytes:
+    return brotli.compress(data, quality=BROTLI_QUALITY)
+
+
+def _zstd(data: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+
+# encoding -> (one-shot compressor, stream compressor), by preference
+CODECS: Dict[str, Any] = {}
+if zstandard is not None:
+    CODECS["zstd"] = (_zstd, _ZstdStream)
+if brotli is not None:
+    CODECS["br"] = (_brotli, _BrotliStream)
+CODECS["gzip"] = (_gzip, _GzipStream)
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Best supported encoding the client accepts (None: identity)."""
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip()] = q
+    best, best_q = None, 0.0
+    for encoding in CODECS:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionMiddleware:
+    """Compress responses without delaying streamed frames."""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1000,
+        offload_size: int = 256 * 1024,
+        stream_mode: str = "skip",
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+        self.stream_mode = stream_mode
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(
+            Headers(scope=scope).get("accept-encoding", "")
+        )
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _Responder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _Responder:
+    """Per-response state: holds the start message until the mode is known."""
+
+    __slots__ = ("middleware", "encoding", "downstream", "start", "mode",
+                 "stream")
+
+    def __init__(
+        self, middleware: CompressionMiddleware, encoding: str, send: Send
+    ) -> None:
+        self.middleware = middleware
+        self.encoding = encoding
+        self.downstream = send
+        self.start: Optional[Message] = None
+        # identity | pending | flush | stream
+        self.mode = "identity"
+        self.stream: Any = None
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            await self._on_start(message)
+        elif message["type"] == "http.response.body":
+            await self._on_body(message)
+        else:
+            await self.downstream(message)
+
+    async def _on_start(self, message: Message) -> None:
+        headers = Headers(raw=message["headers"])
+        content_type = headers.get("content-type", "").partition(";")[0]
+        if (
+            "content-encoding" in headers
+            or message["status"] < 200
+            or message["status"] in (204, 206, 304)
+        ):
+            await self.downstream(message)
+        elif content_type.strip().lower() in STREAMING_CONTENT_TYPES:
+            if self.middleware.stream_mode == "flush":
+                self._compressed_headers(message, None)
+                self.stream = CODECS[self.encoding][1]()
+                self.mode = "flush"
+                HTTP_COMPRESSED.labels(self.encoding, "flush").inc()
+            # Headers go out now: the stream starts without delay
+            await self.downstream(message)
+        else:
+            self.start = message
+            self.mode = "pending"
+
+    async def _on_body(self, message: Message) -> None:
+        body: bytes = message.get("body", b"")
+        more_body: bool = message.get("more_body", False)
+
+        if self.mode == "identity":
+            await self.downstream(message)
+        elif self.mode == "flush":
+            # Every frame is complete on the wire once sent
+            data = self.stream.compress(body) + (
+                self.stream.flush() if more_body else self.stream.finish()
+            )
+            await self.downstream({
+                "type": "http.response.body", "body": data,
+                "more_body": more_body,
+            })
+        elif self.mode == "stream":
+            data = await self._run(self.stream.compress, body)
+            # Parts may be paced by a generator: never hold one back
+            data += self.stream.flush() if more_body else self.stream.finish()
+            await self.downstream({
+                "type": "http.response.body", "body": data,
+                "more_body": more_body,
+            })
+        elif not more_body:
+            # The whole body in one message
+            self.mode = "identity"
+            if len(body) < self.middleware.minimum_size:
+                await self.downstream(self.start)
+                await self.downstream(message)
+                return
+            compress = CODECS[self.encoding][0]
+            data = await self._run(compress, body)
+            self._compressed_headers(self.start, len(data))
+            HTTP_COMPRESSED.labels(self.encoding, "body").inc()
+            await self.downstream(self.start)
+            await self.downstream({
+                "type": "http.response.body", "body": data,
+                "more_body": False,
+            })
+        else:
+            self.mode = "stream"
+            self.stream = CODECS[self.encoding][1]()
+            self._compressed_headers(self.start, None)
+            HTTP_COMPRESSED.labels(self.encoding, "stream").inc()
+            await self.downstream(self.start)
+            await self._on_body(message)
+
+    async def _run(self, compress: Any, data: bytes) -> bytes:
+        """Compress ``data``, in a worker thread if it is large."""
+        if len(data) >= self.middleware.offload_size:
+            return await asyncio.to_thread(compress, data)
+        return compress(data)
+
+    def _compressed_headers(
+        self, message: Message, length: Optional[int]
+    ) -> None:
+        headers = MutableHeaders(raw=message["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if length is None:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(length)
+        message["headers"] = headers.raw
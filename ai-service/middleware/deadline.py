@@ -0,0 +1,225 @@
+"""
+Pure-ASGI request deadlines with SSE idle timeouts.
+
+Every request gets a budget: the longest matching path prefix in
+``route_budgets``, else ``default_budget``. A client may shorten it
+with ``X-Request-Deadline`` (absolute Unix time in seconds); a deadline
+that already passed is answered with 504 right away. The deadline is
+published through ``utils.deadline`` so upstream LLM calls time out
+with the request (see ``LLMClient.completion_kwargs``).
+
+The budget covers the whole response, not only the time until its
+headers:
+
+- before the response started, running out of time cancels the
+  handler and answers 504;
+- SSE streams are also cancelled when the handler sends nothing for
+  ``idle_timeout`` seconds, and then end with an ``error`` and a
+  ``done`` event; other streamed bodies (NDJSON batches, RAG text) only
+  have the route budget, as their first item may take long;
+- SSE streams get a ``: keep-alive`` comment after ``heartbeat_interval``
+  seconds without a frame, so proxies do not cut idle connections.
+
+Must sit inside the compression middleware: heartbeats are written as
+plain frames of the response.
+"""
+import asyncio
+import time
+from typing import Dict, Optional
+
+from loguru import logger
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from services.sse import DONE_EVENT, error_event
+from utils.deadline import reset_deadline, set_deadline
+from utils.metrics import Counter
+
+HEARTBEAT = b": keep-alive\n\n"
+_TIMEOUT_BODY = b'{"detail": "Request timeout"}'
+
+REQUEST_TIMEOUTS = Counter(
+    "http_request_timeouts_total",
+    "Requests cut by their deadline",
+    ["reason"],
+)
+
+
+class _Response:
+    """What the handler has sent so far; sends are serialized."""
+
+    __slots__ = ("downstream", "lock", "started", "on_start", "streaming",
+                 "sse", "finished", "last_frame", "last_write")
+
+    def __init__(self, send: Send) -> None:
+        self.downstream = send
+        self.lock = asyncio.Lock()
+        self.started = False
+        self.on_start = asyncio.Event()
+        self.streaming = False
+        self.sse = False
+        self.finished = False
+        self.last_frame = self.last_write = time.monotonic()
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            self.started = True
+            self.on_start.set()
+            self.streaming = "content-length" not in headers
+            self.sse = headers.get("content-type", "").startswith(
+                "text/event-stream"
+            )
+        elif message["type"] == "http.response.body":
+            self.finished = not message.get("more_body", False)
+        async with self.lock:
+            await self.downstream(message)
+        self.last_frame = self.last_write = time.monotonic()
+
+    async def write(self, body: bytes, more_body: bool = True) -> None:
+        """Write a frame of our own (heartbeat, timeout notice)."""
+        async with self.lock:
+            await self.downstream({
+                "type": "http.response.body", "body": body,
+                "more_body": more_body,
+            })
+        self.last_write = time.monotonic()
+
+
+class DeadlineMiddleware:
+    """Enforce per-route and client deadlines over the whole response."""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        default_budget: float,
+        route_budgets: Optional[Dict[str, float]] = None,
+        idle_timeout: float = 0.0,
+        heartbeat_interval: float = 0.0,
+    ) -> None:
+        self.app = app
+        self.default_budget = default_budget
+        # Longest prefix first
+        self.route_budgets = sorted(
+            (route_budgets or {}).items(), key=lambda item: -len(item[0])
+        )
+        self.idle_timeout = idle_timeout
+        self.heartbeat_interval = heartbeat_interval
+
+    def budget(self, path: str) -> float:
+        for prefix, budget in self.route_budgets:
+            if path.startswith(prefix):
+                return budget
+        return self.default_budget
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        now = time.monotonic()
+        deadline = now + self.budget(scope["path"])
+        client_deadline = Headers(scope=scope).get("x-request-deadline")
+        if client_deadline:
+            try:
+                deadline = min(
+                    deadline, now + float(client_deadline) - time.time()
+                )
+            except ValueError:
+                pass
+        response = _Response(send)
+        if deadline <= now:
+            REQUEST_TIMEOUTS.labels("client_deadline").inc()
+            await self._timeout_response(response)
+            return
+
+        token = set_deadline(deadline)
+        try:
+            # The handler task inherits the deadline
+            task = asyncio.create_task(self.app(scope, receive, response.send))
+        finally:
+            reset_deadline(token)
+        try:
+            reason = await self._watch(task, response, deadline)
+        except asyncio.CancelledError:
+            # Server cancelled the request (shutdown, disconnect)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            raise
+        if reason is None:
+            # Re-raise what the handler raised
+            task.result()
+            return
+
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        REQUEST_TIMEOUTS.labels(reason).inc()
+        logger.error(
+            f"Request timeout ({reason}): {scope['method']} {scope['path']}"
+        )
+        if not response.finished:
+            await self._timeout_response(response)
+
+    async def _watch(
+        self, task: asyncio.Task, response: _Response, deadline: float
+    ) -> Optional[str]:
+        """Wait for the handler; the reason if it has to be cut."""
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                return "deadline"
+            wake = deadline
+            if response.streaming and not response.finished:
+                if response.sse and self.idle_timeout:
+                    idle_until = response.last_frame + self.idle_timeout
+                    if now >= idle_until:
+                        return "stream_idle"
+                    wake = min(wake, idle_until)
+                if response.sse and self.heartbeat_interval:
+                    beat_at = response.last_write + self.heartbeat_interval
+                    if now >= beat_at:
+                        if response.lock.locked():
+                            # A frame is being written right now
+                            response.last_write = now
+                            continue
+                        try:
+                            await response.write(HEARTBEAT)
+                        except OSError:
+                            # Client gone; the handler notices on its own
+                            pass
+                        continue
+                    wake = min(wake, beat_at)
+            if response.started:
+                done, _ = await asyncio.wait({task}, timeout=wake - now)
+            else:
+                # Wake up when the headers go out: idle tracking starts
+                started = asyncio.ensure_future(response.on_start.wait())
+                try:
+                    done, _ = await asyncio.wait(
+                        {task, started}, timeout=wake - now,
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                finally:
+                    started.cancel()
+            if task in done:
+                return None
+
+    async def _timeout_response(self, response: _Response) -> None:
+        try:
+            if not response.started:
+                await response.send({
+                    "type": "http.response.start",
+                    "status": 504,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"content-length", b"%d" % len(_TIMEOUT_BODY)),
+                    ],
+                })
+                await response.write(_TIMEOUT_BODY, more_body=False)
+            elif response.sse:
+                await response.write(error_event("Request timeout"))
+                await response.write(DONE_EVENT, more_body=False)
+            else:
+                await response.write(b"", more_body=False)
+        except OSError:
+            pass
@@ -0,0 +1,87 @@
+"""
+Pure-ASGI request metrics middleware.
+
+Requests are labelled by method, route template (``/api/v1/chat/{job_id}``
+rather than the concrete path, ``unmatched`` when no route matched) and
+status code, so the series count stays bounded. Responses sent without a
+Content-Length (streaming responses) are also tracked as in-flight
+streams per route.
+"""
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from utils.metrics import Counter, Gauge, Histogram
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "Total number of HTTP requests",
+    ["method", "path", "status_code"],
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request duration in seconds (streams: until the last byte)",
+    ["method", "path"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+             30.0, 60.0, 300.0),
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served"
+)
+HTTP_STREAMS_IN_FLIGHT = Gauge(
+    "http_streams_in_flight",
+    "Streaming responses currently open",
+    ["path"],
+)
+
+
+def route_template(scope: Scope) -> str:
+    """Path template of the matched route, or ``unmatched``."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Count and time HTTP requests per route template."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+        stream_gauge = None
+        in_flight = HTTP_IN_FLIGHT.labels()
+        in_flight.inc()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, stream_gauge
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                has_length = any(
+                    name == b"content-length"
+                    for name, _ in message.get("headers", ())
+                )
+                if not has_length:
+                    stream_gauge = HTTP_STREAMS_IN_FLIGHT.labels(
+                        route_template(scope)
+                    )
+                    stream_gauge.inc()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            if stream_gauge is not None:
+                stream_gauge.dec()
+            path = route_template(scope)
+            method = scope["method"]
+            HTTP_REQUESTS.labels(method, path, str(status_code)).inc()
+            HTTP_REQUEST_SECONDS.labels(method, path).observe(
+                time.perf_counter() - started
+            )
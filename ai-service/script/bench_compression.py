@@ -0,0 +1,218 @@
+"""
+Time to first token through the compression middleware.
+
+An SSE endpoint sends its first event right away and then one event
+every ``--interval`` ms. A client-side ``send`` decodes the response
+incrementally (per Content-Encoding) and records when the first event
+becomes readable, i.e. the TTFT added by compression. Variants:
+
+- none: no compression middleware
+- gzip (legacy): GZipMiddleware as in older Starlette releases, which
+  wrote streamed chunks to a ``GzipFile`` without flushing (reproduced
+  here, since current releases exclude SSE and sync-flush)
+- gzip (current): the installed Starlette's GZipMiddleware with SSE
+  not excluded
+- compression skip / flush: CompressionMiddleware's stream modes
+
+A second run streams a large JSON body and reports the longest event
+loop stall with compression on the loop vs. offloaded to a thread.
+
+    python script/bench_compression.py [--events 20] [--interval 50]
+"""
+import argparse
+import asyncio
+import gzip
+import io
+import os
+import sys
+import time
+import zlib
+from typing import Any, Callable, Dict, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orjson  # noqa: E402
+from starlette.middleware.gzip import GZipMiddleware  # noqa: E402
+
+from middleware.compression import CODECS, CompressionMiddleware  # noqa: E402
+from services.sse import DONE_EVENT, SSEResponse, content_event  # noqa: E402
+
+ACCEPT = b"gzip, deflate, br, zstd"
+
+
+def sse_app(events: int, interval: float) -> Callable:
+    async def frames():
+        for i in range(events):
+            if i:
+                await asyncio.sleep(interval)
+            yield content_event(f"token {i} " * 4)
+        yield DONE_EVENT
+
+    async def app(scope, receive, send):
+        await SSEResponse(frames())(scope, receive, send)
+
+    return app
+
+
+def json_app(size: int) -> Callable:
+    body = orjson.dumps([
+        {"id": i, "text": f"block {i} " * 8, "tags": ["a", "b"]}
+        for i in range(size // 100)
+    ])
+
+    async def app(scope, receive, send):
+        await send({
+            "type": "http.response.start", "status": 200,
+            "headers": [(b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    return app
+
+
+class Decoder:
+    """Incremental decoding of the response body by Content-Encoding."""
+
+    def __init__(self, encoding: Optional[str]) -> None:
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._d = zlib.decompressobj(31)
+        elif encoding == "br":
+            import brotli
+            self._d = brotli.Decompressor()
+        elif encoding == "zstd":
+            import zstandard
+            self._d = zstandard.ZstdDecompressor().decompressobj()
+
+    def feed(self, data: bytes) -> bytes:
+        if self.encoding is None:
+            return data
+        if self.encoding == "br":
+            return self._d.process(data)
+        return self._d.decompress(data)
+
+
+async def ttft(app: Callable) -> Dict[str, Any]:
+    started = time.perf_counter()
+    result: Dict[str, Any] = {"ttft": None, "wire": 0, "encoding": None}
+    decoder = Decoder(None)
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal decoder
+        if message["type"] == "http.response.start":
+            headers = dict(message["headers"])
+            encoding = headers.get(b"content-encoding")
+            result["encoding"] = encoding.decode() if encoding else None
+            decoder = Decoder(result["encoding"])
+            return
+        body = message.get("body", b"")
+        result["wire"] += len(body)
+        if result["ttft"] is None and b"\n\n" in decoder.feed(body):
+            result["ttft"] = time.perf_counter() - started
+
+    scope = {
+        "type": "http", "method": "GET", "path": "/",
+        "asgi": {"version": "3.0", "spec_version": "2.4"},
+        "headers": [(b"accept-encoding", ACCEPT)],
+    }
+    await app(scope, receive, send)
+    result["total"] = time.perf_counter() - started
+    return result
+
+
+async def max_stall(app: Callable) -> float:
+    """Longest gap of a 1 ms ticker while the response is produced."""
+    stall = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal stall
+        last = time.perf_counter()
+        while not done:
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            stall = max(stall, now - last)
+            last = now
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    await ttft(app)
+    done = True
+    await task
+    return stall
+
+
+def gzip_legacy(app: Callable) -> Callable:
+    """Streamed responses through a GzipFile that is never flushed."""
+    async def wrapped(scope, receive, send):
+        buffer = io.BytesIO()
+        gzip_file = gzip.GzipFile(mode="wb", fileobj=buffer, compresslevel=9)
+
+        async def send_gzip(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    (k, v) for k, v in message["headers"]
+                    if k != b"content-length"
+                ] + [(b"content-encoding", b"gzip")]
+                await send(message)
+                return
+            gzip_file.write(message.get("body", b""))
+            if not message.get("more_body", False):
+                gzip_file.close()
+            body = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            await send({**message, "body": body})
+
+        await app(scope, receive, send_gzip)
+
+    return wrapped
+
+
+def gzip_current(app: Callable) -> Callable:
+    try:
+        return GZipMiddleware(app, minimum_size=1000, exclude_content_types=())
+    except TypeError:
+        return GZipMiddleware(app, minimum_size=1000)
+
+
+async def main(args: argparse.Namespace) -> None:
+    interval = args.interval / 1000.0
+    variants = {
+        "none": lambda a: a,
+        "gzip (legacy)": gzip_legacy,
+        "gzip (current)": gzip_current,
+        "compression skip": lambda a: CompressionMiddleware(a),
+        "compression flush": lambda a: CompressionMiddleware(
+            a, stream_mode="flush"
+        ),
+    }
+    print(f"SSE: {args.events} events, {args.interval} ms apart "
+          f"(codecs: {', '.join(CODECS)})")
+    print(f"{'variant':20s} {'encoding':>9s} {'TTFT ms':>9s} "
+          f"{'total ms':>9s} {'bytes':>8s}")
+    for name, wrap in variants.items():
+        r = await ttft(wrap(sse_app(args.events, interval)))
+        first = f"{r['ttft'] * 1000:9.1f}" if r["ttft"] else f"{'-':>9s}"
+        print(f"{name:20s} {str(r['encoding']):>9s} {first} "
+              f"{r['total'] * 1000:9.1f} {r['wire']:8d}")
+
+    size = args.json_mb * 1024 * 1024
+    print(f"\nJSON body of {args.json_mb} MiB: longest event loop stall")
+    for name, offload in (("on the loop", size * 2), ("offloaded", 0)):
+        stall = await max_stall(
+            CompressionMiddleware(json_app(size), offload_size=offload)
+        )
+        print(f"{name:20s} {stall * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--events", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=50.0)
+    parser.add_argument("--json-mb", type=int, default=8)
+    asyncio.run(main(parser.parse_args()))
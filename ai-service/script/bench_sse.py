@@ -0,0 +1,128 @@
+"""
+CPU cost of SSE framing per 1k frames:
+
+- before: f-string ``str`` frames through StreamingResponse (the old
+  format, which newlines in the text break)
+- typed json: the typed event format built as ``str`` with the stdlib
+  json module, through StreamingResponse
+- after: pre-encoded ``bytes`` events (orjson) through SSEResponse
+
+Responses are driven through their ASGI ``__call__`` with a no-op
+``send``, so the numbers cover frame building, encoding and the response
+loop, without network I/O. Servers on ASGI spec 2.3 make
+StreamingResponse also listen for disconnects in a task group; both
+spec versions are measured.
+
+    python script/bench_sse.py [--frames 100000] [--rounds 5]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import AsyncIterator, Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from starlette.responses import StreamingResponse  # noqa: E402
+
+from services.sse import (  # noqa: E402
+    DONE_EVENT, SSEResponse, content_event, thought_event
+)
+
+# Typical coalesced deltas: words, sentences, multi-line markdown
+SAMPLES = [
+    "Hello",
+    " world, this is a streamed answer.",
+    "\n\n## Plan\n- step one\n- step two\n",
+    " with \"quotes\" and unicode: café ✓",
+]
+
+
+def payloads(n: int) -> List[str]:
+    return [SAMPLES[i % len(SAMPLES)] for i in range(n)]
+
+
+async def frames_before(texts: List[str]) -> AsyncIterator[str]:
+    for i, text in enumerate(texts):
+        # Previous framing: f-string per frame, broken by newlines
+        if i % 8 == 0:
+            yield f"data: [THOUGHT] {text}\n\n"
+        else:
+            yield f"data: {text}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+async def frames_json(texts: List[str]) -> AsyncIterator[str]:
+    for i, text in enumerate(texts):
+        event = "thought" if i % 8 == 0 else "content"
+        yield f"event: {event}\ndata: {json.dumps({'text': text})}\n\n"
+    yield "event: done\ndata: {}\n\n"
+
+
+async def frames_after(texts: List[str]) -> AsyncIterator[bytes]:
+    for i, text in enumerate(texts):
+        if i % 8 == 0:
+            yield thought_event(text)
+        else:
+            yield content_event(text)
+    yield DONE_EVENT
+
+
+async def receive() -> dict:
+    # Never reports a disconnect
+    await asyncio.Event().wait()
+    return {"type": "http.disconnect"}
+
+
+async def send(message: dict) -> None:
+    pass
+
+
+def scope(spec_version: str) -> dict:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": spec_version},
+    }
+
+
+async def run(
+    make_response: Callable, texts: List[str], spec_version: str
+) -> float:
+    """CPU seconds to stream ``texts`` through the response."""
+    started = time.process_time()
+    await make_response(texts)(scope(spec_version), receive, send)
+    return time.process_time() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--frames", type=int, default=100_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    texts = payloads(args.frames)
+    variants = {
+        "before": lambda t: StreamingResponse(
+            frames_before(t), media_type="text/event-stream"
+        ),
+        "typed json": lambda t: StreamingResponse(
+            frames_json(t), media_type="text/event-stream"
+        ),
+        "after": lambda t: SSEResponse(frames_after(t)),
+    }
+    print(f"{'ms CPU per 1k frames':24s} {'spec 2.3':>10s} {'spec 2.4':>10s}")
+    for name, make_response in variants.items():
+        cells = []
+        for spec_version in ("2.3", "2.4"):
+            best = min(
+                asyncio.run(run(make_response, texts, spec_version))
+                for _ in range(args.rounds)
+            )
+            cells.append(f"{best / args.frames * 1e6:10.3f}")
+        print(f"{name:24s} {' '.join(cells)}")
+
+
+if __name__ == "__main__":
+    main()
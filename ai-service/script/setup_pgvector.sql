@@ -29,3 +29,24 @@ CREATE TABLE IF NOT EXISTS documents (
     is_private BOOLEAN DEFAULT FALSE,
     created_at TIMESTAMP DEFAULT NOW()
 );
+
+-- Token usage of LLM calls (written in batches by the AI service)
+CREATE TABLE IF NOT EXISTS llm_usage (
+    id BIGSERIAL PRIMARY KEY,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    route VARCHAR(50) NOT NULL,
+    workspace_id VARCHAR(255),
+    user_id VARCHAR(255),
+    model VARCHAR(255) NOT NULL,
+    prompt_tokens INT NOT NULL DEFAULT 0,
+    completion_tokens INT NOT NULL DEFAULT 0,
+    total_tokens INT NOT NULL DEFAULT 0,
+    cached_tokens INT NOT NULL DEFAULT 0,
+    outcome VARCHAR(20) NOT NULL DEFAULT 'completed'
+);
+
+-- Tables created before the prompt cache accounting
+ALTER TABLE llm_usage ADD COLUMN IF NOT EXISTS cached_tokens INT NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS llm_usage_workspace_idx ON llm_usage (workspace_id, created_at);
+CREATE INDEX IF NOT EXISTS llm_usage_model_idx ON llm_usage (model, created_at);
@@ -0,0 +1,330 @@
+"""
+Admission control for LLM routes.
+
+Each pool bounds its concurrent calls overall and per key (model alias,
+or workspace for ingestion). Calls over the limit wait in a bounded FIFO
+queue; a call is rejected right away instead of timing out later when
+
+- the queue is full, or the expected queue wait (EWMA of slot hold
+  times) is past ``max_wait``: 429 with Retry-After;
+- it waited ``max_wait`` without getting a slot: 503 with Retry-After;
+- the event loop lags more than ``max_loop_lag`` while calls are
+  running: 503 (load shedding).
+
+Interactive routes (chat, streams, RAG queries) and ingestion (document
+processing) use separate pools so a batch of uploads cannot starve chat.
+"""
+import asyncio
+import inspect
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import (
+    Any, AsyncIterator, Callable, Deque, Dict, Optional, Tuple
+)
+
+from fastapi import HTTPException
+from loguru import logger
+
+from core.settings import settings
+from utils.loop_lag import loop_lag_monitor
+from utils.metrics import Counter, Gauge, Histogram
+
+ADMISSION_IN_FLIGHT = Gauge(
+    "admission_in_flight",
+    "Calls holding an admission slot",
+    ["pool"],
+)
+ADMISSION_QUEUED = Gauge(
+    "admission_queued",
+    "Calls waiting for an admission slot",
+    ["pool"],
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total",
+    "Calls rejected by admission control",
+    ["pool", "reason"],
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "admission_wait_seconds",
+    "Time spent waiting for an admission slot",
+    ["pool"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+# Weight of the newest sample in the slot hold time average
+_HOLD_ALPHA = 0.1
+
+
+class AdmissionRejected(HTTPException):
+    """The call was not admitted; the client should retry later."""
+
+    def __init__(
+        self, status_code: int, detail: str, retry_after: float
+    ) -> None:
+        super().__init__(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(max(math.ceil(retry_after), 1))},
+        )
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """An admission slot; release it exactly once."""
+
+    __slots__ = ("pool", "key", "granted", "_released")
+
+    def __init__(self, pool: "AdmissionPool", key: str) -> None:
+        self.pool = pool
+        self.key = key
+        self.granted = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self.pool._release(self.key, time.monotonic() - self.granted)
+
+
+class AdmissionPool:
+    """Concurrency limits with a bounded wait queue."""
+
+    def __init__(
+        self,
+        name: str,
+        enabled: bool,
+        limit: int,
+        key_limit: int,
+        max_queue: int,
+        max_wait: float,
+        max_loop_lag: float,
+    ) -> None:
+        self.name = name
+        self.enabled = enabled
+        self.limit = limit
+        self.key_limit = key_limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_loop_lag = max_loop_lag
+        self.active = 0
+        self._active_by_key: Dict[str, int] = {}
+        self._waiters: Deque[Tuple[str, asyncio.Future]] = deque()
+        self._hold: Optional[float] = None
+
+    def _has_room(self, key: str) -> bool:
+        return (
+            self.active < self.limit
+            and self._active_by_key.get(key, 0) < self.key_limit
+        )
+
+    def _grant(self, key: str) -> None:
+        self.active += 1
+        self._active_by_key[key] = self._active_by_key.get(key, 0) + 1
+        ADMISSION_IN_FLIGHT.labels(self.name).set(self.active)
+
+    def _expected_wait(self) -> float:
+        """Expected queue wait of a new call, from the average hold time."""
+        if self._hold is None:
+            return 0.0
+        return self._hold * (len(self._waiters) + 1) / self.limit
+
+    def _reject(
+        self, status_code: int, reason: str, retry_after: float
+    ) -> AdmissionRejected:
+        ADMISSION_REJECTED.labels(self.name, reason).inc()
+        logger.warning(
+            f"Admission rejected: pool={self.name}, reason={reason}, "
+            f"active={self.active}, queued={len(self._waiters)}"
+        )
+        return AdmissionRejected(
+            status_code, f"Service overloaded ({reason}), retry later",
+            retry_after,
+        )
+
+    async def acquire(self, key: str) -> Ticket:
+        """Wait for a slot for ``key``; raises AdmissionRejected."""
+        if not self.enabled:
+            return Ticket(self, key)
+        if self.active and loop_lag_monitor.lag > self.max_loop_lag:
+            raise self._reject(503, "event_loop_lag", 1.0)
+        if self._has_room(key):
+            self._grant(key)
+            ADMISSION_WAIT_SECONDS.labels(self.name).observe(0.0)
+            return Ticket(self, key)
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject(429, "queue_full", self._expected_wait())
+        expected = self._expected_wait()
+        if expected > self.max_wait:
+            raise self._reject(429, "queue_wait", expected)
+
+        started = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((key, waiter))
+        ADMISSION_QUEUED.labels(self.name).set(len(self._waiters))
+        try:
+            await asyncio.wait_for(waiter, self.max_wait)
+        except asyncio.TimeoutError:
+            self._abandon(key, waiter)
+            raise self._reject(503, "wait_timeout", self._expected_wait())
+        except BaseException:
+            self._abandon(key, waiter)
+            raise
+        ADMISSION_WAIT_SECONDS.labels(self.name).observe(
+            time.monotonic() - started
+        )
+        return Ticket(self, key)
+
+    def _abandon(self, key: str, waiter: asyncio.Future) -> None:
+        """Drop a waiter that gave up (give its slot back if granted)."""
+        if waiter.done() and not waiter.cancelled():
+            self._release(key, 0.0, observe=False)
+            return
+        try:
+            self._waiters.remove((key, waiter))
+        except ValueError:
+            pass
+        ADMISSION_QUEUED.labels(self.name).set(len(self._waiters))
+
+    def _release(
+        self, key: str, held: float, observe: bool = True
+    ) -> None:
+        if not self.enabled:
+            return
+        if observe:
+            self._hold = (
+                held if self._hold is None
+                else self._hold + _HOLD_ALPHA * (held - self._hold)
+            )
+        self.active = max(self.active - 1, 0)
+        remaining = self._active_by_key.get(key, 0) - 1
+        if remaining > 0:
+            self._active_by_key[key] = remaining
+        else:
+            self._active_by_key.pop(key, None)
+        self._wake()
+        ADMISSION_IN_FLIGHT.labels(self.name).set(self.active)
+
+    def _wake(self) -> None:
+        """Grant freed slots to the oldest waiters that fit."""
+        for entry in list(self._waiters):
+            if self.active >= self.limit:
+                break
+            key, waiter = entry
+            if waiter.done():
+                self._waiters.remove(entry)
+            elif self._has_room(key):
+                self._waiters.remove(entry)
+                self._grant(key)
+                waiter.set_result(None)
+        ADMISSION_QUEUED.labels(self.name).set(len(self._waiters))
+
+    @asynccontextmanager
+    async def admit(self, key: str) -> AsyncIterator[Ticket]:
+        """Hold a slot for the duration of the block."""
+        ticket = await self.acquire(key)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "limit": self.limit,
+            "active": self.active,
+            "active_by_key": dict(self._active_by_key),
+            "queued": len(self._waiters),
+            "avg_hold_seconds": (
+                round(self._hold, 3) if self._hold is not None else None
+            ),
+            "rejected": {
+                reason: child.value
+                for (pool, reason), child in ADMISSION_REJECTED.items()
+                if pool == self.name
+            },
+        }
+
+
+class _Admitted:
+    """Async iterator over ``frames`` that owns an admission ticket.
+
+    The ticket is released (and ``on_close`` run) once: when iteration
+    ends, or on ``aclose()`` even if iteration never started, so a
+    response that fails before its first frame gives the slot back.
+    """
+
+    __slots__ = ("ticket", "frames", "on_close", "_released")
+
+    def __init__(
+        self,
+        ticket: Ticket,
+        frames: AsyncIterator[Any],
+        on_close: Optional[Callable[[], Any]],
+    ) -> None:
+        self.ticket = ticket
+        self.frames = frames
+        self.on_close = on_close
+        self._released = False
+
+    def __aiter__(self) -> "_Admitted":
+        return self
+
+    async def __anext__(self) -> Any:
+        try:
+            return await self.frames.__anext__()
+        except BaseException:
+            await self._release()
+            raise
+
+    async def aclose(self) -> None:
+        try:
+            aclose = getattr(self.frames, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        finally:
+            await self._release()
+
+    async def _release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self.ticket.release()
+        if self.on_close is not None:
+            result = self.on_close()
+            if inspect.isawaitable(result):
+                await result
+
+
+def admitted(
+    ticket: Ticket,
+    frames: AsyncIterator[Any],
+    on_close: Optional[Callable[[], Any]] = None,
+) -> AsyncIterator[Any]:
+    """Yield from ``frames``, releasing ``ticket`` when the stream ends.
+
+    The stream must be closed (``aclose``) by its consumer even if it is
+    never iterated, e.g. by ``SSEResponse`` or ``ClosingStreamingResponse``.
+    """
+    return _Admitted(ticket, frames, on_close)
+
+
+interactive_pool = AdmissionPool(
+    "interactive",
+    enabled=settings.admission_enabled,
+    limit=settings.admission_interactive_limit,
+    key_limit=settings.admission_interactive_model_limit,
+    max_queue=settings.admission_interactive_queue,
+    max_wait=settings.admission_interactive_max_wait,
+    max_loop_lag=settings.admission_max_loop_lag,
+)
+ingestion_pool = AdmissionPool(
+    "ingestion",
+    enabled=settings.admission_enabled,
+    limit=settings.admission_ingestion_limit,
+    key_limit=settings.admission_ingestion_workspace_limit,
+    max_queue=settings.admission_ingestion_queue,
+    max_wait=settings.admission_ingestion_max_wait,
+    max_loop_lag=settings.admission_max_loop_lag,
+)
@@ -0,0 +1,324 @@
+"""
+Per-model circuit breakers.
+
+A model whose calls keep failing (errors, timeouts, 5xx/429) is cut off
+for a cool-down instead of making every request wait for the upstream
+timeout:
+
+- closed: calls go through; ``failure_threshold`` consecutive failures
+  open the circuit.
+- open: calls are rejected with ``CircuitOpenError`` until the cool-down
+  has passed (the chat handler reroutes to the configured fallback).
+- half-open: up to ``half_open_requests`` trial calls are let through;
+  a success closes the circuit, a failure opens it again.
+
+With ``shared=True`` an opened circuit is also written to Redis (with the
+cool-down as TTL) so the other replicas stop calling the model as well.
+"""
+import asyncio
+import time
+from typing import Any, Dict, Optional, Set
+
+import redis
+from loguru import logger
+
+from core.settings import settings
+from utils.metrics import MAX_LABEL_SETS, Counter, Gauge
+from utils.redis_client import get_redis_client
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+CIRCUIT_STATE = Gauge(
+    "llm_circuit_state",
+    "Circuit breaker state per model (0 closed, 1 half-open, 2 open)",
+    ["model"],
+)
+CIRCUIT_TRANSITIONS = Counter(
+    "llm_circuit_transitions_total",
+    "Circuit breaker state changes",
+    ["model", "state"],
+)
+CIRCUIT_REJECTIONS = Counter(
+    "llm_circuit_rejections_total",
+    "Calls rejected because the model's circuit was open",
+    ["model"],
+)
+
+
+class CircuitOpenError(Exception):
+    """The model's circuit is open; retry after ``retry_after`` seconds."""
+
+    def __init__(self, model: str, retry_after: float) -> None:
+        super().__init__(f"Circuit open for model {model}")
+        self.model = model
+        self.retry_after = retry_after
+
+
+def is_failure(exc: BaseException) -> bool:
+    """Whether ``exc`` says something about the model's health.
+
+    Client errors (bad request, auth, context length) do not count;
+    timeouts, rate limits, 5xx and connection errors do.
+    """
+    status = getattr(exc, "status_code", None)
+    if isinstance(status, int) and 400 <= status < 500:
+        return status in (408, 429)
+    return True
+
+
+class _Breaker:
+    """State of one model's circuit."""
+
+    __slots__ = ("state", "failures", "open_until", "trials",
+                 "trials_started", "synced")
+
+    def __init__(self) -> None:
+        self.state = CLOSED
+        self.failures = 0
+        self.open_until = 0.0
+        self.trials = 0
+        self.trials_started = 0.0
+        self.synced = 0.0
+
+
+class BreakerPermit:
+    """Permission for one call; reports its outcome exactly once."""
+
+    __slots__ = ("breakers", "model", "trial", "_done")
+
+    def __init__(
+        self, breakers: "CircuitBreakers", model: str, trial: bool
+    ) -> None:
+        self.breakers = breakers
+        self.model = model
+        self.trial = trial
+        self._done = False
+
+    def success(self) -> None:
+        if not self._done:
+            self._done = True
+            self.breakers._record(self, True)
+
+    def failure(self, exc: Optional[BaseException] = None) -> None:
+        """Record a failed call (ignored for client errors)."""
+        if self._done:
+            return
+        if exc is not None and not is_failure(exc):
+            self.success()
+            return
+        self._done = True
+        self.breakers._record(self, False)
+
+    def release(self) -> None:
+        """Give the permit back without an outcome (cancelled call)."""
+        if not self._done:
+            self._done = True
+            self.breakers._release(self)
+
+    def __enter__(self) -> "BreakerPermit":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.success()
+        elif issubclass(exc_type, Exception):
+            self.failure(exc)
+        else:
+            self.release()
+
+
+class CircuitBreakers:
+    """Circuit breakers keyed by model alias."""
+
+    KEY_PREFIX = "ai-service:circuit:"
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        enabled: bool,
+        failure_threshold: int,
+        cooldown: float,
+        half_open_requests: int,
+        shared: bool,
+        sync_interval: float,
+    ) -> None:
+        self.redis_client = redis_client
+        self.enabled = enabled
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.half_open_requests = half_open_requests
+        self.shared = shared
+        self.sync_interval = sync_interval
+        self._breakers: Dict[str, _Breaker] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _breaker(self, model: str) -> _Breaker:
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            if len(self._breakers) >= MAX_LABEL_SETS:
+                # Unbounded client-supplied names share one entry
+                model = "other"
+                breaker = self._breakers.get(model)
+            if breaker is None:
+                breaker = self._breakers[model] = _Breaker()
+        return breaker
+
+    def _transition(self, model: str, breaker: _Breaker, state: str) -> None:
+        if breaker.state == state:
+            return
+        breaker.state = state
+        CIRCUIT_STATE.labels(model).set(_STATE_VALUES[state])
+        CIRCUIT_TRANSITIONS.labels(model, state).inc()
+        log = logger.warning if state == OPEN else logger.info
+        log(f"Circuit for model {model} is now {state}")
+
+    def _open(self, model: str, breaker: _Breaker, cooldown: float) -> None:
+        breaker.open_until = time.monotonic() + cooldown
+        breaker.trials = 0
+        self._transition(model, breaker, OPEN)
+
+    def _retry_after(self, model: str) -> Optional[float]:
+        """Seconds until calls may go through again, None if they may now."""
+        breaker = self._breaker(model)
+        if breaker.state == CLOSED:
+            return None
+        now = time.monotonic()
+        if breaker.state == OPEN:
+            if now < breaker.open_until:
+                return breaker.open_until - now
+            self._transition(model, breaker, HALF_OPEN)
+        if (
+            breaker.trials
+            and now - breaker.trials_started > self.cooldown
+        ):
+            # Trials that never reported (e.g. a response never sent)
+            breaker.trials = 0
+        if breaker.trials < self.half_open_requests:
+            return None
+        return max(breaker.trials_started + self.cooldown - now, 1.0)
+
+    async def check(self, model: str) -> Optional[float]:
+        """Seconds to wait before calling ``model``, None if it is usable.
+
+        Also picks up circuits opened by other replicas (``shared``).
+        """
+        if not self.enabled:
+            return None
+        if self.shared:
+            await self._sync(model)
+        return self._retry_after(model)
+
+    def acquire(self, model: str) -> BreakerPermit:
+        """Permit for one call of ``model``; raises CircuitOpenError."""
+        if not self.enabled:
+            return BreakerPermit(self, model, False)
+        retry_after = self._retry_after(model)
+        if retry_after is not None:
+            CIRCUIT_REJECTIONS.labels(model).inc()
+            raise CircuitOpenError(model, retry_after)
+        breaker = self._breaker(model)
+        trial = breaker.state == HALF_OPEN
+        if trial:
+            if not breaker.trials:
+                breaker.trials_started = time.monotonic()
+            breaker.trials += 1
+        return BreakerPermit(self, model, trial)
+
+    def _record(self, permit: BreakerPermit, ok: bool) -> None:
+        if not self.enabled:
+            return
+        model = permit.model
+        breaker = self._breaker(model)
+        if permit.trial:
+            breaker.trials = max(breaker.trials - 1, 0)
+        if ok:
+            breaker.failures = 0
+            if permit.trial and breaker.state == HALF_OPEN:
+                self._transition(model, breaker, CLOSED)
+                self._publish(model, None)
+            return
+        breaker.failures += 1
+        if (permit.trial and breaker.state == HALF_OPEN) or (
+            breaker.state == CLOSED
+            and breaker.failures >= self.failure_threshold
+        ):
+            self._open(model, breaker, self.cooldown)
+            self._publish(model, time.time() + self.cooldown)
+
+    def _release(self, permit: BreakerPermit) -> None:
+        if self.enabled and permit.trial:
+            breaker = self._breaker(permit.model)
+            breaker.trials = max(breaker.trials - 1, 0)
+
+    async def _sync(self, model: str) -> None:
+        """Adopt an open circuit published by another replica."""
+        breaker = self._breaker(model)
+        now = time.monotonic()
+        if breaker.state == OPEN or now - breaker.synced < self.sync_interval:
+            return
+        breaker.synced = now
+        try:
+            value = await asyncio.to_thread(
+                self.redis_client.get, self.KEY_PREFIX + model
+            )
+        except redis.RedisError as e:
+            logger.debug(f"Circuit sync failed for {model}: {e}")
+            return
+        if value is None:
+            return
+        remaining = float(value) - time.time()
+        if remaining > 0 and breaker.state == CLOSED:
+            self._open(model, breaker, remaining)
+
+    def _publish(self, model: str, open_until: Optional[float]) -> None:
+        """Share an opened (or closed) circuit with the other replicas."""
+        if not self.shared:
+            return
+        task = asyncio.ensure_future(self._write(model, open_until))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _write(self, model: str, open_until: Optional[float]) -> None:
+        key = self.KEY_PREFIX + model
+        try:
+            if open_until is None:
+                await asyncio.to_thread(self.redis_client.delete, key)
+            else:
+                await asyncio.to_thread(
+                    self.redis_client.set, key, repr(open_until),
+                    px=max(int((open_until - time.time()) * 1000), 1),
+                )
+        except redis.RedisError as e:
+            logger.warning(f"Circuit publish failed for {model}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "enabled": self.enabled,
+            "shared": self.shared,
+            "models": {
+                model: {
+                    "state": breaker.state,
+                    "consecutive_failures": breaker.failures,
+                    "open_for": (
+                        round(breaker.open_until - now, 2)
+                        if breaker.state == OPEN else None
+                    ),
+                    "trials_in_flight": breaker.trials,
+                }
+                for model, breaker in self._breakers.items()
+            },
+            "rejections": CIRCUIT_REJECTIONS.values(),
+        }
+
+
+circuit_breakers = CircuitBreakers(
+    get_redis_client(),
+    enabled=settings.circuit_breaker_enabled,
+    failure_threshold=settings.circuit_breaker_failure_threshold,
+    cooldown=settings.circuit_breaker_cooldown,
+    half_open_requests=settings.circuit_breaker_half_open_requests,
+    shared=settings.circuit_breaker_shared,
+    sync_interval=settings.circuit_breaker_sync_interval,
+)
@@ -0,0 +1,233 @@
+"""
+Server-side conversation sessions.
+
+History is kept in Redis as zlib-compressed JSON with a sliding TTL, so
+clients only send the new turn. Every stored message carries its token
+count, computed once when appended, so budgeting never re-tokenizes the
+past.
+
+Writes are optimistic read-modify-write transactions (WATCH/MULTI): a
+turn is appended to the latest stored copy, so concurrent turns of one
+conversation (or a summary landing meanwhile) are never lost.
+"""
+import asyncio
+import uuid
+import zlib
+from typing import Callable, List, Literal, Optional, Tuple
+
+import redis
+from loguru import logger
+from pydantic import BaseModel, Field, PrivateAttr
+
+from core.settings import settings
+from services import token_budget
+from utils.redis_client import get_redis_binary_client
+
+# First line of the system message that carries the rolling summary
+SUMMARY_HEADER = "Summary of the earlier conversation:\n"
+
+
+def is_summary_message(content: str) -> bool:
+    """Whether a system message is the conversation summary."""
+    return content.startswith(SUMMARY_HEADER)
+
+
+class StoredMessage(BaseModel):
+    """A message of a stored conversation with its token count."""
+
+    role: Literal["system", "user", "assistant"]
+    content: str
+    tokens: int
+
+
+class Conversation(BaseModel):
+    """Conversation history kept server-side."""
+
+    id: str
+    tokenizer: str = Field(description="Model the token counts belong to")
+    messages: List[StoredMessage] = Field(default_factory=list)
+    summary: Optional[str] = Field(
+        default=None, description="Rolling summary of compacted turns"
+    )
+    summary_tokens: int = 0
+    workspace_id: Optional[str] = Field(
+        default=None, description="Workspace background work is billed to"
+    )
+    user_id: Optional[str] = None
+    # Messages appended since the conversation was loaded (not stored)
+    _appended: List[StoredMessage] = PrivateAttr(default_factory=list)
+
+    def append(self, role: str, content: str) -> StoredMessage:
+        """Append a message, counting its tokens once."""
+        message = StoredMessage(
+            role=role,
+            content=content,
+            tokens=token_budget.message_tokens(content, self.tokenizer),
+        )
+        self.messages.append(message)
+        self._appended.append(message)
+        return message
+
+    def retokenize(self, model: str) -> None:
+        """Recount tokens when the conversation switches model."""
+        if model == self.tokenizer:
+            return
+        self.tokenizer = model
+        for message in self.messages:
+            message.tokens = token_budget.message_tokens(
+                message.content, model
+            )
+        if self.summary:
+            self.summary_tokens = token_budget.message_tokens(
+                self.summary_message(), model
+            )
+
+    def set_summary(self, summary: str) -> None:
+        self.summary = summary
+        self.summary_tokens = token_budget.message_tokens(
+            self.summary_message(), self.tokenizer
+        )
+
+    def summary_message(self) -> str:
+        """Content of the system message that carries the summary."""
+        return f"{SUMMARY_HEADER}{self.summary}"
+
+    def history(self) -> List[Tuple[str, str, int]]:
+        """(role, content, tokens) to send: system, summary, then turns."""
+        entries = [(m.role, m.content, m.tokens) for m in self.messages]
+        if self.summary:
+            at = 0
+            while at < len(entries) and entries[at][0] == "system":
+                at += 1
+            entries.insert(
+                at, ("system", self.summary_message(), self.summary_tokens)
+            )
+        return entries
+
+
+class ConversationStore:
+    """Redis-backed, compressed conversation storage."""
+
+    KEY_PREFIX = "ai-service:conversation:"
+    # Attempts of a read-modify-write before giving up on contention
+    MAX_ATTEMPTS = 5
+
+    def __init__(
+        self, redis_client: redis.Redis, ttl: int, max_messages: int
+    ) -> None:
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.max_messages = max_messages
+
+    @staticmethod
+    def create(
+        model: str,
+        workspace_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+    ) -> Conversation:
+        """Start a new, empty conversation."""
+        return Conversation(
+            id=uuid.uuid4().hex, tokenizer=model,
+            workspace_id=workspace_id, user_id=user_id,
+        )
+
+    async def get(self, conversation_id: str) -> Optional[Conversation]:
+        """Load a conversation, or None if it does not exist/expired."""
+        raw = await asyncio.to_thread(
+            self.redis_client.get, self.KEY_PREFIX + conversation_id
+        )
+        if raw is None:
+            return None
+        return Conversation.model_validate_json(zlib.decompress(raw))
+
+    async def append_turns(self, conversation: Conversation) -> Conversation:
+        """Persist the messages appended since ``conversation`` was loaded.
+
+        They are added to the latest stored copy (a new or expired
+        conversation is stored as is). Returns the stored conversation.
+        """
+        turns = list(conversation._appended)
+
+        def change(current: Optional[Conversation]) -> Conversation:
+            if current is None:
+                return conversation
+            current.retokenize(conversation.tokenizer)
+            current.messages.extend(turns)
+            # Conversations stored before attribution was kept
+            current.workspace_id = (
+                current.workspace_id or conversation.workspace_id
+            )
+            current.user_id = current.user_id or conversation.user_id
+            return current
+
+        stored = await self.update(conversation.id, change)
+        conversation._appended.clear()
+        return stored
+
+    async def update(
+        self,
+        conversation_id: str,
+        change: Callable[[Optional[Conversation]], Optional[Conversation]],
+    ) -> Optional[Conversation]:
+        """Optimistic read-modify-write of a conversation.
+
+        ``change`` gets the stored conversation (None if missing) and
+        returns the conversation to store, or None to leave it as is. If
+        another writer got in between, it is re-run on the newer copy.
+
+        Raises:
+            redis.WatchError: Still contended after ``MAX_ATTEMPTS``
+        """
+        return await asyncio.to_thread(self._update, conversation_id, change)
+
+    def _update(
+        self,
+        conversation_id: str,
+        change: Callable[[Optional[Conversation]], Optional[Conversation]],
+    ) -> Optional[Conversation]:
+        key = self.KEY_PREFIX + conversation_id
+        for attempt in range(self.MAX_ATTEMPTS):
+            with self.redis_client.pipeline() as pipe:
+                try:
+                    pipe.watch(key)
+                    raw = pipe.get(key)
+                    current = (
+                        Conversation.model_validate_json(zlib.decompress(raw))
+                        if raw is not None else None
+                    )
+                    updated = change(current)
+                    if updated is None:
+                        return None
+                    blob = self._encode(updated)
+                    pipe.multi()
+                    pipe.setex(key, self.ttl, blob)
+                    pipe.execute()
+                except redis.WatchError:
+                    logger.debug(
+                        f"Conversation {conversation_id} changed while "
+                        f"updating (attempt {attempt + 1})"
+                    )
+                    continue
+            logger.debug(
+                f"Saved conversation {conversation_id}: "
+                f"messages={len(updated.messages)}, bytes={len(blob)}"
+            )
+            return updated
+        raise redis.WatchError(
+            f"Conversation {conversation_id} is updated concurrently"
+        )
+
+    def _encode(self, conversation: Conversation) -> bytes:
+        """Trim to ``max_messages`` and compress."""
+        if len(conversation.messages) > self.max_messages:
+            overflow = len(conversation.messages) - self.max_messages
+            del conversation.messages[:overflow]
+        return zlib.compress(
+            conversation.model_dump_json().encode("utf-8"), 6
+        )
+
+conversation_store = ConversationStore(
+    get_redis_binary_client(),
+    ttl=settings.conversation_ttl,
+    max_messages=settings.conversation_max_messages,
+)
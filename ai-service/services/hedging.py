@@ -0,0 +1,205 @@
+"""
+Hedged LLM requests.
+
+When the primary model has not answered (chat) or produced its first
+token (chat_stream) within its recent p90, the same request is also sent
+to the fallback configured in ``litellm_config.yaml``
+(``router_settings.fallbacks``, kept by the model registry). The first
+successful answer wins and the other call is cancelled.
+
+Extra requests are bounded by a per-route budget: every request deposits
+``ratio`` tokens (capped at ``burst``), a hedge costs one token, so at
+most ``ratio`` of the requests of a route are hedged over time.
+"""
+import asyncio
+import time
+from typing import (
+    Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+)
+
+from core.settings import settings
+from services.model_registry import model_registry
+from utils.metrics import Counter, RollingWindow
+
+T = TypeVar("T")
+
+HEDGES = Counter(
+    "llm_hedges_total",
+    "Hedge requests sent to a fallback model",
+    ["route", "model"],
+)
+HEDGE_WINS = Counter(
+    "llm_hedge_wins_total",
+    "Which call answered first in hedged requests",
+    ["route", "winner"],
+)
+HEDGES_SKIPPED = Counter(
+    "llm_hedges_skipped_total",
+    "Hedges not sent because the route's hedge budget was exhausted",
+    ["route"],
+)
+
+
+class HedgeBudget:
+    """Token bucket limiting hedges to a fraction of requests."""
+
+    __slots__ = ("ratio", "burst", "balance")
+
+    def __init__(self, ratio: float, burst: float) -> None:
+        self.ratio = ratio
+        self.burst = burst
+        self.balance = burst
+
+    def deposit(self) -> None:
+        self.balance = min(self.balance + self.ratio, self.burst)
+
+    def withdraw(self) -> bool:
+        if self.balance < 1.0:
+            return False
+        self.balance -= 1.0
+        return True
+
+
+class Hedger:
+    """Decides when to hedge and races primary against fallback."""
+
+    def __init__(
+        self,
+        enabled: bool,
+        quantile: float,
+        min_samples: int,
+        min_delay: float,
+        budget_ratio: float,
+        budget_burst: float,
+    ) -> None:
+        self.enabled = enabled
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.budget_ratio = budget_ratio
+        self.budget_burst = budget_burst
+        self._budgets: Dict[str, HedgeBudget] = {}
+
+    def _budget(self, route: str) -> HedgeBudget:
+        budget = self._budgets.get(route)
+        if budget is None:
+            budget = self._budgets[route] = HedgeBudget(
+                self.budget_ratio, self.budget_burst
+            )
+        return budget
+
+    @staticmethod
+    def fallback_for(model: str) -> Optional[str]:
+        targets = model_registry.fallbacks(model)
+        return targets[0] if targets else None
+
+    def plan(
+        self, route: str, model: str, window: RollingWindow
+    ) -> Optional[Tuple[str, float]]:
+        """(fallback, delay) if this request may be hedged, else None.
+
+        Call once per request: it also funds the route's hedge budget.
+        """
+        if not self.enabled:
+            return None
+        self._budget(route).deposit()
+        fallback = self.fallback_for(model)
+        if fallback is None or fallback == model:
+            return None
+        if len(window) < self.min_samples:
+            return None
+        return fallback, max(window.quantile(self.quantile), self.min_delay)
+
+    async def run(
+        self,
+        route: str,
+        model: str,
+        delay: float,
+        primary: Callable[[], Awaitable[T]],
+        fallback: Callable[[], Awaitable[T]],
+        window: RollingWindow,
+        discard: Optional[Callable[[T], Awaitable[Any]]] = None,
+    ) -> Tuple[T, bool]:
+        """Run ``primary``; after ``delay`` also ``fallback`` (budget allowing).
+
+        Returns (result, fallback_won). The losing call is cancelled; a
+        loser that already finished is passed to ``discard`` (e.g. to
+        close its stream).
+        """
+        started = time.monotonic()
+        first = asyncio.ensure_future(primary())
+        second: Optional[asyncio.Future] = None
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if done:
+                return first.result(), False
+            if not self._budget(route).withdraw():
+                HEDGES_SKIPPED.labels(route).inc()
+                return await first, False
+
+            HEDGES.labels(route, model).inc()
+            second = asyncio.ensure_future(fallback())
+            pending = {first, second}
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                # Prefer the primary when both finished together
+                for task in sorted(done, key=lambda t: t is not first):
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    fallback_won = task is second
+                    HEDGE_WINS.labels(
+                        route, "fallback" if fallback_won else "primary"
+                    ).inc()
+                    if fallback_won:
+                        # Censored sample: the primary took at least this long
+                        window.observe(time.monotonic() - started)
+                    self._discard(
+                        first if fallback_won else second, discard
+                    )
+                    return task.result(), fallback_won
+            raise error
+        except BaseException:
+            for task in (first, second):
+                if task is not None and not task.done():
+                    task.cancel()
+            raise
+
+    @staticmethod
+    def _discard(
+        loser: asyncio.Future,
+        discard: Optional[Callable[[Any], Awaitable[Any]]],
+    ) -> None:
+        """Cancel the losing call, or release its result if it finished."""
+        if not loser.done():
+            loser.cancel()
+        elif (
+            discard is not None and not loser.cancelled()
+            and loser.exception() is None
+        ):
+            asyncio.ensure_future(discard(loser.result()))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "budgets": {
+                route: round(budget.balance, 2)
+                for route, budget in self._budgets.items()
+            },
+            "hedges": HEDGES.values(),
+            "wins": HEDGE_WINS.values(),
+            "skipped": HEDGES_SKIPPED.values(),
+        }
+
+
+chat_hedger = Hedger(
+    enabled=settings.hedge_enabled,
+    quantile=settings.hedge_quantile,
+    min_samples=settings.hedge_min_samples,
+    min_delay=settings.hedge_min_delay,
+    budget_ratio=settings.hedge_budget_ratio,
+    budget_burst=settings.hedge_budget_burst,
+)
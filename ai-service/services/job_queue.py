@@ -0,0 +1,357 @@
+"""
+Asynchronous chat jobs.
+
+Long generations are submitted as jobs instead of holding an HTTP request
+open. Jobs live in Redis (reliable queue pattern):
+    - submit: job hash + LPUSH onto the queue list
+    - worker: BLMOVE queue -> processing (on an asyncio client, so idle
+      workers hold no executor threads), run, store result, LREM
+    - reaper: jobs whose lease expired in the processing list (their
+      replica died) are moved back onto the queue
+
+Results are kept with a TTL and can be long-polled or delivered to a
+webhook callback.
+"""
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+import redis
+import redis.asyncio
+from fastapi import HTTPException
+from loguru import logger
+
+from core.settings import settings
+from utils.redis_client import get_async_redis_client, get_redis_client
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+class _Timing:
+    """Running count/sum/max of a duration."""
+
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 3) if self.count else 0.0,
+            "max": round(self.max, 3),
+        }
+
+
+class ChatJobQueue:
+    """Redis-backed job queue with an in-process asyncio worker pool."""
+
+    QUEUE_KEY = "ai-service:chat-jobs:queue"
+    PROCESSING_KEY = "ai-service:chat-jobs:processing"
+    JOB_PREFIX = "ai-service:chat-job:"
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        blocking_client: redis.asyncio.Redis,
+        workers: int,
+        lease: float,
+        result_ttl: int,
+        max_attempts: int,
+        poll_interval: float,
+    ) -> None:
+        self.redis_client = redis_client
+        self.blocking_client = blocking_client
+        self.workers = workers
+        self.lease = lease
+        self.result_ttl = result_ttl
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self._runner: Optional[
+            Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+        ] = None
+        self._tasks: List[asyncio.Task] = []
+        self._running = 0
+        self._wait_time = _Timing()
+        self._run_time = _Timing()
+        self._counters = {"submitted": 0, "succeeded": 0, "failed": 0,
+                          "requeued": 0, "callbacks_failed": 0}
+
+    def start(
+        self, runner: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+    ) -> None:
+        """Start workers and the lease reaper on the running loop."""
+        if self._tasks:
+            return
+        self._runner = runner
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"chat-job-worker-{i}")
+            for i in range(self.workers)
+        ]
+        self._tasks.append(
+            asyncio.create_task(self._reaper(), name="chat-job-reaper")
+        )
+
+    async def stop(self) -> None:
+        """Stop workers. Unfinished jobs are recovered by lease expiry."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.blocking_client.aclose()
+
+    async def submit(
+        self, request: Dict[str, Any], callback_url: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Persist and enqueue a job; returns its initial state."""
+        job_id = uuid.uuid4().hex
+        job = {
+            "status": "queued",
+            "request": json.dumps(request, separators=(",", ":")),
+            "callback_url": callback_url or "",
+            "created_at": time.time(),
+            "attempts": 0,
+        }
+
+        def _enqueue() -> None:
+            pipe = self.redis_client.pipeline()
+            pipe.hset(self.JOB_PREFIX + job_id, mapping=job)
+            pipe.lpush(self.QUEUE_KEY, job_id)
+            pipe.execute()
+
+        await asyncio.to_thread(_enqueue)
+        self._counters["submitted"] += 1
+        return self._public(job_id, job)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Current job state, or None if unknown/expired."""
+        job = await asyncio.to_thread(
+            self.redis_client.hgetall, self.JOB_PREFIX + job_id
+        )
+        return self._public(job_id, job) if job else None
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Long-poll until the job is finished or ``timeout`` elapses."""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await self.get(job_id)
+            if job is None or job["status"] in TERMINAL_STATUSES:
+                return job
+            if time.monotonic() >= deadline:
+                return job
+            await asyncio.sleep(self.poll_interval)
+
+    @staticmethod
+    def _public(job_id: str, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Client-facing view of a job hash."""
+        def _float(name: str) -> Optional[float]:
+            value = job.get(name)
+            return float(value) if value not in (None, "") else None
+
+        status_code = job.get("status_code")
+        return {
+            "job_id": job_id,
+            "status": job.get("status", "queued"),
+            "created_at": _float("created_at"),
+            "started_at": _float("started_at"),
+            "finished_at": _float("finished_at"),
+            "result": json.loads(job["result"]) if job.get("result") else None,
+            "error": job.get("error") or None,
+            "status_code": int(status_code) if status_code else None,
+        }
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                job_id = await self.blocking_client.blmove(
+                    self.QUEUE_KEY, self.PROCESSING_KEY, 1, "RIGHT", "LEFT"
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as re:
+                logger.warning(f"Chat job queue unavailable: {re}")
+                await asyncio.sleep(1.0)
+                continue
+            if not job_id:
+                continue
+            try:
+                await self._process(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                # Left in processing: the reaper requeues it after its lease
+                logger.exception(f"Chat job {job_id} could not be run: {exc}")
+                await asyncio.sleep(1.0)
+
+    async def _process(self, job_id: str) -> None:
+        key = self.JOB_PREFIX + job_id
+        job = await asyncio.to_thread(self.redis_client.hgetall, key)
+        if not job or job.get("status") in TERMINAL_STATUSES:
+            await asyncio.to_thread(
+                self.redis_client.lrem, self.PROCESSING_KEY, 1, job_id
+            )
+            return
+
+        started_at = time.time()
+        self._wait_time.observe(started_at - float(job["created_at"]))
+        await asyncio.to_thread(self.redis_client.hset, key, mapping={
+            "status": "running",
+            "started_at": started_at,
+            "lease_until": started_at + self.lease,
+        })
+
+        heartbeat = asyncio.create_task(self._heartbeat(key))
+        self._running += 1
+        update: Dict[str, Any]
+        try:
+            result = await self._runner(json.loads(job["request"]))
+            update = {
+                "status": "succeeded",
+                "result": json.dumps(result, separators=(",", ":")),
+                "status_code": 200,
+            }
+        except HTTPException as exc:
+            update = {
+                "status": "failed",
+                "error": str(exc.detail),
+                "status_code": exc.status_code,
+            }
+        except asyncio.CancelledError:
+            # Shutdown: leave the job in processing for the reaper
+            raise
+        except Exception as exc:  # pragma: no cover - runtime protection
+            logger.exception(f"Chat job {job_id} failed: {exc}")
+            update = {"status": "failed", "error": str(exc), "status_code": 500}
+        finally:
+            self._running -= 1
+            heartbeat.cancel()
+
+        finished_at = time.time()
+        update["finished_at"] = finished_at
+        self._run_time.observe(finished_at - started_at)
+        self._counters[update["status"]] += 1
+
+        def _finish() -> None:
+            pipe = self.redis_client.pipeline()
+            pipe.hset(key, mapping=update)
+            pipe.hdel(key, "lease_until")
+            pipe.expire(key, self.result_ttl)
+            pipe.lrem(self.PROCESSING_KEY, 1, job_id)
+            pipe.execute()
+
+        await asyncio.to_thread(_finish)
+
+        if job.get("callback_url"):
+            await self._callback(job["callback_url"], job_id, {**job, **update})
+
+    async def _heartbeat(self, key: str) -> None:
+        """Extend the lease of a running job, retrying failed renewals."""
+        interval = self.lease / 3
+        delay = interval
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await asyncio.to_thread(
+                    self.redis_client.hset, key, "lease_until",
+                    time.time() + self.lease
+                )
+                delay = interval
+            except Exception as re:
+                logger.warning(f"Chat job lease renewal failed ({key}): {re}")
+                delay = min(1.0, interval)
+
+    async def _reaper(self) -> None:
+        """Requeue jobs whose worker died (lease expired)."""
+        while True:
+            await asyncio.sleep(self.lease / 2)
+            try:
+                await asyncio.to_thread(self._requeue_expired)
+            except Exception as re:
+                logger.warning(f"Chat job reaper failed: {re}")
+
+    def _requeue_expired(self) -> None:
+        now = time.time()
+        for job_id in self.redis_client.lrange(self.PROCESSING_KEY, 0, -1):
+            key = self.JOB_PREFIX + job_id
+            status, lease_until, created_at, attempts = self.redis_client.hmget(
+                key, "status", "lease_until", "created_at", "attempts"
+            )
+            if status in TERMINAL_STATUSES or status is None:
+                self.redis_client.lrem(self.PROCESSING_KEY, 1, job_id)
+                continue
+            # Jobs moved but never marked running get one lease from creation
+            expires = float(lease_until or float(created_at or 0) + self.lease)
+            if expires > now:
+                continue
+            # Only the reaper whose LREM succeeds requeues the job
+            if not self.redis_client.lrem(self.PROCESSING_KEY, 1, job_id):
+                continue
+            attempts = int(attempts or 0) + 1
+            if attempts >= self.max_attempts:
+                self.redis_client.hset(key, mapping={
+                    "status": "failed",
+                    "error": "Job abandoned after worker failures",
+                    "status_code": 500,
+                    "finished_at": now,
+                    "attempts": attempts,
+                })
+                self.redis_client.expire(key, self.result_ttl)
+                continue
+            self.redis_client.hset(key, mapping={
+                "status": "queued", "attempts": attempts
+            })
+            self.redis_client.rpush(self.QUEUE_KEY, job_id)
+            self._counters["requeued"] += 1
+            logger.warning(f"Requeued chat job {job_id} (attempt {attempts})")
+
+    async def _callback(
+        self, url: str, job_id: str, job: Dict[str, Any]
+    ) -> None:
+        try:
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                response = await client.post(url, json=self._public(job_id, job))
+                response.raise_for_status()
+        except Exception as exc:
+            self._counters["callbacks_failed"] += 1
+            logger.warning(f"Chat job {job_id} callback to {url} failed: {exc}")
+
+    async def stats(self) -> Dict[str, Any]:
+        """Queue depth, wait/run times and job counters."""
+        try:
+            depth, processing = await asyncio.to_thread(
+                lambda: (
+                    self.redis_client.llen(self.QUEUE_KEY),
+                    self.redis_client.llen(self.PROCESSING_KEY),
+                )
+            )
+        except Exception:
+            depth = processing = None
+        return {
+            **self._counters,
+            "queue_depth": depth,
+            "processing": processing,
+            "running_local": self._running,
+            "wait_seconds": self._wait_time.summary(),
+            "run_seconds": self._run_time.summary(),
+        }
+
+
+chat_job_queue = ChatJobQueue(
+    get_redis_client(),
+    get_async_redis_client(),
+    workers=settings.chat_job_workers,
+    lease=settings.chat_job_lease,
+    result_ttl=settings.chat_job_result_ttl,
+    max_attempts=settings.chat_job_max_attempts,
+    poll_interval=settings.chat_job_poll_interval,
+)
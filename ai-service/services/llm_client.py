@@ -0,0 +1,151 @@
+"""
+Shared HTTP transport for every call routed through the LiteLLM Proxy.
+
+A single ``httpx.AsyncClient`` (wrapped in an ``openai.AsyncOpenAI`` client,
+which is what LiteLLM expects for ``openai/*`` models) is owned by the
+application lifecycle so that TCP/TLS connections to the proxy are pooled
+and kept alive between requests instead of being re-established per call.
+"""
+import importlib.util
+from typing import Any, Dict, Optional
+
+import httpx
+from loguru import logger
+from openai import AsyncOpenAI
+
+from core.settings import settings
+from utils.deadline import remaining
+
+
+class _CountingTransport(httpx.AsyncHTTPTransport):
+    """AsyncHTTPTransport that records request and new-connection counts."""
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.requests_total = 0
+        self.connections_opened = 0
+
+    async def handle_async_request(
+        self, request: httpx.Request
+    ) -> httpx.Response:
+        self.requests_total += 1
+        previous_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            # httpcore emits connect_tcp events only when a new connection
+            # is opened, so everything else was served by a pooled one.
+            if event_name == "connection.connect_tcp.complete":
+                self.connections_opened += 1
+            if previous_trace is not None:
+                await previous_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        return await super().handle_async_request(request)
+
+    def pool_snapshot(self) -> Dict[str, int]:
+        """Return current open/idle connection counts of the pool."""
+        pool = getattr(self, "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {"open": len(connections), "idle": idle}
+
+
+class LLMClientPool:
+    """Lifecycle-owned async client pool for the LiteLLM Proxy."""
+
+    def __init__(self) -> None:
+        self._transport: Optional[_CountingTransport] = None
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._client: Optional[AsyncOpenAI] = None
+        self.http2_enabled = False
+
+    async def start(self) -> None:
+        """Create the pooled client. Safe to call more than once."""
+        if self._client is not None:
+            return
+
+        # HTTP/2 needs the optional ``h2`` package.
+        self.http2_enabled = (
+            settings.llm_http2 and importlib.util.find_spec("h2") is not None
+        )
+        limits = httpx.Limits(
+            max_connections=settings.llm_pool_max_connections,
+            max_keepalive_connections=settings.llm_pool_max_keepalive,
+            keepalive_expiry=settings.llm_pool_keepalive_expiry,
+        )
+        timeout = httpx.Timeout(
+            settings.llm_request_timeout,
+            connect=settings.llm_connect_timeout,
+        )
+        self._transport = _CountingTransport(
+            limits=limits, http2=self.http2_enabled, retries=1
+        )
+        self._http_client = httpx.AsyncClient(
+            transport=self._transport, timeout=timeout
+        )
+        self._client = AsyncOpenAI(
+            base_url=settings.litellm_proxy_url,
+            api_key=settings.litellm_master_key,
+            http_client=self._http_client,
+            max_retries=0,
+        )
+        logger.info(
+            f"LLM client pool started: proxy={settings.litellm_proxy_url}, "
+            f"max_connections={settings.llm_pool_max_connections}, "
+            f"keepalive={settings.llm_pool_max_keepalive}, "
+            f"http2={self.http2_enabled}"
+        )
+
+    async def aclose(self) -> None:
+        """Close pooled connections."""
+        if self._client is not None:
+            await self._client.close()
+        self._client = None
+        self._http_client = None
+        self._transport = None
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """Return the shared ``AsyncOpenAI`` client for LiteLLM calls."""
+        if self._client is None:
+            raise RuntimeError("LLM client pool has not been started")
+        return self._client
+
+    def completion_kwargs(self) -> Dict[str, Any]:
+        """
+        Keyword arguments that route a LiteLLM call through the pool.
+
+        Inside a request the call's timeout is capped by the time the
+        request has left (``utils.deadline``).
+        """
+        kwargs: Dict[str, Any] = {
+            "api_base": settings.litellm_proxy_url,
+            "api_key": settings.litellm_master_key,
+            "client": self.client,
+        }
+        left = remaining()
+        if left is not None:
+            kwargs["timeout"] = max(min(left, settings.llm_request_timeout), 0.1)
+        return kwargs
+
+    def stats(self) -> Dict[str, Any]:
+        """Connection reuse statistics."""
+        if self._transport is None:
+            return {"started": False}
+        requests_total = self._transport.requests_total
+        opened = self._transport.connections_opened
+        reused = max(requests_total - opened, 0)
+        return {
+            "started": True,
+            "http2": self.http2_enabled,
+            "requests_total": requests_total,
+            "connections_opened": opened,
+            "requests_reused": reused,
+            "reuse_ratio": (
+                round(reused / requests_total, 4) if requests_total else 0.0
+            ),
+            "pool": self._transport.pool_snapshot(),
+        }
+
+
+llm_client = LLMClientPool()
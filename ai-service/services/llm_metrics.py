@@ -0,0 +1,87 @@
+"""
+Upstream LLM call metrics: latency, errors and token usage per model.
+
+Prompt tokens served from the provider's prompt cache are counted as
+``kind="cached"`` (a subset of ``prompt``).
+"""
+from typing import Any, Dict, Optional
+
+from utils.metrics import Counter, Histogram, RollingWindows
+
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_duration_seconds",
+    "Upstream LLM call duration (full completion or full stream)",
+    ["model", "mode"],
+    buckets=(0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0),
+)
+LLM_ERRORS = Counter(
+    "llm_errors_total",
+    "Failed upstream LLM calls",
+    ["model", "error_type"],
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens used by upstream LLM calls",
+    ["model", "kind"],
+)
+
+# Recent non-streamed completion latencies per model (hedging thresholds)
+RECENT_LATENCY = RollingWindows()
+
+
+def observe_call(model: str, mode: str, seconds: float) -> None:
+    """Record the duration of a finished upstream call."""
+    LLM_REQUEST_SECONDS.labels(model, mode).observe(seconds)
+    if mode == "complete":
+        RECENT_LATENCY.get(model).observe(seconds)
+
+
+def record_error(model: str, exc: BaseException) -> None:
+    LLM_ERRORS.labels(model, type(exc).__name__).inc()
+
+
+def cached_tokens(usage: Any) -> int:
+    """Prompt tokens the provider read from its prompt cache."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(details, dict):
+        return int(details.get("cached_tokens") or 0)
+    return int(getattr(details, "cached_tokens", None) or 0)
+
+
+def record_usage(
+    model: str,
+    usage: Any = None,
+    prompt_tokens: Optional[int] = None,
+    completion_tokens: Optional[int] = None,
+) -> None:
+    """Record token usage from a usage object or explicit counts."""
+    if usage is not None:
+        cached = cached_tokens(usage)
+        if cached:
+            LLM_TOKENS.labels(model, "cached").inc(cached)
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or prompt_tokens
+        completion_tokens = (
+            getattr(usage, "completion_tokens", None) or completion_tokens
+        )
+    if prompt_tokens:
+        LLM_TOKENS.labels(model, "prompt").inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels(model, "completion").inc(completion_tokens)
+
+
+def prompt_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Per model: prompt tokens, cached prompt tokens and their ratio."""
+    tokens: Dict[str, Dict[str, float]] = {}
+    for (model, kind), child in LLM_TOKENS.items():
+        tokens.setdefault(model, {})[kind] = child.value
+    return {
+        model: {
+            "prompt_tokens": int(kinds.get("prompt", 0)),
+            "cached_tokens": int(kinds.get("cached", 0)),
+            "cached_ratio": (
+                round(kinds.get("cached", 0) / kinds["prompt"], 4)
+                if kinds.get("prompt") else None
+            ),
+        }
+        for model, kinds in tokens.items()
+    }
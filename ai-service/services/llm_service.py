@@ -1,7 +1,19 @@
+import asyncio
 import os
 from opik import track, Opik
-from litellm import completion
-from typing import AsyncGenerator, Dict, Any
+from litellm import acompletion
+from typing import AsyncGenerator, Dict, Any, Tuple
+
+from loguru import logger
+
+from services import llm_metrics, prompt_layout, token_budget
+from services.llm_client import llm_client
+from services.model_registry import model_registry
+from services.model_router import model_router
+from services.rate_limiter import Reservation, rate_limiter
+from services.usage_recorder import usage_recorder
+from services.stream_metrics import StreamTimer, format_summary
+from services.stream_writer import close_upstream
 
 class LLMService:
     def __init__(self):
@@ -16,39 +28,131 @@ class LLMService:
         prompt: str,
         context: str = "",
         model_tier: str = "default",
-        workspace_id: str = None
+        workspace_id: str = None,
+        user_id: str = None,
+        reservation: Reservation = None,
+        model: str = None
     ) -> AsyncGenerator[str, None]:
         
-        system_prompt = self._build_system_prompt()
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Context:\n{context}\n\nPrompt: {prompt}"}
-        ]
-        
-        # Default = Proxy routing.
-        import litellm
-        litellm.api_base = os.getenv("LITELLM_PROXY_URL", "http://litellm-proxy:4000")
-        litellm.api_key = os.getenv("LITELLM_MASTER_KEY", "sk-1234")
-
-        response = await completion(
-            model=self._get_model(model_tier),
-            messages=messages,
-            stream=True,
-            metadata={
-                "workspace_id": workspace_id,
-                "context_length": len(context),
-                "model_tier": model_tier
-            }
+        # Schema and workspace context first: a stable, cacheable prefix
+        messages, prefix_len = prompt_layout.layout_blocks(
+            self._build_system_prompt(), context, prompt
         )
         
+        # Default = Proxy routing through the shared pooled client.
+        # Sticky per workspace, so its prompt prefix stays cached.
+        model = model or self._get_model(model_tier, workspace_id)
+        alias = model.split("/", 1)[-1]
+        caps = model_registry.get(alias)
+        prompt_tokens = self._prompt_tokens(messages, alias)
+        if reservation is None:
+            # Workspace/user request and token limits (raises 429)
+            reservation = await rate_limiter.acquire(
+                workspace_id, user_id, rate_limiter.estimate(prompt_tokens)
+            )
+        timer = StreamTimer(alias)
         full_response = ""
-        async for chunk in response:
-            if chunk and chunk.choices and chunk.choices[0].delta.content:
-                content = chunk.choices[0].delta.content
-                full_response += content
-                yield content
+        response = None
+        usage = None
+        outcome = "failed"
+        try:
+            response = await acompletion(
+                model=model,
+                messages=prompt_layout.apply_cache_control(
+                    caps.transform_messages(messages), alias, prefix_len
+                ),
+                # Final chunk carries the token usage
+                **caps.stream_kwargs(),
+                metadata={
+                    "workspace_id": workspace_id,
+                    "context_length": len(context),
+                    "model_tier": model_tier
+                },
+                **llm_client.completion_kwargs()
+            )
+            timer.connected()
+
+            async for chunk in response:
+                usage = getattr(chunk, "usage", None) or usage
+                if chunk and chunk.choices and chunk.choices[0].delta.content:
+                    timer.token()
+                    content = chunk.choices[0].delta.content
+                    full_response += content
+                    yield content
+            outcome = "completed"
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "abandoned"
+            # Consumer stopped reading (client disconnected)
+            logger.info(
+                f"Block stream abandoned: "
+                f"{format_summary(timer.finish('abandoned'))}"
+            )
+            raise
+        except Exception as exc:
+            llm_metrics.record_error(timer.model, exc)
+            logger.warning(
+                f"Block stream failed: type={type(exc).__name__}, "
+                f"{format_summary(timer.finish('failed'))}"
+            )
+            raise
+        finally:
+            # Also runs on aclose() when the consumer stops early
+            await asyncio.shield(close_upstream(response))
+            # Replace the estimate with the usage the provider reported
+            await asyncio.shield(reservation.reconcile(
+                getattr(usage, "total_tokens", None)
+                or prompt_tokens + timer.tokens
+            ))
+            usage_recorder.record(
+                "generate_blocks", timer.model, usage,
+                workspace_id=workspace_id, user_id=user_id,
+                prompt_tokens=prompt_tokens, completion_tokens=timer.tokens,
+                outcome=outcome,
+            )
+        logger.debug(f"Block stream completed: {format_summary(timer.finish())}")
+        llm_metrics.record_usage(
+            timer.model, usage, completion_tokens=timer.tokens
+        )
     
-    def _get_model(self, model_tier: str) -> str:
+    async def reserve(
+        self,
+        prompt: str,
+        context: str = "",
+        model_tier: str = "default",
+        workspace_id: str = None,
+        user_id: str = None
+    ) -> Tuple[str, Reservation]:
+        """Choose the model and charge the rate limits up front.
+
+        Lets a streaming route reject with 429 before its response starts;
+        pass both on to generate_blocks, which calls that model and
+        reconciles the reservation.
+        """
+        messages, _ = prompt_layout.layout_blocks(
+            self._build_system_prompt(), context, prompt
+        )
+        model = self._get_model(model_tier, workspace_id)
+        reservation = await rate_limiter.acquire(
+            workspace_id, user_id,
+            rate_limiter.estimate(
+                self._prompt_tokens(messages, model.split("/", 1)[-1])
+            ),
+        )
+        return model, reservation
+
+    @staticmethod
+    def _prompt_tokens(messages: list, alias: str) -> int:
+        return sum(
+            token_budget.message_tokens(m["content"], alias) for m in messages
+        )
+
+    @staticmethod
+    def _get_model(model_tier: str, affinity: str = None) -> str:
+        # Pick among the models tagged with this tier in litellm_config.yaml
+        # (metadata.tiers) by live latency, errors and load.
+        model = model_router.choose(model_tier, affinity)
+        if model:
+            return f"openai/{model}"
         # default = Google Gemini (free). Fallbacks: OpenAI, Azure via LiteLLM.
         # These aliases must match what is defined in litellm_config.yaml (router_settings)
         tier_map = {
@@ -0,0 +1,241 @@
+"""
+Model capability registry.
+
+Everything the service needs to know about a model alias (context
+window, output limit, tokenizer, reasoning, system-role support, stream
+quirks, tiers, prompt caching) is read from the ``metadata`` of each
+model in ``litellm_config.yaml`` once and kept as ``ModelCapabilities``,
+along with ``router_settings.fallbacks``, so request paths do a dict
+lookup instead of parsing YAML or sniffing model names. Aliases missing
+from the config get capabilities inferred from their name, also computed
+once.
+
+The config is re-read when its mtime changes (checked at most every
+``model_registry_reload_interval`` seconds, on lookup); ``version`` is
+bumped on every reload so derived caches know when to rebuild.
+"""
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import yaml
+from loguru import logger
+
+from core.settings import settings
+
+Message = Dict[str, Any]
+
+# Name fragments of reasoning models without ``supports_thinking``
+_REASONING_MARKERS = ("reasoner", "thinking", "o1", "o3")
+# ... and of models that reject the system role
+_NO_SYSTEM_ROLE_MARKERS = ("o1-", "o3-")
+
+# Reasoning models spend part of the output budget on thinking
+REASONING_MIN_OUTPUT_TOKENS = 16384
+
+_PROVIDER_NAMES = {
+    "azure": "Azure OpenAI (GPT)",
+    "gemini": "Google Gemini",
+    "openai": "OpenAI",
+    "anthropic": "Anthropic Claude",
+    "vertex_ai": "Google Vertex AI",
+}
+
+# Unknown aliases (client-supplied model names) kept at most
+_MAX_INFERRED = 256
+
+
+def _keep(messages: List[Message]) -> List[Message]:
+    return messages
+
+
+def _system_as_user(messages: List[Message]) -> List[Message]:
+    """Rewrite system messages as prefixed user messages."""
+    return [
+        {
+            "role": "user",
+            "content": f"[SYSTEM INSTRUCTION]\n{msg['content']}",
+        } if msg["role"] == "system" else msg
+        for msg in messages
+    ]
+
+
+class ModelCapabilities:
+    """What one model alias supports (immutable once built)."""
+
+    __slots__ = (
+        "name", "full_name", "provider", "context_window",
+        "max_output_tokens", "tokenizer", "supports_thinking",
+        "supports_system_role", "stream_usage", "cache_control",
+        "cache_min_tokens", "tiers", "metadata", "transform_messages",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        full_name: str = "",
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        metadata = metadata or {}
+        self.name = name
+        self.full_name = full_name or name
+        self.provider = _provider(self.full_name)
+        self.metadata = metadata
+        self.context_window: Optional[int] = _int(
+            metadata.get("context_window")
+        )
+        self.max_output_tokens: Optional[int] = _int(
+            metadata.get("max_output_tokens")
+        )
+        self.tokenizer: Optional[str] = metadata.get("tokenizer")
+        self.supports_thinking = bool(metadata.get(
+            "supports_thinking",
+            any(marker in name for marker in _REASONING_MARKERS),
+        ))
+        self.supports_system_role = bool(metadata.get(
+            "supports_system_role",
+            not any(marker in name for marker in _NO_SYSTEM_ROLE_MARKERS),
+        ))
+        # Whether streams honour stream_options.include_usage
+        self.stream_usage = bool(metadata.get("stream_usage", True))
+        self.cache_control = bool(metadata.get("cache_control", False))
+        self.cache_min_tokens: Optional[int] = _int(
+            metadata.get("cache_min_tokens")
+        )
+        self.tiers: List[str] = list(metadata.get("tiers") or [])
+        self.transform_messages: Callable[[List[Message]], List[Message]] = (
+            _keep if self.supports_system_role else _system_as_user
+        )
+
+    def min_output_tokens(self) -> Optional[int]:
+        """Output tokens a request needs at least (reasoning models)."""
+        return REASONING_MIN_OUTPUT_TOKENS if self.supports_thinking else None
+
+    def stream_kwargs(self) -> Dict[str, Any]:
+        """Completion kwargs of a stream (usage on the final chunk)."""
+        if self.stream_usage:
+            return {"stream": True, "stream_options": {"include_usage": True}}
+        return {"stream": True}
+
+
+def _int(value: Any) -> Optional[int]:
+    return int(value) if value else None
+
+
+def _provider(full_name: str) -> str:
+    if "/" not in full_name:
+        return "unknown"
+    raw = full_name.split("/")[0].lower()
+    return _PROVIDER_NAMES.get(raw, raw.capitalize())
+
+
+class ModelRegistry:
+    """Capabilities per alias from the LiteLLM config, hot-reloaded."""
+
+    def __init__(self, config_path: str, reload_interval: float) -> None:
+        self.config_path = config_path
+        self.reload_interval = reload_interval
+        self.version = 0
+        self._models: Dict[str, ModelCapabilities] = {}
+        self._inferred: Dict[str, ModelCapabilities] = {}
+        self._tiers: Dict[str, List[str]] = {}
+        self._fallbacks: Dict[str, List[str]] = {}
+        self._mtime: Optional[float] = None
+        self._checked = 0.0
+        self._loaded = False
+
+    def load(self) -> None:
+        """(Re)read the config; keeps the current models if it fails."""
+        try:
+            mtime = os.path.getmtime(self.config_path)
+            with open(self.config_path, "r") as f:
+                config = yaml.safe_load(f) or {}
+        except (OSError, yaml.YAMLError) as e:
+            logger.warning(
+                f"Model registry: cannot read {self.config_path}: {e}"
+            )
+            self._loaded = True
+            return
+
+        models: Dict[str, ModelCapabilities] = {}
+        for m in config.get("model_list", []):
+            name = m.get("model_name")
+            if name and name not in models:
+                models[name] = ModelCapabilities(
+                    name,
+                    (m.get("litellm_params") or {}).get("model", ""),
+                    m.get("metadata") or {},
+                )
+        tiers: Dict[str, List[str]] = {}
+        for name, caps in models.items():
+            for tier in caps.tiers:
+                tiers.setdefault(tier, []).append(name)
+        fallbacks: Dict[str, List[str]] = {}
+        router_settings = config.get("router_settings") or {}
+        for entry in router_settings.get("fallbacks") or []:
+            for name, targets in (entry or {}).items():
+                fallbacks.setdefault(name, []).extend(targets or [])
+
+        self._models = models
+        self._tiers = tiers
+        self._fallbacks = fallbacks
+        self._inferred = {}
+        self._mtime = mtime
+        self._loaded = True
+        self.version += 1
+        logger.info(
+            f"Model registry loaded: {len(models)} models "
+            f"(version {self.version})"
+        )
+
+    def _refresh(self) -> None:
+        """Load on first use, reload when the config file changed."""
+        if not self._loaded:
+            self.load()
+            self._checked = time.monotonic()
+            return
+        if self.reload_interval <= 0:
+            return
+        now = time.monotonic()
+        if now - self._checked < self.reload_interval:
+            return
+        self._checked = now
+        try:
+            mtime = os.path.getmtime(self.config_path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.load()
+
+    def get(self, model: str) -> ModelCapabilities:
+        """Capabilities of ``model`` (inferred from the name if unknown)."""
+        self._refresh()
+        caps = self._models.get(model)
+        if caps is None:
+            caps = self._inferred.get(model)
+            if caps is None:
+                if len(self._inferred) >= _MAX_INFERRED:
+                    self._inferred.clear()
+                caps = self._inferred[model] = ModelCapabilities(model)
+        return caps
+
+    def models(self) -> List[ModelCapabilities]:
+        """Configured models, in config order."""
+        self._refresh()
+        return list(self._models.values())
+
+    def tiers(self) -> Dict[str, List[str]]:
+        """Tier -> model aliases tagged with it."""
+        self._refresh()
+        return self._tiers
+
+    def fallbacks(self, model: str) -> List[str]:
+        """``router_settings.fallbacks`` configured for ``model``."""
+        self._refresh()
+        return self._fallbacks.get(model, [])
+
+
+model_registry = ModelRegistry(
+    config_path=os.getenv("LITELLM_CONFIG_PATH", "litellm_config.yaml"),
+    reload_interval=settings.model_registry_reload_interval,
+)
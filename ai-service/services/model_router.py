@@ -0,0 +1,253 @@
+"""
+Client-side, latency- and error-aware model router.
+
+The proxy's ``simple-shuffle`` ignores how each deployment is doing.
+For tier requests (``default``/``smart``/``fast``, see
+``LLMService._get_model``) the router picks among the models whose
+``metadata.tiers`` in ``litellm_config.yaml`` list that tier, using
+power-of-two-choices: two random candidates are compared and the one
+with the lower expected cost wins.
+
+Per model it keeps an EWMA of latency (non-streamed calls), TTFT
+(streams), error rate and the number of in-flight calls. The cost is
+
+    expected_latency * (1 + in_flight) * (1 + error_penalty * error_rate)
+
+where the error rate decays over time, so a model that failed recovers
+once it stops failing instead of being starved forever.
+
+Requests with an affinity key (the workspace) stick to one model of the
+tier while it is not much worse than the best, so they keep hitting the
+same provider prompt cache.
+"""
+import hashlib
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from core.settings import settings
+from services.model_registry import model_registry
+from utils.metrics import MAX_LABEL_SETS
+
+
+class _ModelState:
+    """Live statistics of one model alias."""
+
+    __slots__ = ("latency", "ttft", "error_rate", "error_updated",
+                 "in_flight", "requests", "errors")
+
+    def __init__(self) -> None:
+        self.latency: Optional[float] = None
+        self.ttft: Optional[float] = None
+        self.error_rate = 0.0
+        self.error_updated = time.monotonic()
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+
+
+def _rendezvous(key: str, model: str) -> int:
+    """Stable weight of ``model`` for ``key`` (highest random weight)."""
+    digest = hashlib.blake2b(f"{key}\0{model}".encode(), digest_size=8)
+    return int.from_bytes(digest.digest(), "big")
+
+
+class RouterCall:
+    """One in-flight call of a model; end it exactly once."""
+
+    __slots__ = ("router", "model", "started", "_ended")
+
+    def __init__(self, router: "ModelRouter", model: str) -> None:
+        self.router = router
+        self.model = model
+        self.started = time.monotonic()
+        self._ended = False
+
+    def first_token(self) -> None:
+        """Record TTFT (streams)."""
+        self.router._observe(
+            self.model, ttft=time.monotonic() - self.started
+        )
+
+    def end(self, outcome: str = "ok", record_latency: bool = True) -> None:
+        """Release the call.
+
+        ``outcome`` is ``ok``, ``error`` or ``cancelled`` (neither a
+        success nor a model error). Streams pass ``record_latency=False``:
+        their duration depends on the answer length, TTFT is their signal.
+        """
+        if self._ended:
+            return
+        self._ended = True
+        latency = time.monotonic() - self.started if record_latency else None
+        self.router._finish(self.model, outcome, latency)
+
+    def __enter__(self) -> "RouterCall":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.end()
+        elif issubclass(exc_type, Exception):
+            self.end("error")
+        else:
+            self.end("cancelled")
+
+
+class ModelRouter:
+    """Pick a model per tier with power-of-two-choices."""
+
+    def __init__(
+        self,
+        enabled: bool,
+        alpha: float,
+        error_penalty: float,
+        error_half_life: float,
+        prior_latency: float,
+        sticky_slack: float,
+    ) -> None:
+        self.enabled = enabled
+        self.alpha = alpha
+        self.error_penalty = error_penalty
+        self.error_half_life = error_half_life
+        self.prior_latency = prior_latency
+        self.sticky_slack = sticky_slack
+        self._models: Dict[str, _ModelState] = {}
+
+    def tiers(self) -> Dict[str, List[str]]:
+        """Tier -> model aliases, from the LiteLLM config metadata."""
+        return model_registry.tiers()
+
+    def _key(self, model: str) -> str:
+        """State key of ``model``, the same for recording and choosing.
+
+        Past ``MAX_LABEL_SETS`` unbounded client-supplied names share
+        "other"; models of a tier always keep their own state.
+        """
+        if model in self._models or len(self._models) < MAX_LABEL_SETS:
+            return model
+        if any(model in models for models in self.tiers().values()):
+            return model
+        return "other"
+
+    def _state(self, model: str) -> _ModelState:
+        key = self._key(model)
+        state = self._models.get(key)
+        if state is None:
+            state = self._models[key] = _ModelState()
+        return state
+
+    def _error_rate(self, state: _ModelState, now: float) -> float:
+        age = now - state.error_updated
+        return state.error_rate * 0.5 ** (age / self.error_half_life)
+
+    def _cost(self, model: str, now: float) -> float:
+        state = self._models.get(self._key(model))
+        if state is None:
+            return self.prior_latency
+        expected = state.ttft if state.ttft is not None else state.latency
+        if expected is None:
+            expected = self.prior_latency
+        return (
+            expected
+            * (1 + state.in_flight)
+            * (1 + self.error_penalty * self._error_rate(state, now))
+        )
+
+    def choose(
+        self, tier: str, affinity: Optional[str] = None
+    ) -> Optional[str]:
+        """Model alias for ``tier`` (None if the tier has no models).
+
+        With an ``affinity`` key (workspace, conversation) the choice is
+        sticky so the provider's prompt cache stays warm: candidates are
+        ranked by rendezvous hashing and the first one whose cost is
+        within ``sticky_slack`` of the cheapest wins.
+        """
+        candidates = self.tiers().get(tier)
+        if not candidates:
+            return None
+        if len(candidates) == 1 or not self.enabled:
+            return candidates[0]
+        now = time.monotonic()
+        if affinity:
+            costs = {model: self._cost(model, now) for model in candidates}
+            limit = min(costs.values()) * self.sticky_slack
+            ranked = sorted(
+                candidates, key=lambda model: _rendezvous(affinity, model),
+                reverse=True,
+            )
+            return next(model for model in ranked if costs[model] <= limit)
+        first, second = random.sample(candidates, 2)
+        if self._cost(first, now) <= self._cost(second, now):
+            return first
+        return second
+
+    def begin(self, model: str) -> RouterCall:
+        """Count an in-flight call of ``model``."""
+        state = self._state(model)
+        state.in_flight += 1
+        state.requests += 1
+        return RouterCall(self, model)
+
+    def _ewma(self, current: Optional[float], value: float) -> float:
+        if current is None:
+            return value
+        return current + self.alpha * (value - current)
+
+    def _observe(self, model: str, ttft: float) -> None:
+        state = self._state(model)
+        state.ttft = self._ewma(state.ttft, ttft)
+
+    def _finish(
+        self, model: str, outcome: str, latency: Optional[float]
+    ) -> None:
+        state = self._state(model)
+        state.in_flight = max(state.in_flight - 1, 0)
+        if outcome == "cancelled":
+            return
+        now = time.monotonic()
+        failed = outcome == "error"
+        if failed:
+            state.errors += 1
+        state.error_rate = self._ewma(
+            self._error_rate(state, now), 1.0 if failed else 0.0
+        )
+        state.error_updated = now
+        if latency is not None and not failed:
+            state.latency = self._ewma(state.latency, latency)
+
+    def state(self) -> Dict[str, Any]:
+        """Router state for debugging."""
+        now = time.monotonic()
+        return {
+            "enabled": self.enabled,
+            "sticky_slack": self.sticky_slack,
+            "tiers": self.tiers(),
+            "models": {
+                model: {
+                    "ewma_latency": _round(state.latency),
+                    "ewma_ttft": _round(state.ttft),
+                    "error_rate": round(self._error_rate(state, now), 4),
+                    "in_flight": state.in_flight,
+                    "requests": state.requests,
+                    "errors": state.errors,
+                    "cost": round(self._cost(model, now), 4),
+                }
+                for model, state in self._models.items()
+            },
+        }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 4) if value is not None else None
+
+
+model_router = ModelRouter(
+    enabled=settings.router_enabled,
+    alpha=settings.router_ewma_alpha,
+    error_penalty=settings.router_error_penalty,
+    error_half_life=settings.router_error_half_life,
+    prior_latency=settings.router_prior_latency,
+    sticky_slack=settings.router_sticky_slack,
+)
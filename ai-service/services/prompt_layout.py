@@ -0,0 +1,124 @@
+"""
+Prompt layout for provider-side prompt caching.
+
+Providers reuse (and bill at a discount) the longest prefix a request
+shares byte for byte with an earlier one. Messages are therefore always
+assembled as
+
+    stable instructions   system prompt / block schema, client system
+                          messages (never the rolling summary)
+    static context        RAG context of the workspace, if any
+    dynamic content       conversation summary, turns, the new prompt
+
+so the stable part is the same for every request of a conversation or
+workspace. Automatic prefix caching (OpenAI/Azure) needs nothing more;
+for models whose ``metadata.cache_control`` in ``litellm_config.yaml``
+is set, the last stable message also gets an ``ephemeral``
+cache-control breakpoint once the prefix is long enough to be cached
+(``metadata.cache_min_tokens``, else ``prompt_cache_min_tokens``).
+"""
+from typing import Any, Dict, List, Tuple
+
+from core.settings import settings
+from services import token_budget
+from services.conversation_store import is_summary_message
+from services.model_registry import model_registry
+
+Message = Dict[str, Any]
+
+
+def layout_chat(
+    messages: List[Message], default_system: str
+) -> Tuple[List[Message], int]:
+    """(messages in cache-friendly order, length of the stable prefix).
+
+    The leading system messages are split into the stable instructions
+    and the conversation summary, which changes whenever turns are
+    compacted and so goes after them. Without client instructions the
+    default system prompt is the prefix.
+    """
+    leading = 0
+    while leading < len(messages) and messages[leading]["role"] == "system":
+        leading += 1
+    stable: List[Message] = []
+    dynamic: List[Message] = []
+    for message in messages[:leading]:
+        if is_summary_message(message["content"]):
+            dynamic.append(message)
+        else:
+            stable.append(message)
+    if adds_default_system(messages):
+        stable.append({"role": "system", "content": default_system})
+    return stable + dynamic + messages[leading:], len(stable)
+
+
+def adds_default_system(messages: List[Message]) -> bool:
+    """Whether ``layout_chat`` adds the default system prompt.
+
+    It does unless the client sent instructions: any system message
+    other than the leading conversation summary.
+    """
+    leading = True
+    for message in messages:
+        if message["role"] != "system":
+            leading = False
+        elif not (leading and is_summary_message(message["content"])):
+            return False
+    return True
+
+
+def layout_blocks(
+    system_prompt: str, context: str, prompt: str
+) -> Tuple[List[Message], int]:
+    """Messages of a block generation: schema, context, then the prompt."""
+    messages: List[Message] = [{"role": "system", "content": system_prompt}]
+    if context:
+        messages.append({"role": "user", "content": f"Context:\n{context}"})
+    messages.append({"role": "user", "content": f"Prompt: {prompt}"})
+    return messages, len(messages) - 1
+
+
+def supports_cache_control(model: str) -> bool:
+    """Whether ``model`` takes explicit cache-control breakpoints."""
+    return model_registry.get(model).cache_control
+
+
+def cache_min_tokens(model: str) -> int:
+    """Shortest prefix (tokens) the provider caches for ``model``."""
+    return (
+        model_registry.get(model).cache_min_tokens
+        or settings.prompt_cache_min_tokens
+    )
+
+
+def apply_cache_control(
+    messages: List[Message], model: str, prefix_len: int
+) -> List[Message]:
+    """Mark the end of the stable prefix for providers that need hints.
+
+    Returns ``messages`` unchanged if the model caches automatically or
+    the prefix is too short to be cached; the marked message is a copy.
+    """
+    if not settings.prompt_cache_hints or not prefix_len:
+        return messages
+    if not supports_cache_control(model):
+        return messages
+    prefix = messages[:prefix_len]
+    if any(not isinstance(m["content"], str) for m in prefix):
+        return messages
+    tokens = sum(
+        token_budget.message_tokens(m["content"], model) for m in prefix
+    )
+    if tokens < cache_min_tokens(model):
+        return messages
+
+    last = prefix[-1]
+    marked = {
+        **last,
+        "content": [{
+            "type": "text",
+            "text": last["content"],
+            "cache_control": {"type": "ephemeral"},
+        }],
+    }
+    return messages[:prefix_len - 1] + [marked] + messages[prefix_len:]
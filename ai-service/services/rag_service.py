@@ -1,6 +1,10 @@
+import hashlib
 from opik import track, start_as_current_span
 from typing import List, Dict, Any, AsyncGenerator
 
+from services.rate_limiter import Reservation
+from services.semantic_cache import context_key, semantic_cache
+
 class RAGService:
     def __init__(self, llm_service):
         self.llm = llm_service
@@ -9,15 +13,20 @@ class RAGService:
         # self.vector_store = VectorStore()
 
     @track(project_name="rag-queries")
-    async def query_with_context(self, query: str, workspace_id: str) -> AsyncGenerator[str, None]:
+    async def query_with_context(self, query: str, workspace_id: str, user_id: str = None, reservation: Reservation = None, model: str = None) -> AsyncGenerator[str, None]:
         # Step 1: Embedding
         # Placeholder for embedding logic
         query_embedding = []
+        cache_vector = None
         with start_as_current_span(name="embedding", input={"query": query}) as embed_span:
             # query_embedding = await self.embedder.embed_chunks([query])
             query_embedding = [[0.0] * 1536] # Mock 1536 dim embedding
+            if semantic_cache.enabled:
+                cache_vector = await semantic_cache.embed(query)
+                if cache_vector is not None:
+                    query_embedding = [cache_vector.astype("float32").tolist()]
             embed_span.update(output={"dimension": len(query_embedding[0])})
-        
+
         # Step 2: Vector Search
         # Placeholder for vector search logic
         similar_chunks = []
@@ -33,11 +42,32 @@ class RAGService:
                 "top_similarity": similar_chunks[0]['similarity'] if similar_chunks else 0
             })
         
-        # Step 3: LLM Generation (auto-tracked)
         context = self._build_context(similar_chunks)
-        async for chunk in self.llm.generate_blocks(query, context, workspace_id=workspace_id):
+
+        # Step 2b: Semantic cache lookup for near-duplicate questions over
+        # the same retrieved documents (a changed document is a miss)
+        context_hash = hashlib.blake2b(context.encode("utf-8"), digest_size=16).hexdigest()
+        cache_ctx = context_key("rag-query", "default", context_hash)
+        if cache_vector is not None:
+            cached = await semantic_cache.lookup(workspace_id, cache_ctx, cache_vector)
+            if cached is not None:
+                yield cached["reply"]
+                return
+
+        # Step 3: LLM Generation (auto-tracked)
+        reply_parts = []
+        async for chunk in self.llm.generate_blocks(
+            query, context, workspace_id=workspace_id, user_id=user_id,
+            reservation=reservation, model=model
+        ):
+            reply_parts.append(chunk)
             yield chunk
 
+        if cache_vector is not None and reply_parts:
+            await semantic_cache.store(
+                workspace_id, cache_ctx, cache_vector, {"reply": "".join(reply_parts)}
+            )
+
     def _build_context(self, chunks: List[Dict[str, Any]]) -> str:
         if not chunks:
             return ""
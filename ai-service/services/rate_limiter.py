@@ -0,0 +1,312 @@
+"""
+Per-workspace and per-user rate limits (requests/min and tokens/min).
+
+Each limit is a token bucket in Redis, checked and charged for all the
+buckets of a request in one Lua script, so concurrent requests on any
+replica cannot overdraw it. Token buckets are charged up front with an
+estimate (prompt tokens + max output tokens) and reconciled with the
+actual usage once the call is done.
+
+An in-process copy of every bucket sees only this replica's share of the
+traffic, so when it is empty the shared bucket is empty as well: those
+requests (and requests to a bucket Redis just rejected, until its
+Retry-After) are rejected without a Redis round trip.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis
+from fastapi import HTTPException
+from loguru import logger
+
+from core.settings import settings
+from utils.metrics import Counter
+from utils.redis_client import get_redis_client
+
+# KEYS: bucket keys. ARGV[1]: "1" = charge only if every bucket has
+# enough tokens, "0" = charge unconditionally (reconciliation, may go
+# negative); then capacity, refill per second and cost of each bucket.
+# Returns {1} or {0, wait seconds, index of the limiting bucket}.
+_TOKEN_BUCKET_SCRIPT = """
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local check = ARGV[1] == "1"
+local levels = {}
+local wait, limiting = 0, 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 3 - 1])
+    local rate = tonumber(ARGV[i * 3])
+    local cost = tonumber(ARGV[i * 3 + 1])
+    local state = redis.call("HMGET", key, "tokens", "ts")
+    local tokens = tonumber(state[1]) or capacity
+    local elapsed = math.max(now - (tonumber(state[2]) or now), 0)
+    tokens = math.min(capacity, tokens + elapsed * rate)
+    levels[i] = tokens
+    if check and tokens < cost and (cost - tokens) / rate > wait then
+        wait, limiting = (cost - tokens) / rate, i
+    end
+end
+if limiting > 0 then
+    return {0, tostring(wait), limiting}
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 3 - 1])
+    local rate = tonumber(ARGV[i * 3])
+    local tokens = math.min(capacity, levels[i] - tonumber(ARGV[i * 3 + 1]))
+    redis.call("HSET", key, "tokens", tostring(tokens), "ts", tostring(now))
+    redis.call("EXPIRE", key, math.ceil(capacity / rate) + 1)
+end
+return {1}
+"""
+
+# In-process buckets kept (least recently used are dropped first)
+_MAX_LOCAL_BUCKETS = 10000
+
+RATE_LIMITED = Counter(
+    "rate_limited_total",
+    "Requests rejected by the rate limiter",
+    ["scope", "source"],
+)
+
+
+class RateLimited(HTTPException):
+    """A rate limit of the workspace or user is exhausted."""
+
+    def __init__(self, scope: str, retry_after: float) -> None:
+        super().__init__(
+            status_code=429,
+            detail=f"Rate limit exceeded for {scope}",
+            headers={"Retry-After": str(max(math.ceil(retry_after), 1))},
+        )
+        self.retry_after = retry_after
+
+
+class _Bucket:
+    """Token bucket (refills ``rate`` tokens per second up to capacity)."""
+
+    __slots__ = ("key", "scope", "capacity", "rate", "cost")
+
+    def __init__(
+        self, key: str, scope: str, capacity: float, cost: float
+    ) -> None:
+        self.key = key
+        self.scope = scope
+        self.capacity = capacity
+        self.rate = capacity / 60.0
+        # A single request larger than the bucket could never pass
+        self.cost = min(cost, capacity)
+
+
+class _LocalBucket:
+    """In-process view of a bucket: this replica's consumption only."""
+
+    __slots__ = ("tokens", "updated", "blocked_until")
+
+    def __init__(self, capacity: float, now: float) -> None:
+        self.tokens = capacity
+        self.updated = now
+        self.blocked_until = 0.0
+
+    def level(self, bucket: _Bucket, now: float) -> float:
+        self.tokens = min(
+            bucket.capacity,
+            self.tokens + (now - self.updated) * bucket.rate,
+        )
+        self.updated = now
+        return self.tokens
+
+
+class Reservation:
+    """Tokens charged for one call; reconcile with the actual usage once."""
+
+    __slots__ = ("limiter", "buckets", "_done")
+
+    def __init__(
+        self, limiter: "RateLimiter", buckets: List[_Bucket]
+    ) -> None:
+        self.limiter = limiter
+        self.buckets = buckets
+        self._done = False
+
+    async def reconcile(self, actual_tokens: int) -> None:
+        """Refund (or charge) the difference to the estimate."""
+        if self._done:
+            return
+        self._done = True
+        if self.buckets:
+            await self.limiter._adjust(self.buckets, actual_tokens)
+
+
+class RateLimiter:
+    """Atomic Redis token buckets with an in-process pre-check."""
+
+    KEY_PREFIX = "ai-service:ratelimit:"
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        enabled: bool,
+        workspace_rpm: int,
+        workspace_tpm: int,
+        user_rpm: int,
+        user_tpm: int,
+        output_estimate: int,
+    ) -> None:
+        self.redis_client = redis_client
+        self.enabled = enabled
+        self.output_estimate = output_estimate
+        self.limits = {
+            "workspace": (workspace_rpm, workspace_tpm),
+            "user": (user_rpm, user_tpm),
+        }
+        self._script = redis_client.register_script(_TOKEN_BUCKET_SCRIPT)
+        self._local: "OrderedDict[str, _LocalBucket]" = OrderedDict()
+
+    def _buckets(
+        self, scopes: Dict[str, Optional[str]], tokens: int
+    ) -> Tuple[List[_Bucket], List[_Bucket]]:
+        """(request buckets, token buckets) of the given scope ids."""
+        requests: List[_Bucket] = []
+        token_buckets: List[_Bucket] = []
+        for scope, scope_id in scopes.items():
+            if not scope_id:
+                continue
+            rpm, tpm = self.limits[scope]
+            key = f"{self.KEY_PREFIX}{scope}:{scope_id}"
+            if rpm:
+                requests.append(_Bucket(f"{key}:rpm", scope, rpm, 1))
+            if tpm:
+                token_buckets.append(
+                    _Bucket(f"{key}:tpm", scope, tpm, tokens)
+                )
+        return requests, token_buckets
+
+    def _local_bucket(self, bucket: _Bucket, now: float) -> _LocalBucket:
+        local = self._local.get(bucket.key)
+        if local is None:
+            local = self._local[bucket.key] = _LocalBucket(
+                bucket.capacity, now
+            )
+            if len(self._local) > _MAX_LOCAL_BUCKETS:
+                self._local.popitem(last=False)
+        else:
+            self._local.move_to_end(bucket.key)
+        return local
+
+    def _check_local(
+        self, buckets: List[_Bucket], now: float
+    ) -> Optional[Tuple[_Bucket, float]]:
+        """(limiting bucket, wait) if a local bucket already rejects."""
+        for bucket in buckets:
+            local = self._local_bucket(bucket, now)
+            if local.blocked_until > now:
+                return bucket, local.blocked_until - now
+            level = local.level(bucket, now)
+            if level < bucket.cost:
+                return bucket, (bucket.cost - level) / bucket.rate
+        return None
+
+    def _charge_local(self, buckets: List[_Bucket], now: float) -> None:
+        for bucket in buckets:
+            local = self._local_bucket(bucket, now)
+            local.level(bucket, now)
+            local.tokens = min(bucket.capacity, local.tokens - bucket.cost)
+
+    def estimate(
+        self, prompt_tokens: int, max_tokens: Optional[int] = None
+    ) -> int:
+        """Tokens to reserve up front: prompt plus max (or usual) output."""
+        return prompt_tokens + (max_tokens or self.output_estimate)
+
+    async def acquire(
+        self,
+        workspace_id: Optional[str],
+        user_id: Optional[str],
+        tokens: int,
+    ) -> Reservation:
+        """Charge one request and ``tokens``; raises RateLimited."""
+        requests, token_buckets = self._buckets(
+            {"workspace": workspace_id, "user": user_id}, tokens
+        )
+        buckets = requests + token_buckets
+        if not self.enabled or not buckets:
+            return Reservation(self, [])
+
+        now = time.monotonic()
+        rejected = self._check_local(buckets, now)
+        if rejected is not None:
+            bucket, wait = rejected
+            RATE_LIMITED.labels(bucket.scope, "local").inc()
+            raise RateLimited(bucket.scope, wait)
+
+        try:
+            result = await asyncio.to_thread(
+                self._script, keys=[b.key for b in buckets],
+                args=self._args(buckets, check=True),
+            )
+        except redis.RedisError as e:
+            # Fail open on the shared limit; the local buckets still apply
+            logger.warning(f"Rate limiter unavailable: {e}")
+            result = [1]
+
+        if int(result[0]) != 1:
+            bucket = buckets[int(result[2]) - 1]
+            wait = float(result[1])
+            self._local_bucket(bucket, now).blocked_until = now + wait
+            RATE_LIMITED.labels(bucket.scope, "redis").inc()
+            raise RateLimited(bucket.scope, wait)
+
+        self._charge_local(buckets, now)
+        return Reservation(self, token_buckets)
+
+    @staticmethod
+    def _args(buckets: List[_Bucket], check: bool) -> List[Any]:
+        args: List[Any] = ["1" if check else "0"]
+        for bucket in buckets:
+            args.extend((bucket.capacity, bucket.rate, bucket.cost))
+        return args
+
+    async def _adjust(self, buckets: List[_Bucket], actual: int) -> None:
+        """Charge the difference between ``actual`` and the charged cost."""
+        adjusted = []
+        for charged in buckets:
+            bucket = _Bucket(charged.key, charged.scope, charged.capacity, 0)
+            # Not clamped: usage above the bucket size is still debt
+            bucket.cost = actual - charged.cost
+            if bucket.cost:
+                adjusted.append(bucket)
+        if not adjusted:
+            return
+        self._charge_local(adjusted, time.monotonic())
+        try:
+            await asyncio.to_thread(
+                self._script, keys=[b.key for b in adjusted],
+                args=self._args(adjusted, check=False),
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Rate limiter reconciliation failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "limits": {
+                scope: {"rpm": rpm, "tpm": tpm}
+                for scope, (rpm, tpm) in self.limits.items()
+            },
+            "local_buckets": len(self._local),
+            "rejected": RATE_LIMITED.values(),
+        }
+
+
+rate_limiter = RateLimiter(
+    get_redis_client(),
+    enabled=settings.rate_limit_enabled,
+    workspace_rpm=settings.rate_limit_workspace_rpm,
+    workspace_tpm=settings.rate_limit_workspace_tpm,
+    user_rpm=settings.rate_limit_user_rpm,
+    user_tpm=settings.rate_limit_user_tpm,
+    output_estimate=settings.rate_limit_output_estimate,
+)
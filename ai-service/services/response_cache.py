@@ -0,0 +1,175 @@
+"""
+Exact-match completion cache.
+
+Two tiers sit in front of the LLM call:
+    L1: in-process LRU bounded by entry count and total bytes, expiring
+        with the Redis copy
+    L2: Redis (shared by all replicas), with TTL
+
+Keys are derived from the normalized, provider-bound request (model,
+messages, temperature, max_tokens), so only byte-identical prompts hit.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import redis
+from loguru import logger
+
+from core.settings import settings
+from utils.redis_client import get_redis_client
+
+
+class LRUBytesCache:
+    """In-process LRU bounded by number of entries and total value bytes.
+
+    Entries expire like their Redis copy: an expired entry is a miss.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.evictions = 0
+        self._data: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.total_bytes -= len(value)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        size = len(value)
+        if size > self.max_bytes or ttl <= 0:
+            return
+        old = self._data.pop(key, None)
+        if old is not None:
+            self.total_bytes -= len(old[1])
+        self._data[key] = (time.monotonic() + ttl, value)
+        self.total_bytes += size
+        while (
+            len(self._data) > self.max_entries or
+            self.total_bytes > self.max_bytes
+        ):
+            _, (_, evicted) = self._data.popitem(last=False)
+            self.total_bytes -= len(evicted)
+            self.evictions += 1
+
+
+class CompletionCache:
+    """Two-tier (local LRU -> Redis) exact-match cache for completions."""
+
+    KEY_PREFIX = "ai-service:completion:"
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        max_entries: int,
+        max_bytes: int,
+        ttl: int,
+    ) -> None:
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self._local = LRUBytesCache(max_entries, max_bytes)
+        self._counters = {"l1_hits": 0, "l2_hits": 0, "misses": 0,
+                          "stores": 0, "errors": 0}
+
+    @staticmethod
+    def make_key(completion_kwargs: Dict[str, Any]) -> str:
+        """Build a cache key from the adapted LiteLLM payload."""
+        normalized = {
+            "model": completion_kwargs.get("model"),
+            "messages": [
+                {"role": m["role"], "content": m["content"]}
+                for m in completion_kwargs.get("messages", [])
+            ],
+            "temperature": float(completion_kwargs.get("temperature") or 0.0),
+            "max_tokens": completion_kwargs.get("max_tokens"),
+        }
+        raw = json.dumps(
+            normalized, sort_keys=True, separators=(",", ":"),
+            ensure_ascii=False
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        """Look up a cached response. Returns (value, tier)."""
+        cached = self._local.get(key)
+        if cached is not None:
+            self._counters["l1_hits"] += 1
+            return json.loads(cached), "l1"
+
+        try:
+            cached, ttl_ms = await asyncio.to_thread(self._fetch, key)
+        except Exception as re:
+            self._counters["errors"] += 1
+            logger.warning(f"Completion cache Redis lookup failed: {re}")
+            cached = None
+
+        if cached:
+            self._counters["l2_hits"] += 1
+            # Expire locally when the Redis copy does
+            ttl = ttl_ms / 1000 if ttl_ms and ttl_ms > 0 else self.ttl
+            self._local.set(key, cached.encode("utf-8"), ttl)
+            return json.loads(cached), "l2"
+
+        self._counters["misses"] += 1
+        return None, "miss"
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Store a response in both tiers."""
+        serialized = json.dumps(value, separators=(",", ":"))
+        self._local.set(key, serialized.encode("utf-8"), self.ttl)
+        self._counters["stores"] += 1
+        try:
+            await asyncio.to_thread(
+                self.redis_client.setex,
+                self.KEY_PREFIX + key, self.ttl, serialized
+            )
+        except Exception as re:
+            self._counters["errors"] += 1
+            logger.warning(f"Completion cache Redis store failed: {re}")
+
+    def _fetch(self, key: str) -> Tuple[Optional[str], Optional[int]]:
+        """Value and remaining TTL (ms) of the Redis copy."""
+        pipe = self.redis_client.pipeline()
+        pipe.get(self.KEY_PREFIX + key)
+        pipe.pttl(self.KEY_PREFIX + key)
+        cached, ttl_ms = pipe.execute()
+        return cached, ttl_ms
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and L1 occupancy."""
+        lookups = (
+            self._counters["l1_hits"] + self._counters["l2_hits"] +
+            self._counters["misses"]
+        )
+        hits = self._counters["l1_hits"] + self._counters["l2_hits"]
+        return {
+            **self._counters,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "l1_entries": len(self._local),
+            "l1_bytes": self._local.total_bytes,
+            "l1_evictions": self._local.evictions,
+        }
+
+
+completion_cache = CompletionCache(
+    get_redis_client(),
+    max_entries=settings.chat_cache_max_entries,
+    max_bytes=settings.chat_cache_max_bytes,
+    ttl=settings.chat_cache_ttl,
+)
@@ -0,0 +1,219 @@
+"""
+Resumable SSE streams.
+
+A resumable stream is generated by a background task, independent of the
+HTTP connection that started it. Every frame (an encoded SSE event, see
+``services.sse``) gets a sequence number (the SSE ``id``) and is appended
+to a capped Redis Stream with a short TTL (entry id ``0-<seq>``), so a
+client reconnecting with ``Last-Event-ID`` only receives the frames it
+missed and then follows the live generation.
+
+Readers on the replica running the generation follow its in-memory frame
+list; readers on other replicas (or after the generation finished) read
+the Redis Stream, polling with XRANGE so no thread blocks on Redis.
+"""
+import asyncio
+import time
+import uuid
+from typing import AsyncIterator, Dict, List, Set, Tuple
+
+import redis
+from loguru import logger
+
+from core.settings import settings
+from services.sse import DONE_EVENT, error_event
+from utils.deadline import detached_context
+from utils.redis_client import get_redis_binary_client
+
+
+class _LiveStream:
+    """Frames of a generation running on this replica."""
+
+    __slots__ = ("frames", "done", "persisted", "changed")
+
+    def __init__(self) -> None:
+        self.frames: List[bytes] = []
+        self.done = False
+        self.persisted = 0
+        self.changed = asyncio.Event()
+
+    def notify(self) -> None:
+        """Wake everyone waiting on the current event."""
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class ResumableStreams:
+    """Run generations in the background and replay them by sequence id."""
+
+    KEY_PREFIX = "ai-service:sse:"
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        ttl: int,
+        max_frames: int,
+        poll_interval: float,
+        idle_timeout: float,
+    ) -> None:
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.max_frames = max_frames
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self._live: Dict[str, _LiveStream] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._counters = {"started": 0, "resumed": 0, "replayed_frames": 0,
+                          "persist_errors": 0}
+
+    def start(self, frames: AsyncIterator[bytes]) -> str:
+        """Start consuming ``frames`` in the background; returns the id."""
+        stream_id = uuid.uuid4().hex
+        live = _LiveStream()
+        self._live[stream_id] = live
+        # Generation outlives the request: no request deadline
+        task = detached_context().run(
+            asyncio.create_task,
+            self._run(stream_id, live, frames), name=f"sse-stream-{stream_id}",
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self._counters["started"] += 1
+        return stream_id
+
+    async def stop(self) -> None:
+        """Cancel running generations (shutdown)."""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _run(
+        self, stream_id: str, live: _LiveStream, frames: AsyncIterator[bytes]
+    ) -> None:
+        persister = asyncio.create_task(self._persist(stream_id, live))
+        try:
+            async for frame in frames:
+                live.frames.append(frame)
+                live.notify()
+        except Exception as exc:  # pragma: no cover - runtime protection
+            logger.exception(f"Resumable stream {stream_id} failed: {exc}")
+            if not live.frames or live.frames[-1] != DONE_EVENT:
+                live.frames.extend([error_event(str(exc)), DONE_EVENT])
+        finally:
+            live.done = True
+            live.notify()
+            try:
+                try:
+                    # Runs the producer's cleanup when cancelled (shutdown)
+                    aclose = getattr(frames, "aclose", None)
+                    if aclose is not None:
+                        await aclose()
+                finally:
+                    await persister
+            finally:
+                # Later readers replay from Redis
+                self._live.pop(stream_id, None)
+
+    async def _persist(self, stream_id: str, live: _LiveStream) -> None:
+        """Append new frames to the Redis Stream in pipelined batches."""
+        key = self.KEY_PREFIX + stream_id
+        while True:
+            changed = live.changed
+            if live.persisted < len(live.frames):
+                start = live.persisted
+                batch = live.frames[start:]
+                try:
+                    await asyncio.to_thread(self._append, key, start, batch)
+                except Exception as re:
+                    self._counters["persist_errors"] += 1
+                    logger.warning(
+                        f"Persisting stream {stream_id} frames failed: {re}"
+                    )
+                live.persisted = start + len(batch)
+                continue
+            if live.done:
+                return
+            await changed.wait()
+
+    def _append(self, key: str, start: int, batch: List[bytes]) -> None:
+        pipe = self.redis_client.pipeline(transaction=False)
+        for offset, frame in enumerate(batch, start=start + 1):
+            pipe.xadd(
+                key, {"data": frame}, id=f"0-{offset}",
+                maxlen=self.max_frames, approximate=True,
+            )
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    async def exists(self, stream_id: str) -> bool:
+        if stream_id in self._live:
+            return True
+        return bool(await asyncio.to_thread(
+            self.redis_client.exists, self.KEY_PREFIX + stream_id
+        ))
+
+    async def follow(
+        self, stream_id: str, after: int = 0
+    ) -> AsyncIterator[Tuple[int, bytes]]:
+        """Yield (seq, frame) after sequence ``after`` until the stream ends."""
+        if after:
+            self._counters["resumed"] += 1
+        live = self._live.get(stream_id)
+        if live is not None:
+            async for item in self._follow_live(live, after):
+                yield item
+            return
+        async for item in self._follow_redis(stream_id, after):
+            yield item
+
+    async def _follow_live(
+        self, live: _LiveStream, after: int
+    ) -> AsyncIterator[Tuple[int, bytes]]:
+        seq = after
+        while True:
+            changed = live.changed
+            if seq < len(live.frames):
+                seq += 1
+                yield seq, live.frames[seq - 1]
+                continue
+            if live.done:
+                return
+            await changed.wait()
+
+    async def _follow_redis(
+        self, stream_id: str, after: int
+    ) -> AsyncIterator[Tuple[int, bytes]]:
+        key = self.KEY_PREFIX + stream_id
+        seq = after
+        idle_since = time.monotonic()
+        while True:
+            start = f"(0-{seq}" if seq else "-"
+            entries = await asyncio.to_thread(
+                self.redis_client.xrange, key, start, "+"
+            )
+            for entry_id, fields in entries:
+                seq = int(entry_id.split(b"-", 1)[1])
+                frame = fields.get(b"data", b"")
+                self._counters["replayed_frames"] += 1
+                yield seq, frame
+                if frame == DONE_EVENT:
+                    return
+            if entries:
+                idle_since = time.monotonic()
+            elif time.monotonic() - idle_since > self.idle_timeout:
+                # Generation died with its replica, or the stream expired
+                logger.warning(f"Stream {stream_id} went idle; giving up")
+                return
+            await asyncio.sleep(self.poll_interval)
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._counters, "live": len(self._live)}
+
+
+resumable_streams = ResumableStreams(
+    get_redis_binary_client(),
+    ttl=settings.stream_resume_ttl,
+    max_frames=settings.stream_resume_max_frames,
+    poll_interval=settings.stream_resume_poll_interval,
+    idle_timeout=settings.stream_resume_idle_timeout,
+)
@@ -0,0 +1,348 @@
+"""
+Semantic response cache.
+
+The final user message is embedded and compared against recently answered
+messages of the same workspace. Embeddings are kept L2-normalized in a
+float32 matrix per workspace, so a lookup is a single (BLAS) matrix-vector
+product (cosine similarity) followed by an argmax. Entries expire by TTL
+and are evicted LRU when a workspace partition is full. Every entry is
+mirrored to a Redis hash per workspace (as float16) so the cache survives
+restarts.
+
+A partition's matrix grows with its entries, so memory follows what is
+cached: ``dim * 4`` bytes per entry (6 KiB at 1536 dimensions), at most
+``max_entries * max_workspaces`` entries.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import redis
+from loguru import logger
+
+from core.settings import settings
+from services.llm_client import llm_client
+from utils.redis_client import get_redis_client
+
+
+def context_key(*parts: Any) -> int:
+    """Hash the non-query part of a request (model, prior turns, ...).
+
+    Entries only match requests with the same context key, so a cached
+    reply is never served for a different model or conversation prefix.
+    """
+    raw = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+    digest = hashlib.blake2b(raw.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class _Partition:
+    """Embedding matrix for one workspace, grown up to ``capacity`` rows."""
+
+    INITIAL_ROWS = 64
+
+    def __init__(self, capacity: int, dim: int) -> None:
+        self.capacity = capacity
+        self.dim = dim
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.ctx = np.zeros(0, dtype=np.uint64)
+        # expires == 0 marks an empty slot
+        self.expires = np.zeros(0, dtype=np.float64)
+        self.last_used = np.zeros(0, dtype=np.float64)
+        self.entry_ids: List[Optional[str]] = []
+        self.values: List[Optional[Dict[str, Any]]] = []
+
+    @property
+    def rows(self) -> int:
+        return self.vectors.shape[0]
+
+    def reserve(self, rows: int) -> None:
+        """Allocate room for ``rows`` entries (doubling, capped)."""
+        if rows <= self.rows:
+            return
+        new = min(max(rows, self.rows * 2, self.INITIAL_ROWS), self.capacity)
+        grow = new - self.rows
+        self.vectors = np.concatenate(
+            (self.vectors, np.zeros((grow, self.dim), dtype=np.float32))
+        )
+        self.ctx = np.concatenate((self.ctx, np.zeros(grow, dtype=np.uint64)))
+        self.expires = np.concatenate((self.expires, np.zeros(grow)))
+        self.last_used = np.concatenate((self.last_used, np.zeros(grow)))
+        self.entry_ids.extend([None] * grow)
+        self.values.extend([None] * grow)
+
+    def search(self, query: np.ndarray, ctx: int, now: float):
+        """Return (slot, score) of the best live entry for this context."""
+        if not self.rows:
+            return 0, -1.0
+        scores = self.vectors @ query
+        valid = (self.expires > now) & (self.ctx == np.uint64(ctx))
+        scores = np.where(valid, scores, -1.0)
+        slot = int(np.argmax(scores))
+        return slot, float(scores[slot])
+
+    def free_slot(self, now: float) -> int:
+        """Pick an empty/expired slot, a new one, else the least recently used."""
+        dead = np.flatnonzero(self.expires <= now)
+        if dead.size:
+            return int(dead[0])
+        if self.rows < self.capacity:
+            slot = self.rows
+            self.reserve(slot + 1)
+            return slot
+        return int(np.argmin(self.last_used))
+
+    def put(
+        self,
+        slot: int,
+        entry_id: str,
+        vector: np.ndarray,
+        ctx: int,
+        expires: float,
+        value: Dict[str, Any],
+        now: float,
+    ) -> None:
+        self.vectors[slot] = vector
+        self.ctx[slot] = np.uint64(ctx)
+        self.expires[slot] = expires
+        self.last_used[slot] = now
+        self.entry_ids[slot] = entry_id
+        self.values[slot] = value
+
+
+class SemanticCache:
+    """Per-workspace similarity cache backed by Redis."""
+
+    KEY_PREFIX = "ai-service:semantic-cache:"
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        enabled: bool,
+        threshold: float,
+        ttl: int,
+        max_entries: int,
+        max_workspaces: int,
+        embedding_model: str,
+    ) -> None:
+        self.redis_client = redis_client
+        self.enabled = enabled
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_workspaces = max_workspaces
+        self.embedding_model = embedding_model
+        self._partitions: "OrderedDict[str, _Partition]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._counters = {"hits": 0, "misses": 0, "stores": 0,
+                          "embed_errors": 0, "redis_errors": 0}
+
+    async def embed(self, text: str) -> Optional[np.ndarray]:
+        """Embed text via the proxy and return a normalized float32 vector."""
+        import litellm
+
+        try:
+            response = await litellm.aembedding(
+                model=f"openai/{self.embedding_model}",
+                input=[text],
+                **llm_client.completion_kwargs(),
+            )
+            data = response.data[0]
+            raw = data["embedding"] if isinstance(data, dict) else data.embedding
+        except Exception as exc:
+            self._counters["embed_errors"] += 1
+            logger.warning(f"Semantic cache embedding failed: {exc}")
+            return None
+
+        vector = np.asarray(raw, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        if norm == 0.0:
+            return None
+        return vector / norm
+
+    async def lookup(
+        self, workspace_id: str, ctx: int, vector: np.ndarray
+    ) -> Optional[Dict[str, Any]]:
+        """Return the cached value of the most similar entry, if any."""
+        partition = await self._partition(workspace_id, vector.shape[0])
+        if partition is None:
+            self._counters["misses"] += 1
+            return None
+
+        now = time.time()
+        slot, score = partition.search(vector, ctx, now)
+        if score < self.threshold:
+            self._counters["misses"] += 1
+            return None
+
+        partition.last_used[slot] = now
+        self._counters["hits"] += 1
+        logger.debug(
+            f"Semantic cache hit: workspace={workspace_id}, score={score:.4f}"
+        )
+        return partition.values[slot]
+
+    async def store(
+        self,
+        workspace_id: str,
+        ctx: int,
+        vector: np.ndarray,
+        value: Dict[str, Any],
+    ) -> None:
+        """Insert an entry, evicting an expired or LRU slot if needed."""
+        partition = await self._partition(workspace_id, vector.shape[0])
+        if partition is None:
+            return
+
+        now = time.time()
+        expires = now + self.ttl
+        slot = partition.free_slot(now)
+        evicted_id = partition.entry_ids[slot]
+        entry_id = uuid.uuid4().hex
+        partition.put(slot, entry_id, vector, ctx, expires, value, now)
+        self._counters["stores"] += 1
+
+        record = json.dumps({
+            "v": base64.b64encode(
+                vector.astype(np.float16).tobytes()
+            ).decode("ascii"),
+            "ctx": str(ctx),
+            "exp": expires,
+            "value": value,
+        }, separators=(",", ":"))
+        key = self.KEY_PREFIX + workspace_id
+
+        def _persist() -> None:
+            pipe = self.redis_client.pipeline()
+            if evicted_id:
+                pipe.hdel(key, evicted_id)
+            pipe.hset(key, entry_id, record)
+            pipe.expire(key, self.ttl)
+            pipe.execute()
+
+        try:
+            await asyncio.to_thread(_persist)
+        except Exception as re:
+            self._counters["redis_errors"] += 1
+            logger.warning(f"Semantic cache Redis store failed: {re}")
+
+    async def _partition(
+        self, workspace_id: str, dim: int
+    ) -> Optional[_Partition]:
+        """Get the workspace partition, loading it from Redis on first use."""
+        partition = self._partitions.get(workspace_id)
+        if partition is not None:
+            self._partitions.move_to_end(workspace_id)
+            return partition if partition.dim == dim else None
+
+        pending = self._loading.get(workspace_id)
+        if pending is not None:
+            await pending
+            return self._partitions.get(workspace_id)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[workspace_id] = future
+        try:
+            partition = _Partition(self.max_entries, dim)
+            await self._load(workspace_id, partition)
+            self._partitions[workspace_id] = partition
+            while len(self._partitions) > self.max_workspaces:
+                self._partitions.popitem(last=False)
+            return partition
+        finally:
+            del self._loading[workspace_id]
+            future.set_result(None)
+
+    async def _load(self, workspace_id: str, partition: _Partition) -> None:
+        """Restore live entries of a workspace from Redis."""
+        try:
+            records = await asyncio.to_thread(
+                self.redis_client.hgetall, self.KEY_PREFIX + workspace_id
+            )
+        except Exception as re:
+            self._counters["redis_errors"] += 1
+            logger.warning(f"Semantic cache Redis load failed: {re}")
+            return
+
+        now = time.time()
+        live = []
+        corrupt = []
+        for entry_id, raw in (records or {}).items():
+            try:
+                record = json.loads(raw)
+                expires = float(record["exp"])
+                vector = np.frombuffer(
+                    base64.b64decode(record["v"]), dtype=np.float16
+                ).astype(np.float32)
+                ctx = int(record["ctx"])
+                value = record["value"]
+            except (ValueError, KeyError, TypeError) as e:
+                # Corrupt or partially written: drop it, a miss is fine
+                logger.warning(
+                    f"Semantic cache dropped corrupt entry {entry_id} "
+                    f"of workspace {workspace_id}: {e}"
+                )
+                corrupt.append(entry_id)
+                continue
+            if expires <= now or vector.shape[0] != partition.dim:
+                continue
+            live.append((expires, entry_id, vector, ctx, value))
+        if corrupt:
+            try:
+                await asyncio.to_thread(
+                    self.redis_client.hdel,
+                    self.KEY_PREFIX + workspace_id, *corrupt
+                )
+            except Exception as re:
+                self._counters["redis_errors"] += 1
+                logger.warning(f"Semantic cache Redis cleanup failed: {re}")
+
+        # Keep the entries that live longest if Redis holds more than fits
+        live.sort(key=lambda item: item[0], reverse=True)
+        partition.reserve(min(len(live), self.max_entries))
+        for slot, (expires, entry_id, vector, ctx, value) in enumerate(
+            live[:self.max_entries]
+        ):
+            partition.put(slot, entry_id, vector, ctx, expires, value, now)
+        if live:
+            logger.info(
+                f"Semantic cache restored {min(len(live), self.max_entries)} "
+                f"entries for workspace {workspace_id}"
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and partition occupancy."""
+        lookups = self._counters["hits"] + self._counters["misses"]
+        now = time.time()
+        return {
+            "enabled": self.enabled,
+            **self._counters,
+            "hit_ratio": (
+                round(self._counters["hits"] / lookups, 4) if lookups else 0.0
+            ),
+            "workspaces": len(self._partitions),
+            "entries": int(sum(
+                int((p.expires > now).sum())
+                for p in self._partitions.values()
+            )),
+            "memory_bytes": int(sum(
+                p.vectors.nbytes for p in self._partitions.values()
+            )),
+        }
+
+
+semantic_cache = SemanticCache(
+    get_redis_client(),
+    enabled=settings.semantic_cache_enabled,
+    threshold=settings.semantic_cache_threshold,
+    ttl=settings.semantic_cache_ttl,
+    max_entries=settings.semantic_cache_max_entries,
+    max_workspaces=settings.semantic_cache_max_workspaces,
+    embedding_model=settings.embedding_model,
+)
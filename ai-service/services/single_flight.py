@@ -0,0 +1,201 @@
+"""
+Single-flight coalescing of identical in-flight calls.
+
+Concurrent callers with the same key share one execution:
+    - in-process, the first caller starts a task and later callers await
+      the same task (shielded, so one waiter cancelling does not cancel it
+      for the others; the task is cancelled once no waiters are left);
+    - across replicas, the leader holds a Redis lock while it runs and
+      publishes the result under a short-lived key named after its lock
+      token. Only callers that found that lock held (i.e. waited on that
+      leader) read it, so a finished call is never served to a later
+      request: this is coalescing, not a response cache.
+"""
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import redis
+from loguru import logger
+
+from core.settings import settings
+from utils.redis_client import get_redis_client
+
+# Delete the lock only if we still own it
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class _Call:
+    """A shared in-flight execution and the number of callers awaiting it."""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key."""
+
+    LOCK_PREFIX = "ai-service:single-flight:lock:"
+    RESULT_PREFIX = "ai-service:single-flight:result:"
+
+    def __init__(
+        self,
+        redis_client: Optional[redis.Redis],
+        lock_ttl: float,
+        result_ttl: int,
+        poll_interval: float,
+    ) -> None:
+        self.redis_client = redis_client
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self._calls: Dict[str, _Call] = {}
+        self._release_lock = (
+            redis_client.register_script(_RELEASE_LOCK_SCRIPT)
+            if redis_client is not None else None
+        )
+        self._counters = {"leaders": 0, "coalesced_local": 0,
+                          "coalesced_remote": 0, "cancelled": 0,
+                          "redis_errors": 0}
+
+    async def do(
+        self, key: str, fn: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """Run ``fn`` once per key among concurrent callers."""
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.create_task(self._run(key, fn)))
+            self._calls[key] = call
+            call.task.add_done_callback(
+                lambda _, c=call: self._forget(key, c)
+            )
+        else:
+            self._counters["coalesced_local"] += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                # Last waiter gone: nobody needs the result any more
+                self._counters["cancelled"] += 1
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def _run(
+        self, key: str, fn: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """Leader side: coordinate with other replicas, then run ``fn``."""
+        if self.redis_client is None:
+            self._counters["leaders"] += 1
+            return await fn()
+
+        lock_key = self.LOCK_PREFIX + key
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_ttl
+        # Token of the remote leader we are waiting for
+        leader: Optional[str] = None
+
+        while True:
+            try:
+                if leader is None:
+                    acquired = await asyncio.to_thread(
+                        self.redis_client.set, lock_key, token,
+                        nx=True, px=int(self.lock_ttl * 1000)
+                    )
+                    if acquired:
+                        break
+                    leader = await asyncio.to_thread(
+                        self.redis_client.get, lock_key
+                    )
+                    if leader is None:
+                        # Released in between: try to lead again
+                        continue
+                else:
+                    published, current = await asyncio.to_thread(
+                        self._poll, lock_key, self._result_key(key, leader)
+                    )
+                    if published:
+                        self._counters["coalesced_remote"] += 1
+                        return json.loads(published)
+                    if current != leader:
+                        # The leader failed or its lock expired
+                        leader = None
+                        continue
+            except Exception as re:
+                self._counters["redis_errors"] += 1
+                logger.warning(f"Single-flight Redis unavailable: {re}")
+                self._counters["leaders"] += 1
+                return await fn()
+
+            if time.monotonic() >= deadline:
+                logger.warning(
+                    "Single-flight wait for remote leader timed out; "
+                    "running locally"
+                )
+                self._counters["leaders"] += 1
+                return await fn()
+            # Another replica is running the same call
+            await asyncio.sleep(self.poll_interval)
+
+        self._counters["leaders"] += 1
+        try:
+            result = await fn()
+            try:
+                await asyncio.to_thread(
+                    self.redis_client.setex,
+                    self._result_key(key, token), self.result_ttl,
+                    json.dumps(result, separators=(",", ":"))
+                )
+            except Exception as re:
+                self._counters["redis_errors"] += 1
+                logger.warning(f"Single-flight result publish failed: {re}")
+            return result
+        finally:
+            try:
+                await asyncio.to_thread(
+                    self._release_lock, keys=[lock_key], args=[token]
+                )
+            except Exception as re:
+                self._counters["redis_errors"] += 1
+                logger.warning(f"Single-flight lock release failed: {re}")
+
+    def _result_key(self, key: str, leader: str) -> str:
+        # Per leader: only callers that waited on that leader can read it
+        return f"{self.RESULT_PREFIX}{key}:{leader}"
+
+    def _poll(self, lock_key: str, result_key: str) -> Tuple[Any, Any]:
+        """Leader result and current lock owner, read atomically."""
+        pipe = self.redis_client.pipeline()
+        pipe.get(result_key)
+        pipe.get(lock_key)
+        published, current = pipe.execute()
+        return published, current
+
+    def stats(self) -> Dict[str, Any]:
+        """Coalescing counters and number of in-flight keys."""
+        return {**self._counters, "in_flight": len(self._calls)}
+
+
+chat_single_flight = SingleFlight(
+    get_redis_client() if settings.single_flight_distributed else None,
+    lock_ttl=settings.single_flight_lock_ttl,
+    result_ttl=settings.single_flight_result_ttl,
+    poll_interval=settings.single_flight_poll_interval,
+)
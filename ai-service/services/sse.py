@@ -0,0 +1,113 @@
+"""
+Server-Sent Events: bytes-level encoding and response.
+
+Frames are encoded once, when generated, to complete SSE events in
+``bytes``; nothing downstream re-encodes them. Events are typed
+(``content``, ``thought``, ``done``, ``error``) and carry a JSON payload
+serialized with orjson, e.g.
+
+    event: content
+    data: {"text":"Hello\\nworld"}
+
+JSON never contains a raw line break, so a payload is always a single
+``data:`` line; text payloads are split into one ``data:`` field per
+line as the SSE format requires (a client joins them with ``\\n``).
+
+``SSEResponse`` writes the frames of an async iterator straight to the
+ASGI ``send``. A client disconnect surfaces as an ``OSError`` from
+``send`` (ASGI spec 2.4), which ends the response quietly; the frame
+iterator is always closed so its ``finally`` blocks run.
+"""
+from typing import Any, AsyncIterator, Mapping, Optional
+
+import orjson
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+EVENT_CONTENT = "content"
+EVENT_THOUGHT = "thought"
+EVENT_DONE = "done"
+EVENT_ERROR = "error"
+
+
+def encode_event(
+    event: str, data: Any, event_id: Optional[int] = None
+) -> bytes:
+    """One SSE event; ``str``/``bytes`` data is sent as text, else JSON."""
+    head = b"event: " + event.encode() + b"\n"
+    if event_id is not None:
+        head = b"id: %d\n" % event_id + head
+    if isinstance(data, str):
+        data = data.encode()
+    elif not isinstance(data, bytes):
+        return head + b"data: " + orjson.dumps(data) + b"\n\n"
+    # A line break would end the data field: one field per line
+    lines = data.splitlines() or [b""]
+    return head + b"".join(b"data: " + line + b"\n" for line in lines) + b"\n"
+
+
+# Per-frame events: fixed head and tail, only the payload is serialized
+_CONTENT_HEAD = b"event: " + EVENT_CONTENT.encode() + b"\ndata: "
+_THOUGHT_HEAD = b"event: " + EVENT_THOUGHT.encode() + b"\ndata: "
+
+
+def content_event(text: str) -> bytes:
+    return _CONTENT_HEAD + orjson.dumps({"text": text}) + b"\n\n"
+
+
+def thought_event(text: str) -> bytes:
+    return _THOUGHT_HEAD + orjson.dumps({"text": text}) + b"\n\n"
+
+
+def error_event(detail: str) -> bytes:
+    return encode_event(EVENT_ERROR, {"detail": detail})
+
+
+# Last event of every stream
+DONE_EVENT = encode_event(EVENT_DONE, {})
+
+
+def with_id(event_id: int, frame: bytes) -> bytes:
+    """Prefix an encoded event with its ``id`` (resumable streams)."""
+    return b"id: %d\n" % event_id + frame
+
+
+class SSEResponse(Response):
+    """Stream pre-encoded SSE frames through the raw ASGI ``send``."""
+
+    media_type = "text/event-stream"
+
+    def __init__(
+        self,
+        frames: AsyncIterator[bytes],
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> None:
+        self.frames = frames
+        self.status_code = status_code
+        self.background = None
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            })
+            async for frame in self.frames:
+                await send({
+                    "type": "http.response.body",
+                    "body": frame,
+                    "more_body": True,
+                })
+            await send({
+                "type": "http.response.body", "body": b"", "more_body": False,
+            })
+        except OSError:
+            # Client went away mid-stream
+            pass
+        finally:
+            aclose = getattr(self.frames, "aclose", None)
+            if aclose is not None:
+                await aclose()
@@ -0,0 +1,209 @@
+"""
+Latency instrumentation for streamed LLM responses.
+
+Per model alias we record:
+    - connect: request sent -> upstream stream object returned (headers)
+    - ttft: request sent -> first content/reasoning delta
+    - inter-token gap: time between consecutive deltas
+    - duration: request sent -> end of stream
+    - tokens/sec: deltas after the first one over the decode time
+
+Histograms live in the shared metrics registry; ``StreamTimer`` also keeps
+the gaps of its own stream so completion/timeout logs can show percentiles
+for that single stream.
+
+Streams end as ``completed``, ``failed`` or ``abandoned`` (client went
+away). For abandoned streams the tokens saved are estimated from the
+running average completion length of the model.
+"""
+import time
+from typing import Any, Dict, List, Optional
+
+from services import llm_metrics
+from services.model_router import model_router
+from utils.metrics import Counter, Histogram, RollingWindows, percentiles
+
+STREAM_CONNECT_SECONDS = Histogram(
+    "llm_stream_connect_seconds",
+    "Time until the upstream LLM stream is established",
+    ["model"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+STREAM_TTFT_SECONDS = Histogram(
+    "llm_stream_ttft_seconds",
+    "Time to first streamed token",
+    ["model"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0),
+)
+STREAM_INTER_TOKEN_SECONDS = Histogram(
+    "llm_stream_inter_token_seconds",
+    "Gap between consecutive streamed tokens",
+    ["model"],
+    buckets=(0.001, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+STREAM_DURATION_SECONDS = Histogram(
+    "llm_stream_duration_seconds",
+    "Total duration of a streamed completion",
+    ["model"],
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0),
+)
+STREAM_TOKENS_PER_SECOND = Histogram(
+    "llm_stream_tokens_per_second",
+    "Decode throughput of a streamed completion",
+    ["model"],
+    buckets=(5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500),
+)
+
+STREAMS = Counter(
+    "llm_streams_total",
+    "Streamed completions by outcome (completed, failed, abandoned)",
+    ["model", "outcome"],
+)
+STREAM_TOKENS_SAVED = Counter(
+    "llm_stream_tokens_saved_total",
+    "Estimated completion tokens not generated after client disconnects",
+    ["model"],
+)
+
+# Recent TTFTs per model (hedging thresholds)
+RECENT_TTFT = RollingWindows()
+
+# Running average completion length (in deltas) of completed streams
+_TYPICAL_ALPHA = 0.1
+_typical_tokens: Dict[str, float] = {}
+
+
+class StreamTimer:
+    """Timestamps of one streamed completion."""
+
+    __slots__ = ("model", "started", "connect", "ttft", "tokens",
+                 "_last", "_gaps", "_finished", "_call")
+
+    def __init__(self, model: str) -> None:
+        self.model = model
+        self.started = time.monotonic()
+        self.connect: Optional[float] = None
+        self.ttft: Optional[float] = None
+        self.tokens = 0
+        self._last: Optional[float] = None
+        self._gaps: List[float] = []
+        self._finished = False
+        # In-flight count / TTFT / errors for the model router
+        self._call = model_router.begin(model)
+
+    def connected(self) -> None:
+        """Upstream stream established."""
+        self.connect = time.monotonic() - self.started
+        STREAM_CONNECT_SECONDS.labels(self.model).observe(self.connect)
+
+    def token(self) -> None:
+        """A content or reasoning delta arrived."""
+        now = time.monotonic()
+        self.tokens += 1
+        if self._last is None:
+            self.ttft = now - self.started
+            STREAM_TTFT_SECONDS.labels(self.model).observe(self.ttft)
+            RECENT_TTFT.get(self.model).observe(self.ttft)
+            self._call.first_token()
+        else:
+            gap = now - self._last
+            self._gaps.append(gap)
+            STREAM_INTER_TOKEN_SECONDS.labels(self.model).observe(gap)
+        self._last = now
+
+    def discard(self) -> None:
+        """Drop a stream that was never used (e.g. a lost hedge)."""
+        self._finished = True
+        self._call.end("cancelled", record_latency=False)
+
+    def tokens_saved(self, max_tokens: Optional[int] = None) -> int:
+        """Estimate of the tokens an abandoned stream would have produced."""
+        typical = _typical_tokens.get(self.model)
+        if typical is None:
+            return 0
+        saved = typical - self.tokens
+        if max_tokens:
+            saved = min(saved, max_tokens - self.tokens)
+        return max(int(saved), 0)
+
+    def finish(
+        self, outcome: str = "completed", max_tokens: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Record duration/outcome once; return this stream's summary."""
+        duration = time.monotonic() - self.started
+        decode_time = sum(self._gaps)
+        tokens_per_second = (
+            len(self._gaps) / decode_time if decode_time > 0 else None
+        )
+        tokens_saved = (
+            self.tokens_saved(max_tokens) if outcome == "abandoned" else 0
+        )
+        if not self._finished:
+            self._finished = True
+            self._call.end(
+                {"completed": "ok", "failed": "error"}.get(
+                    outcome, "cancelled"
+                ),
+                record_latency=False,
+            )
+            STREAMS.labels(self.model, outcome).inc()
+            STREAM_DURATION_SECONDS.labels(self.model).observe(duration)
+            llm_metrics.observe_call(self.model, "stream", duration)
+            if tokens_per_second is not None:
+                STREAM_TOKENS_PER_SECOND.labels(self.model).observe(
+                    tokens_per_second
+                )
+            if outcome == "completed" and self.tokens:
+                typical = _typical_tokens.get(self.model)
+                _typical_tokens[self.model] = (
+                    float(self.tokens) if typical is None
+                    else typical + _TYPICAL_ALPHA * (self.tokens - typical)
+                )
+            elif tokens_saved:
+                STREAM_TOKENS_SAVED.labels(self.model).inc(tokens_saved)
+        return {
+            "model": self.model,
+            "outcome": outcome,
+            "connect": _round(self.connect),
+            "ttft": _round(self.ttft),
+            "duration": round(duration, 3),
+            "tokens": self.tokens,
+            "tokens_per_second": _round(tokens_per_second),
+            "tokens_saved": tokens_saved,
+            "gap": percentiles(self._gaps),
+        }
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    """One-line rendering of ``StreamTimer.finish()`` for logs."""
+    gap = summary["gap"]
+    saved = (
+        f"tokens_saved={summary['tokens_saved']}, "
+        if summary["outcome"] == "abandoned" else ""
+    )
+    return (
+        f"model={summary['model']}, outcome={summary['outcome']}, "
+        f"{saved}connect={summary['connect']}s, "
+        f"ttft={summary['ttft']}s, duration={summary['duration']}s, "
+        f"tokens={summary['tokens']}, "
+        f"tokens_per_second={summary['tokens_per_second']}, "
+        f"gap_p50={gap['p50']}s, gap_p90={gap['p90']}s, "
+        f"gap_p99={gap['p99']}s"
+    )
+
+
+def stats() -> Dict[str, Any]:
+    """Per-model percentile estimates of all stream histograms."""
+    return {
+        "connect_seconds": STREAM_CONNECT_SECONDS.summary(),
+        "ttft_seconds": STREAM_TTFT_SECONDS.summary(),
+        "inter_token_seconds": STREAM_INTER_TOKEN_SECONDS.summary(),
+        "duration_seconds": STREAM_DURATION_SECONDS.summary(),
+        "tokens_per_second": STREAM_TOKENS_PER_SECOND.summary(),
+        "outcomes": STREAMS.values(),
+        "tokens_saved": STREAM_TOKENS_SAVED.values(),
+    }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
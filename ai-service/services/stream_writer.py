@@ -0,0 +1,302 @@
+"""
+Shared streaming helpers for token streams.
+
+- ``parse_chunk``: type-dispatched parser for upstream stream chunks. The
+  parser for a chunk type is resolved once and cached, so the per-chunk
+  cost is one dict lookup plus attribute reads.
+- ``StreamWriter``: coalesces small token deltas into frames according to
+  a ``FlushPolicy`` (max latency, max bytes, sentence boundary). The first
+  delta is always flushed immediately to keep time-to-first-token.
+- ``with_deadlines``: iterates a stream and yields ``None`` whenever the
+  writer's latency deadline passes without a new chunk, so buffered text
+  never waits for the next upstream chunk. Given a ``watch_disconnect``
+  task it also stops reading (``StreamAbandoned``) as soon as the client
+  goes away, instead of pulling the rest of the generation for nobody.
+- ``close_upstream``: closes an upstream LLM stream and its connection.
+- ``ClosingStreamingResponse``: a StreamingResponse that always closes
+  its body iterator, however sending ends.
+"""
+import asyncio
+import inspect
+import time
+from typing import (
+    Any, AsyncIterator, Callable, Dict, FrozenSet, List, Optional, Tuple,
+    TypeVar
+)
+
+from loguru import logger
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from core.settings import settings
+
+T = TypeVar("T")
+
+# (content, reasoning, finish_reason)
+ParsedChunk = Tuple[str, Optional[str], Optional[str]]
+
+
+class FlushPolicy:
+    """When buffered stream text is written out."""
+
+    __slots__ = ("max_latency", "max_bytes", "sentence_endings")
+
+    def __init__(
+        self,
+        max_latency: float,
+        max_bytes: int,
+        sentence_endings: FrozenSet[str] = frozenset(".!?\n"),
+    ) -> None:
+        self.max_latency = max_latency
+        self.max_bytes = max_bytes
+        self.sentence_endings = sentence_endings
+
+    @classmethod
+    def from_settings(cls) -> "FlushPolicy":
+        return cls(
+            max_latency=settings.stream_flush_max_latency_ms / 1000.0,
+            max_bytes=settings.stream_flush_max_bytes,
+        )
+
+
+class StreamWriter:
+    """Coalesce stream deltas into frames according to a FlushPolicy."""
+
+    __slots__ = ("policy", "frames", "chars", "_parts", "_size",
+                 "_deadline", "_first")
+
+    def __init__(self, policy: FlushPolicy) -> None:
+        self.policy = policy
+        self.frames = 0
+        self.chars = 0
+        self._parts: List[str] = []
+        self._size = 0
+        self._deadline: Optional[float] = None
+        self._first = True
+
+    @property
+    def deadline(self) -> Optional[float]:
+        """Monotonic time at which buffered text must be flushed."""
+        return self._deadline
+
+    def __bool__(self) -> bool:
+        return bool(self._parts)
+
+    def add(self, text: str) -> Optional[str]:
+        """Buffer ``text``; return a frame payload if it should go out now."""
+        if not text:
+            return None
+        if not self._parts:
+            self._deadline = time.monotonic() + self.policy.max_latency
+        self._parts.append(text)
+        self._size += len(text) if text.isascii() else len(text.encode())
+
+        if (
+            self._first or
+            self._size >= self.policy.max_bytes or
+            text[-1] in self.policy.sentence_endings or
+            time.monotonic() >= self._deadline
+        ):
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[str]:
+        """Return and clear the buffered text (None if empty)."""
+        if not self._parts:
+            return None
+        text = "".join(self._parts)
+        self._parts.clear()
+        self._size = 0
+        self._deadline = None
+        self._first = False
+        self.frames += 1
+        self.chars += len(text)
+        return text
+
+
+class StreamAbandoned(Exception):
+    """The client disconnected while the stream was being generated."""
+
+
+async def _wait_for_disconnect(request: Request) -> bool:
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return True
+
+
+def watch_disconnect(request: Request) -> asyncio.Task:
+    """Task that completes when the client sends ``http.disconnect``.
+
+    Must be started after the request body was read (FastAPI does this
+    before calling the endpoint) and cancelled when the stream ends.
+    """
+    return asyncio.create_task(
+        _wait_for_disconnect(request), name="stream-disconnect-watch"
+    )
+
+
+async def close_upstream(stream: Any) -> None:
+    """Close an upstream LLM stream and the HTTP response behind it."""
+    if stream is None:
+        return
+    for target in (stream, getattr(stream, "completion_stream", None)):
+        closer = (
+            getattr(target, "aclose", None) or getattr(target, "close", None)
+        )
+        if closer is None:
+            continue
+        try:
+            result = closer()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as exc:
+            logger.debug(f"Closing upstream stream failed: {exc}")
+
+
+async def with_deadlines(
+    source: AsyncIterator[T],
+    deadline: Callable[[], Optional[float]],
+    disconnected: Optional[asyncio.Future] = None,
+) -> AsyncIterator[Optional[T]]:
+    """Yield items of ``source``; yield None when ``deadline()`` passes.
+
+    While nothing is buffered (``deadline()`` is None) and no disconnect
+    watcher is given, items are awaited directly; otherwise the pending
+    ``__anext__`` is awaited with a timeout and kept across timeouts, so
+    no item is lost. When ``disconnected`` completes first, the pending
+    read is cancelled (running the source's cleanup) and
+    ``StreamAbandoned`` is raised.
+    """
+    iterator = source.__aiter__()
+    pending: Optional[asyncio.Future] = None
+    try:
+        while True:
+            flush_at = deadline()
+            if flush_at is None and pending is None and disconnected is None:
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                yield item
+                continue
+
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = None
+            if flush_at is not None:
+                timeout = max(flush_at - time.monotonic(), 0.0)
+            waiters = {pending}
+            if disconnected is not None:
+                waiters.add(disconnected)
+            done, _ = await asyncio.wait(
+                waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            if pending not in done:
+                if disconnected is not None and disconnected in done:
+                    if disconnected.cancelled() or disconnected.exception():
+                        # Watcher failed; keep streaming without it
+                        disconnected = None
+                        continue
+                    pending.cancel()
+                    await asyncio.gather(pending, return_exceptions=True)
+                    pending = None
+                    raise StreamAbandoned()
+                yield None
+                continue
+
+            future, pending = pending, None
+            try:
+                item = future.result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
+def _parse_choices(chunk: Any) -> ParsedChunk:
+    """OpenAI-style objects (ModelResponseStream / ModelResponse)."""
+    choices = chunk.choices
+    if not choices:
+        return "", None, None
+    choice = choices[0]
+    delta = getattr(choice, "delta", None)
+    finish_reason = getattr(choice, "finish_reason", None)
+    if delta is None:
+        return "", None, finish_reason
+    content = getattr(delta, "content", None) or getattr(delta, "text", None)
+    reasoning = getattr(delta, "reasoning_content", None)
+    return content or "", reasoning or None, finish_reason
+
+
+def _parse_dict(chunk: Dict[str, Any]) -> ParsedChunk:
+    choices = chunk.get("choices")
+    if choices:
+        choice = choices[0]
+        delta = choice.get("delta", {}) or {}
+        content = delta.get("content", "") or delta.get("text", "")
+        return (
+            content or "",
+            delta.get("reasoning_content") or None,
+            choice.get("finish_reason"),
+        )
+    return chunk.get("content") or "", None, None
+
+
+def _parse_str(chunk: str) -> ParsedChunk:
+    return chunk, None, None
+
+
+def _parse_object(chunk: Any) -> ParsedChunk:
+    """Objects exposing content/text/reasoning_content directly."""
+    reasoning = getattr(chunk, "reasoning_content", None)
+    if reasoning:
+        return "", reasoning, None
+    content = getattr(chunk, "content", None)
+    if content is None:
+        content = getattr(chunk, "text", None)
+    return content or "", None, None
+
+
+_PARSERS: Dict[type, Callable[[Any], ParsedChunk]] = {
+    dict: _parse_dict,
+    str: _parse_str,
+}
+
+
+def parse_chunk(chunk: Any) -> ParsedChunk:
+    """Extract (content, reasoning, finish_reason) from a stream chunk."""
+    chunk_type = type(chunk)
+    parser = _PARSERS.get(chunk_type)
+    if parser is None:
+        if hasattr(chunk, "choices"):
+            parser = _parse_choices
+        elif isinstance(chunk, dict):
+            parser = _parse_dict
+        elif isinstance(chunk, str):
+            parser = _parse_str
+        else:
+            parser = _parse_object
+        _PARSERS[chunk_type] = parser
+    return parser(chunk)
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse that always closes its body iterator.
+
+    Starlette only finishes the iterator by exhausting it; when sending
+    fails or is cancelled before that (even before the first chunk),
+    ``aclose()`` is what runs its cleanup, e.g. releasing an admission
+    ticket (see ``services.admission.admitted``).
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            aclose = getattr(self.body_iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
@@ -0,0 +1,215 @@
+"""
+Background rolling summarization of long conversations.
+
+Once a stored conversation holds more turns than the recent window, the
+older turns are folded into a rolling summary on the ``fast`` model tier
+and removed from the stored history. Jobs run on an asyncio queue with a
+bounded number of outstanding jobs, after the reply has been sent, so
+summarization never sits on the request path.
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional, Set
+
+from loguru import logger
+
+from core.settings import settings
+from services.conversation_store import (
+    Conversation, ConversationStore, StoredMessage, conversation_store
+)
+from services import llm_metrics
+from services.llm_client import llm_client
+from services.llm_service import LLMService
+from services.model_router import model_router
+from services.usage_recorder import usage_recorder
+
+_SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and "
+    "an assistant. Merge the previous summary with the new turns into one "
+    "concise summary. Keep facts, decisions, names, numbers and open "
+    "questions; drop pleasantries. Write in the language of the "
+    "conversation. Reply with the summary only."
+)
+
+
+class ConversationSummarizer:
+    """Asyncio job queue that compacts stored conversations."""
+
+    def __init__(
+        self,
+        store: ConversationStore,
+        keep_recent: int,
+        min_batch: int,
+        max_pending: int,
+        workers: int,
+        max_tokens: int,
+    ) -> None:
+        self.store = store
+        self.keep_recent = keep_recent
+        self.min_batch = min_batch
+        self.max_pending = max_pending
+        self.workers = workers
+        self.max_tokens = max_tokens
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._pending: Set[str] = set()
+        self._counters = {"scheduled": 0, "dropped": 0, "completed": 0,
+                          "skipped": 0, "failed": 0}
+
+    def start(self) -> None:
+        """Start worker tasks on the running event loop."""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"summarizer-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        """Cancel workers; pending jobs are dropped (history is intact)."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._pending.clear()
+
+    def _to_compact(
+        self, conversation: Conversation
+    ) -> List[StoredMessage]:
+        """Turns that fall outside the recent window."""
+        turns = [m for m in conversation.messages if m.role != "system"]
+        return turns[:max(len(turns) - self.keep_recent, 0)]
+
+    def maybe_schedule(self, conversation: Optional[Conversation]) -> None:
+        """Queue a conversation for compaction if it has enough old turns.
+
+        Never blocks: when the queue is full the job is dropped and picked
+        up again after a later turn.
+        """
+        if conversation is None or self._queue is None:
+            return
+        if len(self._to_compact(conversation)) < self.min_batch:
+            return
+        if conversation.id in self._pending:
+            return
+        try:
+            self._queue.put_nowait(conversation.id)
+        except asyncio.QueueFull:
+            self._counters["dropped"] += 1
+            return
+        self._pending.add(conversation.id)
+        self._counters["scheduled"] += 1
+
+    async def _worker(self) -> None:
+        while True:
+            conversation_id = await self._queue.get()
+            try:
+                await self._summarize(conversation_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                self._counters["failed"] += 1
+                logger.warning(
+                    f"Summarizing conversation {conversation_id} failed: {exc}"
+                )
+            finally:
+                self._pending.discard(conversation_id)
+                self._queue.task_done()
+
+    async def _summarize(self, conversation_id: str) -> None:
+        conversation = await self.store.get(conversation_id)
+        if conversation is None:
+            self._counters["skipped"] += 1
+            return
+        old_turns = self._to_compact(conversation)
+        if len(old_turns) < self.min_batch:
+            self._counters["skipped"] += 1
+            return
+
+        transcript = "\n".join(
+            f"{m.role.upper()}: {m.content}" for m in old_turns
+        )
+        user_content = (
+            f"Previous summary:\n{conversation.summary or '(none)'}\n\n"
+            f"New turns:\n{transcript}"
+        )
+
+        import litellm
+
+        model = LLMService._get_model("fast")
+        alias = model.split("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            with model_router.begin(alias):
+                response = await litellm.acompletion(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": _SUMMARY_PROMPT},
+                        {"role": "user", "content": user_content},
+                    ],
+                    max_tokens=self.max_tokens,
+                    temperature=0,
+                    **llm_client.completion_kwargs(),
+                )
+        except Exception as exc:
+            llm_metrics.record_error(alias, exc)
+            raise
+        llm_metrics.observe_call(
+            alias, "complete", time.perf_counter() - started
+        )
+        llm_metrics.record_usage(alias, getattr(response, "usage", None))
+        usage_recorder.record(
+            "summarizer", alias, getattr(response, "usage", None),
+            workspace_id=conversation.workspace_id,
+            user_id=conversation.user_id,
+        )
+        summary = (response.choices[0].message.content or "").strip()
+        if not summary:
+            self._counters["skipped"] += 1
+            return
+
+        # Apply to the latest copy: turns may have been appended meanwhile.
+        # Only compact if the summarized turns are still the oldest ones.
+        summarized = [(m.role, m.content) for m in old_turns]
+
+        def apply(latest: Optional[Conversation]) -> Optional[Conversation]:
+            if latest is None:
+                return None
+            latest_turns = [m for m in latest.messages if m.role != "system"]
+            head = latest_turns[:len(old_turns)]
+            if [(m.role, m.content) for m in head] != summarized:
+                return None
+            compacted = {id(m) for m in head}
+            latest.messages = [
+                m for m in latest.messages if id(m) not in compacted
+            ]
+            latest.set_summary(summary)
+            return latest
+
+        if await self.store.update(conversation_id, apply) is None:
+            self._counters["skipped"] += 1
+            return
+        self._counters["completed"] += 1
+        logger.debug(
+            f"Compacted {len(old_turns)} turns of conversation "
+            f"{conversation_id} into a summary"
+        )
+
+    def stats(self) -> Dict[str, int]:
+        """Job counters and current queue depth."""
+        return {
+            **self._counters,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+
+conversation_summarizer = ConversationSummarizer(
+    conversation_store,
+    keep_recent=settings.summary_keep_recent_messages,
+    min_batch=settings.summary_min_batch,
+    max_pending=settings.summary_max_pending,
+    workers=settings.summary_workers,
+    max_tokens=settings.summary_max_tokens,
+)
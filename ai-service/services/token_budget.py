@@ -0,0 +1,179 @@
+"""
+Model-aware token budgeting for conversation history.
+
+Token counts use ``tiktoken`` encoders cached per model; context windows
+and output limits come from the model registry (``metadata`` of each
+model in ``litellm_config.yaml``). History is packed newest-first into
+``context_window - max_tokens - reserve`` in a single pass, always
+keeping the system messages and the question being asked.
+"""
+from functools import lru_cache
+from typing import Any, List, Optional, Sequence, Tuple
+
+import tiktoken
+from fastapi import HTTPException
+
+from core.settings import settings
+from services.model_registry import model_registry
+
+# Tokens added per message by the chat format (role, separators) and
+# once per request to prime the assistant reply
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+
+
+class ContextOverflow(HTTPException):
+    """The prompt cannot fit the model's context window."""
+
+    def __init__(self, detail: str) -> None:
+        super().__init__(status_code=400, detail=detail)
+
+
+def context_window(model: str) -> int:
+    """Context window (tokens) of a model alias."""
+    return (
+        model_registry.get(model).context_window
+        or settings.default_context_window
+    )
+
+
+def max_output_tokens(model: str) -> Optional[int]:
+    """Max output tokens of a model alias, if configured."""
+    return model_registry.get(model).max_output_tokens
+
+
+@lru_cache(maxsize=64)
+def _encoding(tokenizer: Optional[str], model: str) -> tiktoken.Encoding:
+    if tokenizer:
+        return tiktoken.get_encoding(tokenizer)
+    try:
+        return tiktoken.encoding_for_model(model.split("/")[-1])
+    except KeyError:
+        # Non-OpenAI models: o200k_base is a close enough approximation
+        return tiktoken.get_encoding("o200k_base")
+
+
+def get_encoding(model: str) -> tiktoken.Encoding:
+    """Return the (cached) tokenizer for a model alias."""
+    return _encoding(model_registry.get(model).tokenizer, model)
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Number of tokens in ``text`` for ``model``."""
+    return len(get_encoding(model).encode(text, disallowed_special=()))
+
+
+def message_tokens(content: str, model: str) -> int:
+    """Tokens a single chat message costs, including format overhead."""
+    return count_tokens(content, model) + MESSAGE_OVERHEAD_TOKENS
+
+
+def truncate_text(text: str, model: str, max_tokens: int) -> str:
+    """Cut ``text`` to at most ``max_tokens`` tokens (keeping the start)."""
+    encoding = get_encoding(model)
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max(max_tokens, 0)]) + "..."
+
+
+def prompt_budget(model: str, max_tokens: Optional[int]) -> int:
+    """Tokens available for the prompt once output and reserve are held."""
+    return (
+        context_window(model)
+        - (max_tokens or 0)
+        - settings.context_reserve_tokens
+        - REPLY_PRIMING_TOKENS
+    )
+
+
+def fit_messages(
+    messages: Sequence[Any],
+    model: str,
+    max_tokens: Optional[int],
+    counts: Optional[Sequence[int]] = None,
+    fixed_tokens: int = 0,
+) -> Tuple[List[Any], int]:
+    """
+    Keep the newest messages that fit the model's prompt budget.
+
+    System messages and the last user message (the question being
+    asked) are always kept; the latter is cut down if it does not fit
+    on its own. Remaining messages are taken newest-first until the
+    budget is exhausted.
+
+    Args:
+        messages: Messages with ``role`` and ``content`` attributes
+        model: Model alias (as in litellm_config.yaml)
+        max_tokens: Tokens reserved for the completion
+        counts: Precomputed ``message_tokens`` per message, if known
+        fixed_tokens: Tokens of messages added after fitting (e.g. the
+            default system prompt)
+
+    Returns:
+        Tuple of (kept messages in original order, prompt token count).
+        ``messages`` itself is returned when nothing was dropped or cut.
+
+    Raises:
+        ContextOverflow: System messages leave no room for the question
+    """
+    if counts is None:
+        counts = [message_tokens(m.content, model) for m in messages]
+
+    budget = prompt_budget(model, max_tokens)
+    used = fixed_tokens + sum(
+        c for m, c in zip(messages, counts) if m.role == "system"
+    )
+
+    # The question: the last user message (else the newest non-system one)
+    anchor = None
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i].role == "user":
+            anchor = i
+            break
+        if anchor is None and messages[i].role != "system":
+            anchor = i
+
+    truncated = None
+    if anchor is not None:
+        if used + counts[anchor] > budget:
+            room = budget - used - MESSAGE_OVERHEAD_TOKENS
+            if room <= 0:
+                raise ContextOverflow(
+                    f"Instructions leave no room for the prompt in the "
+                    f"context of {model} with max_tokens={max_tokens}"
+                )
+            truncated = messages[anchor].model_copy(update={
+                "content": truncate_text(messages[anchor].content, model, room)
+            })
+            used += room + MESSAGE_OVERHEAD_TOKENS
+        else:
+            used += counts[anchor]
+    elif used > budget:
+        raise ContextOverflow(
+            f"Instructions exceed the context of {model} "
+            f"with max_tokens={max_tokens}"
+        )
+
+    kept_from = len(messages)
+    dropped = truncated is not None
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i].role == "system" or i == anchor:
+            continue
+        if used + counts[i] > budget:
+            dropped = True
+            break
+        used += counts[i]
+        kept_from = i
+
+    prompt_tokens = used + REPLY_PRIMING_TOKENS
+    if not dropped:
+        return messages, prompt_tokens
+
+    kept = []
+    for i, m in enumerate(messages):
+        if i == anchor:
+            kept.append(truncated or m)
+        elif m.role == "system" or i >= kept_from:
+            kept.append(m)
+    return kept, prompt_tokens
@@ -0,0 +1,219 @@
+"""
+Asynchronous, batched token-usage accounting.
+
+Every upstream LLM call appends one record (route, workspace, user,
+model, token counts incl. cached prompt tokens, outcome) to an in-memory ring buffer; recording is
+a deque append, so requests never wait on the database. A background
+task writes the buffer to Postgres with ``COPY`` every ``flush_interval``
+seconds, or as soon as ``batch_size`` records are waiting.
+
+Backpressure: the buffer is bounded. While the database is slow or down
+the oldest records are dropped (and counted) instead of growing memory,
+and failed batches are put back for the next attempt as far as there is
+room. Whatever is buffered is flushed on shutdown.
+"""
+import asyncio
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from core.settings import settings
+from services import llm_metrics
+from utils.metrics import Counter, Gauge
+
+USAGE_RECORDS = Counter(
+    "usage_records_total",
+    "Token usage records by what happened to them",
+    ["result"],
+)
+USAGE_BUFFERED = Gauge(
+    "usage_records_buffered",
+    "Token usage records waiting to be written",
+)
+
+_COLUMNS = (
+    "created_at", "route", "workspace_id", "user_id", "model",
+    "prompt_tokens", "completion_tokens", "total_tokens", "cached_tokens",
+    "outcome",
+)
+_COPY_SQL = f"COPY llm_usage ({', '.join(_COLUMNS)}) FROM STDIN"
+
+UsageRow = Tuple[
+    datetime, str, Optional[str], Optional[str], str, int, int, int, int,
+    str
+]
+
+
+class UsageRecorder:
+    """Ring buffer of usage records with a batched Postgres writer."""
+
+    def __init__(
+        self,
+        database_url: Optional[str],
+        capacity: int,
+        batch_size: int,
+        flush_interval: float,
+    ) -> None:
+        self.database_url = database_url
+        self.enabled = bool(database_url)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: Deque[UsageRow] = deque(maxlen=capacity)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._conn: Any = None
+
+    def start(self) -> None:
+        """Start the writer task on the running event loop."""
+        if not self.enabled or self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(
+            self._run(), name="usage-recorder"
+        )
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Stop the writer and flush what is still buffered."""
+        if self._task is None:
+            return
+        # The writer drains the buffer once more, then exits
+        self._stopping.set()
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.error(
+                f"Usage flush on shutdown timed out, "
+                f"{len(self._buffer)} records lost"
+            )
+        self._task = None
+        await self._reset_connection()
+
+    def record(
+        self,
+        route: str,
+        model: str,
+        usage: Any = None,
+        workspace_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        prompt_tokens: Optional[int] = None,
+        completion_tokens: Optional[int] = None,
+        outcome: str = "completed",
+    ) -> None:
+        """Buffer the usage of one call (usage object or explicit counts)."""
+        if not self.enabled:
+            return
+        if usage is not None:
+            prompt_tokens = getattr(usage, "prompt_tokens", None) or prompt_tokens
+            completion_tokens = (
+                getattr(usage, "completion_tokens", None) or completion_tokens
+            )
+        prompt_tokens = int(prompt_tokens or 0)
+        completion_tokens = int(completion_tokens or 0)
+        cached = llm_metrics.cached_tokens(usage) if usage is not None else 0
+        if len(self._buffer) == self._buffer.maxlen:
+            # The oldest record falls out of the ring
+            USAGE_RECORDS.labels("dropped").inc()
+        self._buffer.append((
+            datetime.now(timezone.utc), route, workspace_id, user_id, model,
+            prompt_tokens, completion_tokens,
+            prompt_tokens + completion_tokens, cached, outcome,
+        ))
+        USAGE_RECORDS.labels("buffered").inc()
+        USAGE_BUFFERED.set(len(self._buffer))
+        if len(self._buffer) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            await self._wait(self._wakeup)
+            self._wakeup.clear()
+            try:
+                await self._drain()
+            except Exception as e:
+                logger.warning(
+                    f"Usage write failed, {len(self._buffer)} records "
+                    f"buffered: {e}"
+                )
+                await self._reset_connection()
+                # Back off instead of retrying on every full batch
+                await self._wait(self._stopping)
+        # Final flush, also when stop() arrived during a back-off
+        try:
+            await self._drain()
+        except Exception as e:
+            logger.error(
+                f"Usage flush on shutdown failed, "
+                f"{len(self._buffer)} records lost: {e}"
+            )
+
+    async def _wait(self, event: asyncio.Event) -> None:
+        """Wait for ``event`` at most one flush interval."""
+        try:
+            await asyncio.wait_for(event.wait(), self.flush_interval)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _drain(self) -> None:
+        """Write the buffer in batches until it is empty."""
+        while self._buffer:
+            batch: List[UsageRow] = [
+                self._buffer.popleft()
+                for _ in range(min(self.batch_size, len(self._buffer)))
+            ]
+            try:
+                await self._write(batch)
+            except BaseException:
+                self._requeue(batch)
+                raise
+            USAGE_RECORDS.labels("written").inc(len(batch))
+            USAGE_BUFFERED.set(len(self._buffer))
+
+    def _requeue(self, batch: List[UsageRow]) -> None:
+        """Put a failed batch back in front, as far as there is room."""
+        room = self._buffer.maxlen - len(self._buffer)
+        if room < len(batch):
+            USAGE_RECORDS.labels("dropped").inc(len(batch) - room)
+            batch = batch[len(batch) - room:] if room else []
+        self._buffer.extendleft(reversed(batch))
+        USAGE_BUFFERED.set(len(self._buffer))
+
+    async def _write(self, batch: List[UsageRow]) -> None:
+        import psycopg
+
+        if self._conn is None or self._conn.closed:
+            self._conn = await psycopg.AsyncConnection.connect(
+                self.database_url, autocommit=True
+            )
+        async with self._conn.cursor() as cursor:
+            async with cursor.copy(_COPY_SQL) as copy:
+                for row in batch:
+                    await copy.write_row(row)
+
+    async def _reset_connection(self) -> None:
+        if self._conn is not None:
+            try:
+                await self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "buffered": len(self._buffer),
+            "capacity": self._buffer.maxlen,
+            "records": USAGE_RECORDS.values(),
+        }
+
+
+usage_recorder = UsageRecorder(
+    database_url=settings.database_url,
+    capacity=settings.usage_buffer_size,
+    batch_size=settings.usage_batch_size,
+    flush_interval=settings.usage_flush_interval,
+)
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Importing the handlers pulls in LiteLLM: use its bundled cost map
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
+# Tests import the service modules the way app.py does (``services.x``)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
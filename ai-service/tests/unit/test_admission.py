@@ -0,0 +1,155 @@
+import asyncio
+
+import pytest
+
+from services.admission import (
+    AdmissionPool, AdmissionRejected, Ticket, admitted
+)
+
+
+def _pool(name, limit=1, key_limit=1, max_queue=1, max_wait=0.2):
+    return AdmissionPool(
+        name, enabled=True, limit=limit, key_limit=key_limit,
+        max_queue=max_queue, max_wait=max_wait, max_loop_lag=60.0,
+    )
+
+
+def test_grants_while_there_is_room():
+    async def main():
+        pool = _pool("test-grant", limit=2, key_limit=2)
+        first = await pool.acquire("m")
+        second = await pool.acquire("m")
+        assert pool.active == 2
+        first.release()
+        first.release()  # only once
+        assert pool.active == 1
+        second.release()
+        assert pool.stats()["active_by_key"] == {}
+
+    asyncio.run(main())
+
+
+def test_queued_call_gets_the_freed_slot():
+    async def main():
+        pool = _pool("test-queue")
+        held = await pool.acquire("m")
+        waiting = asyncio.ensure_future(pool.acquire("m"))
+        await asyncio.sleep(0)
+        assert pool.stats()["queued"] == 1
+        held.release()
+        ticket = await waiting
+        assert pool.active == 1 and pool.stats()["queued"] == 0
+        ticket.release()
+
+    asyncio.run(main())
+
+
+def test_key_limit_leaves_room_for_other_keys():
+    async def main():
+        pool = _pool("test-key", limit=2, key_limit=1)
+        held = await pool.acquire("a")
+        other = await asyncio.wait_for(pool.acquire("b"), 0.1)
+        assert pool.stats()["active_by_key"] == {"a": 1, "b": 1}
+        held.release()
+        other.release()
+
+    asyncio.run(main())
+
+
+def test_full_queue_rejects_with_429():
+    async def main():
+        pool = _pool("test-full")
+        held = await pool.acquire("m")
+        waiting = asyncio.ensure_future(pool.acquire("m"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as info:
+            await pool.acquire("m")
+        assert info.value.status_code == 429
+        assert info.value.headers["Retry-After"] == "1"
+        held.release()
+        (await waiting).release()
+
+    asyncio.run(main())
+
+
+def test_wait_timeout_rejects_with_503():
+    async def main():
+        pool = _pool("test-timeout", max_wait=0.05)
+        held = await pool.acquire("m")
+        with pytest.raises(AdmissionRejected) as info:
+            await pool.acquire("m")
+        assert info.value.status_code == 503
+        assert pool.stats()["queued"] == 0
+        held.release()
+        assert pool.active == 0
+
+    asyncio.run(main())
+
+
+def test_abandoned_waiter_leaves_the_queue():
+    async def main():
+        pool = _pool("test-abandon")
+        held = await pool.acquire("m")
+        waiting = asyncio.ensure_future(pool.acquire("m"))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert pool.stats()["queued"] == 0
+        held.release()
+        assert pool.active == 0
+
+    asyncio.run(main())
+
+
+def test_waiter_cancelled_after_grant_gives_the_slot_back():
+    async def main():
+        pool = _pool("test-abandon-granted")
+        held = await pool.acquire("m")
+        waiting = asyncio.ensure_future(pool.acquire("m"))
+        await asyncio.sleep(0)
+        # Granted, but cancelled before it could resume
+        held.release()
+        waiting.cancel()
+        (result,) = await asyncio.gather(waiting, return_exceptions=True)
+        if isinstance(result, Ticket):
+            # Before 3.12 wait_for returns the result despite the cancel
+            result.release()
+        assert pool.active == 0
+        assert pool.stats()["active_by_key"] == {}
+
+    asyncio.run(main())
+
+
+def test_admitted_releases_on_close_without_iterating():
+    async def main():
+        pool = _pool("test-admitted")
+        closed = []
+
+        async def frames():
+            yield b"never"
+
+        stream = admitted(
+            await pool.acquire("m"), frames(), lambda: closed.append(True)
+        )
+        await stream.aclose()
+        await stream.aclose()
+        assert pool.active == 0 and closed == [True]
+
+    asyncio.run(main())
+
+
+def test_admitted_releases_when_frames_fail():
+    async def main():
+        pool = _pool("test-admitted-error")
+
+        async def frames():
+            yield b"one"
+            raise RuntimeError("upstream")
+
+        stream = admitted(await pool.acquire("m"), frames())
+        assert await stream.__anext__() == b"one"
+        with pytest.raises(RuntimeError):
+            await stream.__anext__()
+        assert pool.active == 0
+
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from core.settings import settings
+from handler import chat as chat_module
+from handler.chat import ChatHandler, ChatMessage, ChatRequest
+from services import token_budget
+from services.model_registry import ModelCapabilities
+
+MODELS = {
+    "big": ModelCapabilities("big", metadata={"context_window": 1000}),
+    "small": ModelCapabilities("small", metadata={
+        "context_window": 60, "max_output_tokens": 10,
+    }),
+}
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    monkeypatch.setattr(
+        chat_module.model_registry, "get", lambda model: MODELS[model]
+    )
+    monkeypatch.setattr(settings, "context_reserve_tokens", 0)
+    # Every message costs 10 tokens
+    monkeypatch.setattr(
+        token_budget, "message_tokens", lambda content, model: 10
+    )
+    return ChatHandler.__new__(ChatHandler)
+
+
+def _payload(turns, max_tokens=None):
+    messages = [ChatMessage(role="system", content="be brief")] + [
+        ChatMessage(role="user" if i % 2 else "assistant", content=f"m{i}")
+        for i in range(1, turns + 1)
+    ]
+    return ChatRequest(
+        model="big", messages=messages, max_completion_tokens=max_tokens
+    )
+
+
+def test_fallback_payload_refits_history_and_output(handler):
+    payload = _payload(7, max_tokens=100)
+    fallback = handler._fallback_payload(payload, "small")
+    assert fallback.model == "small"
+    assert fallback.max_completion_tokens == 10
+    # 60 - 10 output - 3 priming: system + the 3 newest turns
+    assert [m.content for m in fallback.messages] == [
+        "be brief", "m5", "m6", "m7",
+    ]
+    # The primary payload is left alone
+    assert len(payload.messages) == 8 and payload.model == "big"
+
+
+def test_open_circuit_reroutes_with_a_refitted_payload(handler, monkeypatch):
+    async def check(model):
+        return 30.0 if model == "big" else None
+
+    monkeypatch.setattr(chat_module.circuit_breakers, "check", check)
+    monkeypatch.setattr(
+        chat_module.chat_hedger, "fallback_for", lambda model: "small"
+    )
+    payload = asyncio.run(handler._avoid_open_circuit(_payload(7)))
+    assert payload.model == "small" and len(payload.messages) == 5
+
+
+def test_open_circuit_without_room_in_the_fallback_is_503(
+    handler, monkeypatch
+):
+    async def check(model):
+        return 30.0 if model == "big" else None
+
+    monkeypatch.setattr(chat_module.circuit_breakers, "check", check)
+    monkeypatch.setattr(
+        chat_module.chat_hedger, "fallback_for", lambda model: "small"
+    )
+    monkeypatch.setitem(MODELS, "small", ModelCapabilities(
+        "small", metadata={"context_window": 15},
+    ))
+    with pytest.raises(chat_module.HTTPException) as info:
+        asyncio.run(handler._avoid_open_circuit(_payload(3)))
+    assert info.value.status_code == 503
+
+
+def test_hedge_payload_is_refitted(handler):
+    assert handler._hedge_payload(_payload(7), None) is None
+    hedge = handler._hedge_payload(_payload(7), ("small", 0.5))
+    assert hedge.model == "small" and len(hedge.messages) == 5
+
+
+def test_no_hedge_when_the_prompt_cannot_fit_the_fallback(
+    handler, monkeypatch
+):
+    monkeypatch.setitem(MODELS, "small", ModelCapabilities(
+        "small", metadata={"context_window": 15},
+    ))
+    assert handler._hedge_payload(_payload(3), ("small", 0.5)) is None
@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+from services.circuit_breaker import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreakers, CircuitOpenError,
+)
+
+
+class _ClientError(Exception):
+    status_code = 400
+
+
+def _breakers(cooldown=0.05):
+    return CircuitBreakers(
+        None, enabled=True, failure_threshold=2, cooldown=cooldown,
+        half_open_requests=1, shared=False, sync_interval=1.0,
+    )
+
+
+def _fail(breakers, model, exc=None):
+    with pytest.raises(Exception):
+        with breakers.acquire(model):
+            raise exc or RuntimeError("upstream")
+
+
+def _state(breakers, model):
+    return breakers.stats()["models"][model]["state"]
+
+
+def test_consecutive_failures_open_the_circuit():
+    breakers = _breakers()
+    _fail(breakers, "m")
+    assert _state(breakers, "m") == CLOSED
+    _fail(breakers, "m")
+    assert _state(breakers, "m") == OPEN
+    with pytest.raises(CircuitOpenError) as info:
+        breakers.acquire("m")
+    assert 0 < info.value.retry_after <= 0.05
+
+
+def test_success_resets_the_failure_count():
+    breakers = _breakers()
+    _fail(breakers, "m")
+    breakers.acquire("m").success()
+    _fail(breakers, "m")
+    assert _state(breakers, "m") == CLOSED
+
+
+def test_client_errors_do_not_count():
+    breakers = _breakers()
+    for _ in range(3):
+        _fail(breakers, "m", _ClientError())
+    assert _state(breakers, "m") == CLOSED
+
+
+def test_half_open_trial_success_closes():
+    breakers = _breakers()
+    _fail(breakers, "m")
+    _fail(breakers, "m")
+    time.sleep(0.06)
+    permit = breakers.acquire("m")
+    assert permit.trial and _state(breakers, "m") == HALF_OPEN
+    # Only half_open_requests trials at a time
+    with pytest.raises(CircuitOpenError):
+        breakers.acquire("m")
+    permit.success()
+    assert _state(breakers, "m") == CLOSED
+    assert not breakers.acquire("m").trial
+
+
+def test_half_open_trial_failure_reopens():
+    breakers = _breakers()
+    _fail(breakers, "m")
+    _fail(breakers, "m")
+    time.sleep(0.06)
+    _fail(breakers, "m")
+    assert _state(breakers, "m") == OPEN
+
+
+def test_released_trial_frees_its_slot():
+    breakers = _breakers()
+    _fail(breakers, "m")
+    _fail(breakers, "m")
+    time.sleep(0.06)
+    breakers.acquire("m").release()
+    assert breakers.acquire("m").trial
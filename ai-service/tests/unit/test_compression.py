@@ -0,0 +1,97 @@
+import asyncio
+import zlib
+
+import pytest
+
+from middleware import compression
+from middleware.compression import CompressionMiddleware, negotiate
+
+
+@pytest.fixture
+def gzip_only(monkeypatch):
+    monkeypatch.setattr(
+        compression, "CODECS", {"gzip": compression.CODECS["gzip"]}
+    )
+
+
+def test_negotiate_prefers_zstd_br_gzip_on_a_tie():
+    expected = next(iter(compression.CODECS))
+    assert negotiate("gzip, br, zstd") == expected
+    assert negotiate("gzip;q=1.0, br;q=0.5, zstd;q=0.5") == "gzip"
+
+
+def test_negotiate_honours_q_values_and_wildcards(gzip_only):
+    assert negotiate("") is None
+    assert negotiate("identity") is None
+    assert negotiate("gzip;q=0") is None
+    assert negotiate("gzip;q=bad") is None
+    assert negotiate("*;q=0.1") == "gzip"
+    assert negotiate("*, gzip;q=0") is None
+
+
+def _app(content_type, parts, length=None):
+    async def app(scope, receive, send):
+        headers = [(b"content-type", content_type.encode())]
+        if length is not None:
+            headers.append((b"content-length", str(length).encode()))
+        await send({
+            "type": "http.response.start", "status": 200,
+            "headers": headers,
+        })
+        for i, part in enumerate(parts):
+            await send({
+                "type": "http.response.body", "body": part,
+                "more_body": i < len(parts) - 1,
+            })
+    return app
+
+
+def _run(app, **options):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    middleware = CompressionMiddleware(app, **options)
+    scope = {"type": "http", "headers": [(b"accept-encoding", b"gzip")]}
+    asyncio.run(middleware(scope, None, send))
+    headers = dict(sent[0]["headers"])
+    return headers, [m["body"] for m in sent[1:]]
+
+
+def test_small_body_is_sent_as_is(gzip_only):
+    headers, bodies = _run(_app("application/json", [b"{}"], 2))
+    assert b"content-encoding" not in headers
+    assert bodies == [b"{}"]
+
+
+def test_large_body_is_compressed_in_one_shot(gzip_only):
+    body = b'{"a": "' + b"x" * 5000 + b'"}'
+    headers, bodies = _run(_app("application/json", [body], len(body)))
+    assert headers[b"content-encoding"] == b"gzip"
+    assert int(headers[b"content-length"]) == len(bodies[0])
+    assert zlib.decompress(bodies[0], 31) == body
+
+
+def test_sse_is_not_compressed_by_default(gzip_only):
+    frames = [b"event: content\ndata: {}\n\n", b""]
+    headers, bodies = _run(_app("text/event-stream", frames))
+    assert b"content-encoding" not in headers
+    assert bodies == frames
+
+
+@pytest.mark.parametrize("content_type, options", [
+    ("text/event-stream", {"stream_mode": "flush"}),
+    # Multi-part bodies of any other type
+    ("text/plain", {}),
+])
+def test_every_streamed_part_is_decodable_on_arrival(
+    gzip_only, content_type, options
+):
+    parts = [b"first ", b"second ", b"third", b""]
+    headers, bodies = _run(_app(content_type, parts), **options)
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+    decoder = zlib.decompressobj(31)
+    assert [decoder.decompress(body) for body in bodies] == parts
+    assert decoder.eof
@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+import redis
+
+from services import token_budget
+from services.conversation_store import ConversationStore
+
+
+class FakeRedis:
+    """GET/SETEX with WATCH/MULTI conflict detection, in memory."""
+
+    def __init__(self):
+        self.data = {}
+        self.versions = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.watched = {}
+        self.queued = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def watch(self, key):
+        self.watched[key] = self.client.versions.get(key, 0)
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def multi(self):
+        pass
+
+    def setex(self, key, ttl, value):
+        self.queued.append((key, ttl, value))
+
+    def execute(self):
+        for key, version in self.watched.items():
+            if self.client.versions.get(key, 0) != version:
+                raise redis.WatchError("watched key changed")
+        for key, ttl, value in self.queued:
+            self.client.setex(key, ttl, value)
+
+
+@pytest.fixture(autouse=True)
+def count_words(monkeypatch):
+    monkeypatch.setattr(
+        token_budget, "message_tokens",
+        lambda content, model: len(content.split()),
+    )
+
+
+def _store(client):
+    return ConversationStore(client, ttl=60, max_messages=10)
+
+
+def test_concurrent_turns_are_retried_on_the_newer_copy():
+    client = FakeRedis()
+    store = _store(client)
+    ours = store.create("m")
+    ours.append("user", "first")
+    asyncio.run(store.append_turns(ours))
+    ours.append("user", "mine")
+    # Another client's turn on the same conversation
+    theirs = store.create("m")
+    theirs.id = ours.id
+    theirs.append("user", "theirs")
+    calls = []
+
+    def change(current):
+        calls.append(current)
+        if len(calls) == 1:
+            # Another writer lands between our read and our write
+            asyncio.run(store.append_turns(theirs))
+        current.messages.append(ours.messages[-1])
+        return current
+
+    stored = asyncio.run(store.update(ours.id, change))
+    assert len(calls) == 2
+    assert [m.content for m in stored.messages] == [
+        "first", "theirs", "mine"
+    ]
+    assert asyncio.run(store.get(ours.id)) == stored
+
+
+def test_gives_up_after_max_attempts():
+    client = FakeRedis()
+    store = _store(client)
+    conversation = store.create("m")
+    conversation.append("user", "hello")
+    asyncio.run(store.append_turns(conversation))
+    calls = []
+
+    def change(current):
+        calls.append(current)
+        client.setex(
+            store.KEY_PREFIX + conversation.id, 60,
+            client.get(store.KEY_PREFIX + conversation.id),
+        )
+        return current
+
+    with pytest.raises(redis.WatchError):
+        asyncio.run(store.update(conversation.id, change))
+    assert len(calls) == store.MAX_ATTEMPTS
+
+
+def test_change_returning_none_writes_nothing():
+    client = FakeRedis()
+    store = _store(client)
+    assert asyncio.run(store.update("missing", lambda current: None)) is None
+    assert client.data == {}
@@ -0,0 +1,140 @@
+import asyncio
+import time
+
+from core.settings import settings
+from middleware.deadline import HEARTBEAT, DeadlineMiddleware
+from services.sse import DONE_EVENT, error_event
+from utils.deadline import remaining
+
+
+def _run(app, path="/", headers=(), **options):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    middleware = DeadlineMiddleware(app, **options)
+    scope = {
+        "type": "http", "method": "GET", "path": path,
+        "headers": list(headers),
+    }
+    asyncio.run(middleware(scope, None, send))
+    return sent
+
+
+async def _start(send, content_type=b"text/plain", length=None):
+    headers = [(b"content-type", content_type)]
+    if length is not None:
+        headers.append((b"content-length", b"%d" % length))
+    await send({
+        "type": "http.response.start", "status": 200, "headers": headers,
+    })
+
+
+def test_longest_prefix_budget_wins():
+    middleware = DeadlineMiddleware(
+        None, default_budget=30.0,
+        route_budgets={"/api": 10.0, "/api/v1/chat": 60.0},
+    )
+    assert middleware.budget("/api/v1/chat/stream") == 60.0
+    assert middleware.budget("/api/v1/rag") == 10.0
+    assert middleware.budget("/health") == 30.0
+
+
+def test_job_long_polls_fit_their_budget():
+    middleware = DeadlineMiddleware(
+        None, default_budget=1.0, route_budgets=settings.deadline_budgets
+    )
+    budget = middleware.budget("/api/v1/chat/jobs/abc")
+    assert budget > settings.chat_job_max_wait
+
+
+def test_handler_sees_the_deadline():
+    seen = []
+
+    async def app(scope, receive, send):
+        seen.append(remaining())
+        await _start(send, length=2)
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    sent = _run(app, default_budget=5.0)
+    assert 4.0 < seen[0] <= 5.0
+    assert sent[0]["status"] == 200
+
+
+def test_slow_handler_gets_504():
+    cancelled = []
+
+    async def app(scope, receive, send):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    sent = _run(app, default_budget=0.05)
+    assert cancelled == [True]
+    assert sent[0]["status"] == 504
+    assert sent[-1]["more_body"] is False
+
+
+def test_passed_client_deadline_is_answered_right_away():
+    called = []
+
+    async def app(scope, receive, send):
+        called.append(True)
+
+    past = b"%f" % (time.time() - 1)
+    sent = _run(
+        app, headers=[(b"x-request-deadline", past)], default_budget=5.0
+    )
+    assert called == []
+    assert sent[0]["status"] == 504
+
+
+def test_idle_sse_stream_ends_with_error_and_done():
+    async def app(scope, receive, send):
+        await _start(send, b"text/event-stream")
+        await send({
+            "type": "http.response.body", "body": b"event: content\n\n",
+            "more_body": True,
+        })
+        await asyncio.sleep(10)
+
+    sent = _run(app, default_budget=5.0, idle_timeout=0.05)
+    bodies = [m["body"] for m in sent[1:]]
+    assert bodies[-2:] == [error_event("Request timeout"), DONE_EVENT]
+    assert sent[-1]["more_body"] is False
+
+
+def test_idle_timeout_spares_other_streams():
+    async def app(scope, receive, send):
+        await _start(send, b"application/x-ndjson")
+        await asyncio.sleep(0.1)
+        await send({"type": "http.response.body", "body": b"{}\n"})
+
+    sent = _run(app, default_budget=5.0, idle_timeout=0.05)
+    assert [m["body"] for m in sent[1:]] == [b"{}\n"]
+
+
+def test_quiet_sse_stream_gets_heartbeats():
+    async def app(scope, receive, send):
+        await _start(send, b"text/event-stream")
+        await asyncio.sleep(0.12)
+        await send({"type": "http.response.body", "body": DONE_EVENT})
+
+    sent = _run(app, default_budget=5.0, heartbeat_interval=0.05)
+    bodies = [m["body"] for m in sent[1:]]
+    assert HEARTBEAT in bodies
+    assert bodies[-1] == DONE_EVENT
+
+
+def test_complete_response_is_not_cut_by_the_idle_timeout():
+    async def app(scope, receive, send):
+        await asyncio.sleep(0.1)
+        await _start(send, length=2)
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    sent = _run(app, default_budget=5.0, idle_timeout=0.05)
+    assert sent[0]["status"] == 200
+    assert sent[-1]["body"] == b"ok"
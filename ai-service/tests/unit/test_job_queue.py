@@ -0,0 +1,100 @@
+import time
+
+from services.job_queue import ChatJobQueue
+
+
+class FakeRedis:
+    """The list and hash calls the reaper makes, in memory."""
+
+    def __init__(self):
+        self.lists = {}
+        self.hashes = {}
+        self.expiring = set()
+
+    def lrange(self, key, start, stop):
+        return list(self.lists.get(key, []))
+
+    def lrem(self, key, count, value):
+        items = self.lists.get(key, [])
+        if value in items:
+            items.remove(value)
+            return 1
+        return 0
+
+    def rpush(self, key, value):
+        self.lists.setdefault(key, []).append(value)
+
+    def hmget(self, key, *fields):
+        job = self.hashes.get(key, {})
+        return [job.get(field) for field in fields]
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(
+            {field: str(value) for field, value in mapping.items()}
+        )
+
+    def expire(self, key, ttl):
+        self.expiring.add(key)
+
+
+def _queue(client, max_attempts=3):
+    return ChatJobQueue(
+        client, blocking_client=None, workers=1, lease=30.0,
+        result_ttl=60, max_attempts=max_attempts, poll_interval=1.0,
+    )
+
+
+def _job(client, job_id, **fields):
+    client.hashes[ChatJobQueue.JOB_PREFIX + job_id] = {
+        field: str(value) for field, value in fields.items()
+    }
+    client.lists.setdefault(ChatJobQueue.PROCESSING_KEY, []).append(job_id)
+
+
+def test_expired_leases_are_requeued_and_live_ones_kept():
+    client = FakeRedis()
+    now = time.time()
+    _job(client, "dead", status="running", lease_until=now - 1,
+         created_at=now - 100, attempts=0)
+    _job(client, "alive", status="running", lease_until=now + 20,
+         created_at=now - 100, attempts=0)
+    # Moved to processing but never marked running: one lease from creation
+    _job(client, "stuck", status="queued", created_at=now - 31, attempts=1)
+    _job(client, "fresh", status="queued", created_at=now, attempts=0)
+    queue = _queue(client)
+
+    queue._requeue_expired()
+
+    assert client.lists[ChatJobQueue.QUEUE_KEY] == ["dead", "stuck"]
+    assert client.lists[ChatJobQueue.PROCESSING_KEY] == ["alive", "fresh"]
+    dead = client.hashes[ChatJobQueue.JOB_PREFIX + "dead"]
+    assert (dead["status"], dead["attempts"]) == ("queued", "1")
+    stuck = client.hashes[ChatJobQueue.JOB_PREFIX + "stuck"]
+    assert stuck["attempts"] == "2"
+    assert queue._counters["requeued"] == 2
+
+
+def test_finished_and_missing_jobs_leave_the_processing_list():
+    client = FakeRedis()
+    _job(client, "done", status="succeeded", created_at=0, attempts=0)
+    client.lists[ChatJobQueue.PROCESSING_KEY].append("gone")
+
+    _queue(client)._requeue_expired()
+
+    assert client.lists[ChatJobQueue.PROCESSING_KEY] == []
+    assert ChatJobQueue.QUEUE_KEY not in client.lists
+
+
+def test_jobs_out_of_attempts_fail_instead_of_requeueing():
+    client = FakeRedis()
+    _job(client, "doomed", status="running", lease_until=time.time() - 1,
+         created_at=0, attempts=2)
+
+    _queue(client, max_attempts=3)._requeue_expired()
+
+    key = ChatJobQueue.JOB_PREFIX + "doomed"
+    assert client.hashes[key]["status"] == "failed"
+    assert client.hashes[key]["status_code"] == "500"
+    assert key in client.expiring
+    assert ChatJobQueue.QUEUE_KEY not in client.lists
+    assert client.lists[ChatJobQueue.PROCESSING_KEY] == []
@@ -0,0 +1,71 @@
+import os
+import textwrap
+
+from services.model_registry import ModelRegistry
+
+CONFIG = """
+model_list:
+  - model_name: fast
+    litellm_params: {model: openai/gpt-4o-mini}
+    metadata: {context_window: 128000, tiers: [cheap]}
+  - model_name: smart
+    litellm_params: {model: anthropic/claude}
+    metadata: {context_window: 200000, supports_system_role: false,
+               tiers: [cheap, quality]}
+router_settings:
+  fallbacks:
+    - fast: [smart]
+    - smart: [fast]
+"""
+
+
+def _write(path, text, mtime):
+    path.write_text(textwrap.dedent(text))
+    os.utime(path, (mtime, mtime))
+
+
+def test_capabilities_tiers_and_fallbacks_from_the_config(tmp_path):
+    path = tmp_path / "litellm_config.yaml"
+    _write(path, CONFIG, 1000)
+    registry = ModelRegistry(str(path), reload_interval=0.0)
+
+    fast = registry.get("fast")
+    assert (fast.context_window, fast.provider) == (128000, "OpenAI")
+    smart = registry.get("smart")
+    assert smart.transform_messages(
+        [{"role": "system", "content": "be brief"}]
+    )[0]["role"] == "user"
+    assert registry.tiers() == {"cheap": ["fast", "smart"],
+                                "quality": ["smart"]}
+    assert registry.fallbacks("fast") == ["smart"]
+    assert registry.fallbacks("unknown") == []
+    # Unknown aliases are inferred from the name
+    assert registry.get("o1-preview").supports_thinking
+    assert registry.version == 1
+
+
+def test_reloads_when_the_file_changes(tmp_path):
+    path = tmp_path / "litellm_config.yaml"
+    _write(path, CONFIG, 1000)
+    registry = ModelRegistry(str(path), reload_interval=1e-9)
+    assert registry.fallbacks("fast") == ["smart"]
+
+    _write(path, CONFIG.replace("fast: [smart]", "fast: []"), 2000)
+    assert registry.fallbacks("fast") == []
+    assert registry.version == 2
+    assert registry.get("fast").context_window == 128000
+
+    # Unchanged mtime: nothing is re-read
+    registry.fallbacks("fast")
+    assert registry.version == 2
+
+
+def test_keeps_the_models_when_the_config_breaks(tmp_path):
+    path = tmp_path / "litellm_config.yaml"
+    _write(path, CONFIG, 1000)
+    registry = ModelRegistry(str(path), reload_interval=1e-9)
+    assert registry.tiers()["quality"] == ["smart"]
+
+    _write(path, "model_list: [", 2000)
+    assert registry.tiers()["quality"] == ["smart"]
+    assert registry.version == 1
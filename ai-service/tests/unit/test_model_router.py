@@ -0,0 +1,75 @@
+import pytest
+
+from services import model_router as router_module
+from services.model_router import ModelRouter
+
+
+@pytest.fixture
+def router():
+    router = ModelRouter(
+        enabled=True, alpha=0.5, error_penalty=4.0, error_half_life=60.0,
+        prior_latency=1.0, sticky_slack=1.5,
+    )
+    router.tiers = lambda: {"default": ["a", "b"], "solo": ["a"]}
+    return router
+
+
+def test_single_candidate_or_unknown_tier(router):
+    assert router.choose("solo") == "a"
+    assert router.choose("missing") is None
+
+
+def test_p2c_avoids_the_busier_model(router):
+    calls = [router.begin("a") for _ in range(3)]
+    assert all(router.choose("default") == "b" for _ in range(20))
+    for call in calls:
+        call.end("cancelled", record_latency=False)
+    assert router.state()["models"]["a"]["in_flight"] == 0
+
+
+def test_p2c_avoids_the_slower_and_then_the_failing_model(router):
+    router._finish("a", "ok", 2.0)
+    router._finish("b", "ok", 5.0)
+    assert router.choose("default") == "a"
+    router._finish("a", "error", None)
+    router._finish("a", "error", None)
+    # 2.0 * (1 + 4 * 0.75) = 8.0 > 5.0
+    assert router.choose("default") == "b"
+
+
+def test_tier_models_keep_their_own_state_past_the_label_cap(
+    router, monkeypatch
+):
+    monkeypatch.setattr(router_module, "MAX_LABEL_SETS", 2)
+    router.begin("client-1").end()
+    router.begin("client-2").end()
+    router.begin("client-3").end()
+    assert "other" in router.state()["models"]
+    # A tier model still counts as itself, so p2c sees its load
+    calls = [router.begin("b") for _ in range(3)]
+    assert router.state()["models"]["b"]["in_flight"] == 3
+    assert all(router.choose("default") == "a" for _ in range(20))
+    for call in calls:
+        call.end()
+
+
+def test_affinity_sticks_to_one_model(router):
+    router._finish("a", "ok", 1.0)
+    router._finish("b", "ok", 1.0)
+    for key in ("w1", "w2", "w3", "w4"):
+        assert len({router.choose("default", key) for _ in range(20)}) == 1
+    spread = {router.choose("default", f"w{i}") for i in range(50)}
+    assert spread == {"a", "b"}
+
+
+def test_affinity_leaves_a_model_much_worse_than_the_best(router):
+    router._finish("a", "ok", 1.0)
+    router._finish("b", "ok", 1.0)
+    key = next(f"w{i}" for i in range(50)
+               if router.choose("default", f"w{i}") == "a")
+    # Within sticky_slack (1.5x): stays
+    router._finish("a", "ok", 1.8)
+    assert router.choose("default", key) == "a"
+    # Far past it: moves to the cheaper model
+    router._finish("a", "ok", 10.0)
+    assert router.choose("default", key) == "b"
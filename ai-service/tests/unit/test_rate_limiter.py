@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+from services.rate_limiter import RateLimited, RateLimiter
+
+
+def _limiter(enabled=True, rpm=0, tpm=0, output_estimate=100):
+    # Nothing listens there: the shared buckets fail open, so these tests
+    # exercise the in-process buckets only
+    client = redis.Redis(
+        port=1, socket_connect_timeout=0.05, retry=Retry(NoBackoff(), 0)
+    )
+    return RateLimiter(
+        client, enabled=enabled, workspace_rpm=rpm, workspace_tpm=tpm,
+        user_rpm=0, user_tpm=0, output_estimate=output_estimate,
+    )
+
+
+def test_estimate_uses_max_tokens_or_the_default():
+    limiter = _limiter(output_estimate=100)
+    assert limiter.estimate(10) == 110
+    assert limiter.estimate(10, 5) == 15
+
+
+def test_request_bucket_rejects_locally():
+    async def main():
+        limiter = _limiter(rpm=2)
+        await limiter.acquire("w", None, 0)
+        await limiter.acquire("w", None, 0)
+        with pytest.raises(RateLimited) as info:
+            await limiter.acquire("w", None, 0)
+        assert info.value.status_code == 429
+        assert int(info.value.headers["Retry-After"]) >= 1
+        # Other workspaces have their own buckets
+        await limiter.acquire("other", None, 0)
+
+    asyncio.run(main())
+
+
+def test_token_bucket_rejects_locally():
+    async def main():
+        limiter = _limiter(tpm=100)
+        await limiter.acquire("w", None, 80)
+        with pytest.raises(RateLimited):
+            await limiter.acquire("w", None, 80)
+
+    asyncio.run(main())
+
+
+def test_reconcile_refunds_the_unused_estimate_once():
+    async def main():
+        limiter = _limiter(tpm=100)
+        reservation = await limiter.acquire("w", None, 80)
+        await reservation.reconcile(10)
+        await reservation.reconcile(0)  # ignored
+        await limiter.acquire("w", None, 80)
+        with pytest.raises(RateLimited):
+            await limiter.acquire("w", None, 20)
+
+    asyncio.run(main())
+
+
+def test_reconcile_charges_usage_above_the_estimate():
+    async def main():
+        limiter = _limiter(tpm=100)
+        reservation = await limiter.acquire("w", None, 10)
+        await reservation.reconcile(95)
+        with pytest.raises(RateLimited):
+            await limiter.acquire("w", None, 10)
+
+    asyncio.run(main())
+
+
+def test_disabled_or_anonymous_calls_are_not_limited():
+    async def main():
+        disabled = _limiter(enabled=False, rpm=1)
+        for _ in range(3):
+            await disabled.acquire("w", None, 0)
+        anonymous = _limiter(rpm=1)
+        for _ in range(3):
+            reservation = await anonymous.acquire(None, None, 0)
+            assert reservation.buckets == []
+
+    asyncio.run(main())
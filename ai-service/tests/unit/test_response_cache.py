@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+from services.response_cache import CompletionCache, LRUBytesCache
+
+
+def _unreachable_redis():
+    return redis.Redis(
+        port=1, socket_connect_timeout=0.05, retry=Retry(NoBackoff(), 0)
+    )
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUBytesCache(max_entries=2, max_bytes=1000)
+    cache.set("a", b"1", 60)
+    cache.set("b", b"2", 60)
+    cache.get("a")
+    cache.set("c", b"3", 60)
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1" and cache.get("c") == b"3"
+    assert cache.evictions == 1
+
+
+def test_lru_bounds_encoded_bytes():
+    cache = LRUBytesCache(max_entries=10, max_bytes=10)
+    value = "ééé".encode("utf-8")  # 3 characters, 6 bytes
+    cache.set("a", value, 60)
+    cache.set("b", value, 60)
+    assert cache.get("a") is None
+    assert cache.total_bytes == 6
+    cache.set("big", b"x" * 11, 60)
+    assert cache.get("big") is None
+
+
+def test_lru_entries_expire():
+    cache = LRUBytesCache(max_entries=10, max_bytes=1000)
+    cache.set("a", b"1", 0.02)
+    assert cache.get("a") == b"1"
+    time.sleep(0.03)
+    assert cache.get("a") is None
+    assert len(cache) == 0 and cache.total_bytes == 0
+
+
+def test_completion_cache_serves_l1_until_it_expires():
+    async def main():
+        cache = CompletionCache(
+            _unreachable_redis(), max_entries=10, max_bytes=1000, ttl=60
+        )
+        key = CompletionCache.make_key({
+            "model": "m", "messages": [{"role": "user", "content": "hé"}],
+        })
+        await cache.set(key, {"reply": "hé"})
+        assert await cache.get(key) == ({"reply": "hé"}, "l1")
+        cache._local.set(key, b"{}", 0.01)
+        await asyncio.sleep(0.02)
+        # L2 is down here: an expired L1 entry is a miss
+        assert await cache.get(key) == (None, "miss")
+
+    asyncio.run(main())
+
+
+def test_keys_ignore_fields_the_completion_does_not_depend_on():
+    base = {"model": "m", "messages": [{"role": "user", "content": "q"}]}
+    extra = {**base, "metadata": {"workspace_id": "w"}, "temperature": 0}
+    assert CompletionCache.make_key(base) == CompletionCache.make_key(extra)
+    other = {**base, "temperature": 0.5}
+    assert CompletionCache.make_key(base) != CompletionCache.make_key(other)
@@ -0,0 +1,112 @@
+import asyncio
+import base64
+import json
+import time
+
+import numpy as np
+
+from services.semantic_cache import SemanticCache, context_key
+
+
+class FakeHashes:
+    """The Redis hash calls the cache makes, in memory."""
+
+    def __init__(self, hashes=None):
+        self.hashes = hashes or {}
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+
+    def pipeline(self):
+        return self
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    def expire(self, key, ttl):
+        pass
+
+    def execute(self):
+        pass
+
+
+def _cache(client=None, max_entries=4, threshold=0.9):
+    return SemanticCache(
+        client or FakeHashes(), enabled=True, threshold=threshold, ttl=60,
+        max_entries=max_entries, max_workspaces=4, embedding_model="e",
+    )
+
+
+def _unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+CTX = context_key("chat", "m")
+
+
+def test_hit_only_above_the_threshold_and_in_the_same_context():
+    async def main():
+        cache = _cache()
+        await cache.store("w", CTX, _unit(1, 0, 0), {"reply": "x"})
+        near = _unit(1, 0.2, 0)  # cosine ~0.98
+        far = _unit(1, 1, 0)  # cosine ~0.71
+        assert await cache.lookup("w", CTX, near) == {"reply": "x"}
+        assert await cache.lookup("w", CTX, far) is None
+        assert await cache.lookup("w", context_key("other"), near) is None
+        assert await cache.lookup("other", CTX, near) is None
+
+    asyncio.run(main())
+
+
+def test_full_partition_evicts_the_least_recently_used():
+    async def main():
+        cache = _cache(max_entries=2)
+        a, b, c = _unit(1, 0, 0), _unit(0, 1, 0), _unit(0, 0, 1)
+        await cache.store("w", CTX, a, {"reply": "a"})
+        await cache.store("w", CTX, b, {"reply": "b"})
+        await asyncio.sleep(0.01)
+        assert await cache.lookup("w", CTX, a) == {"reply": "a"}
+        await cache.store("w", CTX, c, {"reply": "c"})
+        assert await cache.lookup("w", CTX, b) is None
+        assert await cache.lookup("w", CTX, a) == {"reply": "a"}
+        assert await cache.lookup("w", CTX, c) == {"reply": "c"}
+
+    asyncio.run(main())
+
+
+def test_entries_are_restored_from_redis():
+    async def main():
+        client = FakeHashes()
+        await _cache(client).store("w", CTX, _unit(1, 0, 0), {"reply": "x"})
+        restored = _cache(client)
+        assert await restored.lookup("w", CTX, _unit(1, 0, 0)) == {
+            "reply": "x"
+        }
+
+    asyncio.run(main())
+
+
+def test_corrupt_records_are_dropped_as_misses():
+    async def main():
+        good = json.dumps({
+            "v": base64.b64encode(
+                _unit(1, 0, 0).astype(np.float16).tobytes()
+            ).decode("ascii"),
+            "ctx": str(CTX), "exp": time.time() + 60,
+            "value": {"reply": "x"},
+        })
+        key = SemanticCache.KEY_PREFIX + "w"
+        client = FakeHashes({key: {
+            "good": good, "truncated": good[:20], "partial": "{}",
+        }})
+        cache = _cache(client)
+        assert await cache.lookup("w", CTX, _unit(1, 0, 0)) == {"reply": "x"}
+        assert await cache.lookup("w", CTX, _unit(0, 1, 0)) is None
+        assert set(client.hashes[key]) == {"good"}
+
+    asyncio.run(main())
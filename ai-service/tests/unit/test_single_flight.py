@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from services.single_flight import SingleFlight
+
+
+def _flight():
+    return SingleFlight(None, lock_ttl=1.0, result_ttl=5, poll_interval=0.01)
+
+
+def test_concurrent_calls_share_one_execution():
+    async def main():
+        flight = _flight()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"n": len(calls)}
+
+        results = await asyncio.gather(*(flight.do("k", fn) for _ in range(5)))
+        assert calls == [1]
+        assert results == [{"n": 1}] * 5
+        assert flight.stats()["coalesced_local"] == 4
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(main())
+
+
+def test_finished_call_is_not_reused():
+    async def main():
+        flight = _flight()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            return {"n": len(calls)}
+
+        assert await flight.do("k", fn) == {"n": 1}
+        assert await flight.do("k", fn) == {"n": 2}
+
+    asyncio.run(main())
+
+
+def test_one_waiter_cancelling_keeps_the_call_for_the_others():
+    async def main():
+        flight = _flight()
+        release = asyncio.Event()
+
+        async def fn():
+            await release.wait()
+            return {"ok": True}
+
+        first = asyncio.ensure_future(flight.do("k", fn))
+        second = asyncio.ensure_future(flight.do("k", fn))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        release.set()
+        assert await second == {"ok": True}
+
+    asyncio.run(main())
+
+
+def test_last_waiter_cancelling_cancels_the_call():
+    async def main():
+        flight = _flight()
+        started = asyncio.Event()
+        cancelled = []
+
+        async def fn():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        waiter = asyncio.ensure_future(flight.do("k", fn))
+        await started.wait()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert cancelled == [True]
+        assert flight.stats()["cancelled"] == 1
+
+    asyncio.run(main())
+
+
+def test_errors_reach_every_waiter():
+    async def main():
+        flight = _flight()
+
+        async def fn():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream")
+
+        results = await asyncio.gather(
+            flight.do("k", fn), flight.do("k", fn), return_exceptions=True
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+        with pytest.raises(RuntimeError):
+            await flight.do("k", fn)
+
+    asyncio.run(main())
@@ -0,0 +1,26 @@
+from services.sse import (
+    DONE_EVENT, content_event, encode_event, error_event, with_id,
+)
+
+
+def test_json_payload_is_one_data_line():
+    frame = encode_event("content", {"text": "a\nb"})
+    assert frame == b'event: content\ndata: {"text":"a\\nb"}\n\n'
+
+
+def test_text_payload_gets_one_data_field_per_line():
+    assert encode_event("note", "a\nb") == b"event: note\ndata: a\ndata: b\n\n"
+    assert encode_event("note", b"") == b"event: note\ndata: \n\n"
+
+
+def test_event_id_comes_first():
+    assert encode_event("done", {}, event_id=7) == (
+        b"id: 7\nevent: done\ndata: {}\n\n"
+    )
+
+
+def test_prebuilt_events_match_the_generic_encoding():
+    assert content_event("hi") == encode_event("content", {"text": "hi"})
+    assert error_event("boom") == encode_event("error", {"detail": "boom"})
+    assert DONE_EVENT == b"event: done\ndata: {}\n\n"
+    assert with_id(3, DONE_EVENT) == encode_event("done", {}, event_id=3)
@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+from services.stream_writer import FlushPolicy, StreamWriter, with_deadlines
+
+
+def _writer(max_latency=10.0, max_bytes=16):
+    return StreamWriter(FlushPolicy(max_latency=max_latency,
+                                    max_bytes=max_bytes))
+
+
+def test_first_delta_goes_out_immediately_then_coalesces():
+    writer = _writer()
+    assert writer.add("Hi") == "Hi"
+    assert writer.add(" there") is None
+    assert writer.add(", how") is None
+    assert writer
+    assert writer.flush() == " there, how"
+    assert not writer and writer.deadline is None
+    assert (writer.frames, writer.chars) == (2, 13)
+
+
+def test_sentence_end_and_byte_limit_flush():
+    writer = _writer(max_bytes=8)
+    writer.add("a")
+    assert writer.add("Done.") == "Done."
+    assert writer.add("abc") is None
+    # Non-ASCII text is measured in encoded bytes
+    assert writer.add("éé") is None
+    assert writer.add("é") == "abcééé"
+    assert writer.add("") is None
+
+
+def test_deadline_is_set_by_the_first_buffered_delta():
+    writer = _writer(max_latency=0.01)
+    writer.add("x")
+    assert writer.deadline is None
+    writer.add("y")
+    deadline = writer.deadline
+    assert deadline is not None
+    writer.add("z")
+    assert writer.deadline == deadline
+    time.sleep(0.02)
+    assert writer.add("w") == "yzw"
+
+
+def test_buffered_text_is_flushed_when_upstream_is_slow():
+    async def source():
+        for delta in ("Hi", " there", " you"):
+            yield delta
+            await asyncio.sleep(0.05)
+
+    async def main():
+        writer = _writer(max_latency=0.01)
+        frames = []
+        async for delta in with_deadlines(source(), lambda: writer.deadline):
+            frame = writer.flush() if delta is None else writer.add(delta)
+            if frame:
+                frames.append(frame)
+        if writer:
+            frames.append(writer.flush())
+        return frames
+
+    assert asyncio.run(main()) == ["Hi", " there", " you"]
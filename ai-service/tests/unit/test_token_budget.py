@@ -0,0 +1,93 @@
+import pytest
+from pydantic import BaseModel
+
+from services import token_budget
+from services.token_budget import (
+    MESSAGE_OVERHEAD_TOKENS, REPLY_PRIMING_TOKENS, ContextOverflow,
+    fit_messages,
+)
+
+
+class Message(BaseModel):
+    role: str
+    content: str
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    """Set the prompt budget; truncation keeps ``max_tokens`` characters."""
+    def set_budget(tokens):
+        monkeypatch.setattr(
+            token_budget, "prompt_budget", lambda model, max_tokens: tokens
+        )
+    monkeypatch.setattr(
+        token_budget, "truncate_text",
+        lambda text, model, max_tokens: text[:max_tokens],
+    )
+    return set_budget
+
+
+def _messages(*roles):
+    return [
+        Message(role=role, content=f"{role}{i}")
+        for i, role in enumerate(roles)
+    ]
+
+
+def test_everything_fits(budget):
+    budget(100)
+    messages = _messages("system", "user", "assistant", "user")
+    kept, tokens = fit_messages(messages, "m", None, counts=[10, 10, 10, 10])
+    assert kept is messages
+    assert tokens == 40 + REPLY_PRIMING_TOKENS
+
+
+def test_drops_oldest_turns_first(budget):
+    budget(35)
+    messages = _messages("system", "user", "assistant", "user")
+    kept, tokens = fit_messages(messages, "m", None, counts=[10, 10, 10, 10])
+    assert [m.content for m in kept] == ["system0", "assistant2", "user3"]
+    assert tokens == 30 + REPLY_PRIMING_TOKENS
+
+
+def test_keeps_the_question_even_if_an_assistant_turn_follows(budget):
+    budget(25)
+    messages = _messages("system", "assistant", "user", "assistant")
+    kept, _ = fit_messages(messages, "m", None, counts=[10, 10, 10, 10])
+    assert [m.content for m in kept] == ["system0", "user2"]
+
+
+def test_fixed_tokens_take_room(budget):
+    budget(35)
+    messages = _messages("user", "assistant", "user")
+    kept, tokens = fit_messages(
+        messages, "m", None, counts=[10, 10, 10], fixed_tokens=10
+    )
+    assert [m.content for m in kept] == ["assistant1", "user2"]
+    assert tokens == 30 + REPLY_PRIMING_TOKENS
+
+
+def test_cuts_a_question_that_does_not_fit(budget):
+    budget(20 + MESSAGE_OVERHEAD_TOKENS)
+    messages = [
+        Message(role="system", content="s"),
+        Message(role="user", content="x" * 100),
+    ]
+    kept, tokens = fit_messages(messages, "m", None, counts=[10, 104])
+    assert kept[0] is messages[0]
+    assert kept[1].content == "x" * 10
+    assert tokens == 20 + MESSAGE_OVERHEAD_TOKENS + REPLY_PRIMING_TOKENS
+
+
+def test_no_room_for_the_question_raises(budget):
+    budget(12)
+    messages = _messages("system", "user")
+    with pytest.raises(ContextOverflow) as info:
+        fit_messages(messages, "m", None, counts=[10, 10])
+    assert info.value.status_code == 400
+
+
+def test_oversized_instructions_without_question_raise(budget):
+    budget(5)
+    with pytest.raises(ContextOverflow):
+        fit_messages(_messages("system"), "m", None, counts=[10])
@@ -0,0 +1,40 @@
+"""
+Deadline of the request being served.
+
+``DeadlineMiddleware`` sets it (``time.monotonic()`` based) for every
+HTTP request; code calling upstream services caps its timeouts with
+``remaining()`` so a call never outlives the request it serves. Tasks
+created while serving a request inherit it; work that must outlive the
+connection starts from ``detached_context()`` instead.
+"""
+import contextvars
+import time
+from typing import Optional
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "request_deadline", default=None
+)
+
+
+def set_deadline(deadline: Optional[float]) -> contextvars.Token:
+    """Set the current deadline; returns the token to reset it."""
+    return _deadline.set(deadline)
+
+
+def reset_deadline(token: contextvars.Token) -> None:
+    _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left until the deadline (None if there is none)."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0.0)
+
+
+def detached_context() -> contextvars.Context:
+    """Copy of the current context without a deadline."""
+    context = contextvars.copy_context()
+    context.run(_deadline.set, None)
+    return context
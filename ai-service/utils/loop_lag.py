@@ -0,0 +1,55 @@
+"""
+Event loop lag monitor.
+
+A background task sleeps for a fixed interval and measures how late it
+wakes up. The overshoot is time the loop spent running other callbacks
+(blocking code, CPU-heavy work) and directly delays every request.
+"""
+import asyncio
+import time
+from typing import Optional
+
+from core.settings import settings
+from utils.metrics import Gauge, Histogram
+
+LOOP_LAG_SECONDS = Gauge(
+    "event_loop_lag_seconds", "Most recent event loop lag sample"
+)
+LOOP_LAG_HISTOGRAM = Histogram(
+    "event_loop_lag_distribution_seconds",
+    "Distribution of event loop lag samples",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+
+class EventLoopLagMonitor:
+    """Samples event loop lag on the running loop."""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(
+                self._run(), name="event-loop-lag-monitor"
+            )
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.lag = max(time.monotonic() - started - self.interval, 0.0)
+            LOOP_LAG_SECONDS.set(self.lag)
+            LOOP_LAG_HISTOGRAM.observe(self.lag)
+
+
+loop_lag_monitor = EventLoopLagMonitor(settings.loop_lag_interval)
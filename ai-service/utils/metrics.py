@@ -0,0 +1,303 @@
+"""
+Minimal in-process metrics with Prometheus text exposition.
+
+Counters, gauges and histograms are plain Python objects updated from the
+event loop without locks (single-threaded asyncio; a lost increment from a
+worker thread is acceptable for metrics). Label values per metric are
+capped so unbounded inputs (e.g. client-supplied model names) cannot
+explode the series count; extra values are folded into ``"other"``.
+"""
+import math
+from bisect import bisect_left
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+MAX_LABEL_SETS = 200
+
+
+class Registry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self) -> None:
+        self._metrics: List["_Metric"] = []
+
+    def register(self, metric: "_Metric") -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.samples())
+        lines.append("")
+        return "\n".join(lines)
+
+
+REGISTRY = Registry()
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{n}="{_escape(v)}"' for n, v in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    )
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Optional[Registry] = REGISTRY,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if registry is not None:
+            registry.register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Child series for these label values (created on first use)."""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(self._children) >= MAX_LABEL_SETS:
+                key = ("other",) * len(self.labelnames)
+                child = self._children.get(key)
+            if child is None:
+                child = self._new_child()
+                self._children[key] = child
+        return child
+
+    def items(self) -> Iterable[Tuple[Tuple[str, ...], object]]:
+        return list(self._children.items())
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class Counter(_Metric):
+    """Monotonically increasing value."""
+
+    type_name = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def values(self) -> Dict[str, float]:
+        """Current value per label set (for JSON stats)."""
+        return {
+            ",".join(key) or "all": child.value for key, child in self.items()
+        }
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} "
+            f"{_format_value(child.value)}"
+            for key, child in self.items()
+        ]
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Gauge(Counter):
+    """Value that can go up and down."""
+
+    type_name = "gauge"
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile by linear interpolation within buckets."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, bucket_count in zip(self.bounds, self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                return lower + (bound - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+            lower = bound
+        return self.bounds[-1]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in fixed buckets."""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        registry: Optional[Registry] = REGISTRY,
+    ) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def summary(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """p50/p90/p99 estimates per label set (for JSON stats)."""
+        result = {}
+        for key, child in self.items():
+            result[",".join(key) or "all"] = {
+                "count": child.count,
+                "p50": _round(child.quantile(0.5)),
+                "p90": _round(child.quantile(0.9)),
+                "p99": _round(child.quantile(0.99)),
+            }
+        return result
+
+    def samples(self) -> List[str]:
+        lines = []
+        names = self.labelnames + ("le",)
+        for key, child in self.items():
+            cumulative = 0
+            for bound, bucket_count in zip(
+                self.buckets + (math.inf,), child.counts
+            ):
+                cumulative += bucket_count
+                labels = _format_labels(names, key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 4) if value is not None else None
+
+
+def percentiles(
+    values: List[float], qs: Sequence[float] = (0.5, 0.9, 0.99)
+) -> Dict[str, Optional[float]]:
+    """Exact percentiles of a small sample (nearest-rank)."""
+    if not values:
+        return {f"p{int(q * 100)}": None for q in qs}
+    ordered = sorted(values)
+    last = len(ordered) - 1
+    return {
+        f"p{int(q * 100)}": round(ordered[min(int(q * len(ordered)), last)], 4)
+        for q in qs
+    }
+
+
+class RollingWindow:
+    """The last ``size`` observations, for quantiles over recent traffic."""
+
+    __slots__ = ("_values", "_sorted")
+
+    def __init__(self, size: int = 200) -> None:
+        self._values: deque = deque(maxlen=size)
+        self._sorted: Optional[List[float]] = None
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def observe(self, value: float) -> None:
+        self._values.append(value)
+        self._sorted = None
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Nearest-rank quantile (sorted lazily, once per change)."""
+        if not self._values:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self._values)
+        ordered = self._sorted
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class RollingWindows:
+    """RollingWindow per key, with the same key cap as metric labels."""
+
+    def __init__(self, size: int = 200) -> None:
+        self.size = size
+        self._windows: Dict[str, RollingWindow] = {}
+
+    def get(self, key: str) -> RollingWindow:
+        window = self._windows.get(key)
+        if window is None:
+            if len(self._windows) >= MAX_LABEL_SETS:
+                key = "other"
+                window = self._windows.get(key)
+            if window is None:
+                window = self._windows[key] = RollingWindow(self.size)
+        return window
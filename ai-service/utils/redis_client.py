@@ -0,0 +1,43 @@
+from functools import lru_cache
+
+import redis
+import redis.asyncio
+
+from core.settings import settings
+
+
+@lru_cache(maxsize=1)
+def get_redis_client() -> redis.Redis:
+    """Return the process-wide Redis client (shared connection pool)."""
+    return redis.Redis(
+        host=settings.redis_host,
+        port=settings.redis_port,
+        decode_responses=True,
+        socket_timeout=2.0
+    )
+
+
+@lru_cache(maxsize=1)
+def get_redis_binary_client() -> redis.Redis:
+    """Return a Redis client that keeps values as raw bytes."""
+    return redis.Redis(
+        host=settings.redis_host,
+        port=settings.redis_port,
+        decode_responses=False,
+        socket_timeout=2.0
+    )
+
+
+@lru_cache(maxsize=1)
+def get_async_redis_client() -> redis.asyncio.Redis:
+    """Return an asyncio Redis client, for blocking commands (BLMOVE).
+
+    Blocking commands on the sync client would each hold a default
+    executor thread for their whole timeout.
+    """
+    return redis.asyncio.Redis(
+        host=settings.redis_host,
+        port=settings.redis_port,
+        decode_responses=True,
+        socket_timeout=5.0
+    )